@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark for render output parsing.
+
+Replays render logs through `BlenderRenderThread.parse_line()` and `Terragen3RenderThread.parse_line()`
+and reports lines parsed per second, along with how many times observers were notified of an update.
+Every line a render node prints goes through `parse_line()` on the server, and Eevee prints a progress
+line for every sample, so a busy farm can send the server hundreds of thousands of lines per minute.
+
+By default, logs are generated in the format of Blender 2.93 (Cycles and Eevee) and Terragen 3.  Recorded
+logs can be replayed instead with --log, e.g. `--log cycles:/tmp/render.log`.
+
+Run from the `python` directory:  python -m benchmark.bench_parser
+"""
+
+import argparse
+import re
+import sys
+import time
+from typing import Dict, List, Sequence, Tuple
+from unittest import mock
+
+from rendercontroller.renderthread import RenderThread, BlenderRenderThread, Terragen3RenderThread
+from rendercontroller.constants import RENDERING
+
+ENGINES = {
+    "cycles": BlenderRenderThread,
+    "eevee": BlenderRenderThread,
+    "terragen": Terragen3RenderThread,
+}
+
+
+def cycles_log(frames: int, tiles: int = 240) -> List[bytes]:
+    lines = [b"4321\n", b"Blender 2.93.7 (hash 5a2a7e6c1c2b built 2021-12-14 08:23:19)\n"]
+    lines.append(b"Read blend: /mnt/share/project/scene.blend\n")
+    for frame in range(1, frames + 1):
+        prefix = f"Fra:{frame} Mem:120.30M (Peak 130.10M) | Time:00:01.50 | Remaining:00:12.34 | "
+        prefix += "Mem:85.20M, Peak:85.20M | Scene, View Layer | "
+        for obj in ("Cube", "Plane", "Camera", "Light"):
+            lines.append(f"{prefix}Synchronizing object | {obj}\n".encode())
+        lines.append(f"{prefix}Loading render kernels (may take a few minutes the first time)\n".encode())
+        for tile in range(1, tiles + 1):
+            lines.append(f"{prefix}Rendered {tile}/{tiles} Tiles\n".encode())
+        lines.append(f"{prefix}Finished\n".encode())
+        lines.append(f"Saved: '/mnt/share/project/render/{frame:04d}.png'\n".encode())
+        lines.append(b" Time: 00:14.56 (Saving: 00:00.21)\n")
+        lines.append(b"\n")
+    return lines
+
+
+def eevee_log(frames: int, samples: int = 1024) -> List[bytes]:
+    lines = [b"4321\n", b"Blender 2.93.7 (hash 5a2a7e6c1c2b built 2021-12-14 08:23:19)\n"]
+    for frame in range(1, frames + 1):
+        prefix = f"Fra:{frame} Mem:230.12M (Peak 231.88M) | Time:00:00.45 | "
+        lines.append(f"{prefix}Syncing Cube\n".encode())
+        for sample in range(1, samples + 1):
+            lines.append(f"{prefix}Rendering {sample} / {samples} samples\n".encode())
+        lines.append(f"Saved: '/mnt/share/project/render/{frame:04d}.png'\n".encode())
+        lines.append(b" Time: 00:03.02 (Saving: 00:00.03)\n")
+        lines.append(b"\n")
+    return lines
+
+
+def terragen_log(steps: int = 1000) -> List[bytes]:
+    lines = [b"1\n", b"4321\n", b"Starting render of frame 1\n"]
+    for name in ("pre pass", "main pass"):
+        for step in range(steps + 1):
+            lines.append(f"Rendering {name}... {step * 100 / steps:.1f}%\n".encode())
+    lines.append(b"Finished\n")
+    return lines
+
+
+def frame_range(engine: str, lines: Sequence[bytes]) -> Tuple[int, int]:
+    """Returns the first and last frame in a log."""
+    if engine == "terragen":
+        return 1, 1
+    frames = [int(m.group(1)) for m in map(re.compile(rb"^Fra:([0-9]+)").match, lines) if m]
+    if not frames:
+        return 1, 1
+    return min(frames), max(frames)
+
+
+def replay(engine: str, lines: Sequence[bytes], number: int) -> Dict[str, float]:
+    """Parses every line in the log `number` times. Returns lines per second and updates per replay."""
+    first, last = frame_range(engine, lines)
+    conf = mock.MagicMock(name="Config", macs=[])
+    updates = 0
+
+    def on_update():
+        nonlocal updates
+        updates += 1
+
+    elapsed = 0.0
+    for _ in range(number):
+        thread: RenderThread = ENGINES[engine](
+            config=conf,
+            job_id="bench",
+            node="node1",
+            path="/mnt/share/project/scene",
+            frame=first,
+            end_frame=last,
+            on_update=on_update,
+        )
+        thread.status = RENDERING
+        parse_line = thread.parse_line
+        start = time.perf_counter()
+        for line in lines:
+            parse_line(line)
+        elapsed += time.perf_counter() - start
+    return {
+        "lines": len(lines),
+        "lines/s": len(lines) * number / elapsed,
+        "updates": updates / number,
+    }
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(__doc__)
+    parser.add_argument(
+        "-f", "--frames", help="Frames in each generated Blender log. Default: 10", type=int, default=10
+    )
+    parser.add_argument(
+        "-n", "--number", help="Times to replay each log. Default: 5", type=int, default=5
+    )
+    parser.add_argument(
+        "--log",
+        help="Replay a recorded log, given as ENGINE:PATH, where ENGINE is cycles, eevee or terragen. "
+        + "May be given more than once.",
+        action="append",
+        default=[],
+    )
+    args = parser.parse_args(argv)
+    if args.log:
+        logs = {}
+        for spec in args.log:
+            engine, _, path = spec.partition(":")
+            if engine not in ENGINES or not path:
+                parser.error(f"Invalid log '{spec}'")
+            with open(path, "rb") as f:
+                logs[f"{engine} ({path})"] = (engine, f.readlines())
+    else:
+        logs = {
+            "cycles": ("cycles", cycles_log(args.frames)),
+            "eevee": ("eevee", eevee_log(args.frames)),
+            "terragen": ("terragen", terragen_log()),
+        }
+    print(f"{'log':<30}{'lines':>10}{'lines/s':>14}{'updates':>10}")
+    for name, (engine, lines) in logs.items():
+        r = replay(engine, lines, args.number)
+        print(f"{name:<30}{r['lines']:>10}{r['lines/s']:>14,.0f}{r['updates']:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
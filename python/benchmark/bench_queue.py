@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for RenderQueue.
+
+Times the operations the server performs most often (iteration, lookup by position and ID,
+position lookup, status queries) along with reordering, for increasing queue lengths. Per-operation cost
+should stay roughly flat as the queue grows, except for moving a job a long distance, which
+scales with the number of jobs it passes.
+
+Run from the `python` directory:  python -m benchmark.bench_queue
+"""
+
+import argparse
+import sys
+import timeit
+from typing import Sequence
+from unittest import mock
+
+from rendercontroller.controller import RenderQueue
+from rendercontroller.constants import WAITING, FINISHED
+
+
+def make_queue(size: int) -> RenderQueue:
+    q = RenderQueue()
+    for i in range(size):
+        job = mock.NonCallableMock(name="RenderJob")
+        job.id = f"job{i:06d}"
+        job.status = FINISHED if i < size * 0.9 else WAITING
+        job.priority = 0
+        q.append(job)
+    return q
+
+
+def bench(size: int, number: int) -> dict:
+    q = make_queue(size)
+    mid = q.keys()[size // 2]
+    last = q.keys()[-1]
+    results = {}
+
+    def iterate():
+        for _ in q:
+            pass
+
+    def move_adjacent():
+        # Typical UI reorder: bump a job up by one slot, then back.
+        pos = q.get_position(mid)
+        q.move(mid, pos - 1)
+        q.move(mid, pos)
+
+    def move_far():
+        # Worst case: move the last job to the front and back again.
+        q.move(last, 0)
+        q.move(last, size - 1)
+
+    def reprioritize():
+        # Toggle priority of a waiting job and select the next job.
+        job = q.get_by_id(last)
+        job.priority = 1 - job.priority
+        q.priority_changed(job)
+        q.get_next_waiting()
+
+    results["iterate (per job)"] = timeit.timeit(iterate, number=number) / number / size
+    results["getitem"] = timeit.timeit(lambda: q[size // 2], number=number) / number
+    results["get_by_id"] = timeit.timeit(lambda: q.get_by_id(mid), number=number) / number
+    results["get_position"] = timeit.timeit(lambda: q.get_position(last), number=number) / number
+    results["get_next_waiting"] = timeit.timeit(q.get_next_waiting, number=number) / number
+    results["set priority + next"] = timeit.timeit(reprioritize, number=number) / number
+    results["count_status"] = timeit.timeit(lambda: q.count_status(WAITING), number=number) / number
+    results["move (adjacent)"] = timeit.timeit(move_adjacent, number=number) / number / 2
+    results["move (end to front)"] = timeit.timeit(move_far, number=number) / number / 2
+    return results
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(__doc__)
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        help="Comma-separated queue lengths to test. Default: 100,1000,10000",
+        default="100,1000,10000",
+    )
+    parser.add_argument(
+        "-n", "--number", help="Iterations per measurement.", type=int, default=200
+    )
+    args = parser.parse_args(argv)
+    sizes = [int(i) for i in args.sizes.split(",")]
+    rows = {size: bench(size, args.number) for size in sizes}
+    ops = list(rows[sizes[0]].keys())
+    print(f"{'operation':<22}" + "".join(f"{f'n={s}':>14}" for s in sizes))
+    for op in ops:
+        print(f"{op:<22}" + "".join(f"{rows[s][op] * 1e6:>12.3f}us" for s in sizes))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,494 @@
+"""Agent that runs on render nodes, and the client the server uses to talk to it.
+
+Instead of starting every render by SSH and scraping its output on the server, each render node can run an
+agent (`rcontroller-agent`) that starts and kills render processes locally and reports their progress.
+The server keeps one TCP connection open to each node's agent, and any number of renders can run over it at
+the same time.
+
+Protocol: UTF-8 encoded JSON objects, one per line, in both directions.  Requests from the server:
+
+    {"op": "render", "id": <str>, "engine": "blender"|"terragen", "path": <str>, "frames": [<first>, <last>]}
+    {"op": "kill", "id": <str>}
+    {"op": "ping"}
+
+Events from the agent. All but `pong` carry the ID of the render they belong to:
+
+    {"id": <str>, "event": "started", "pid": <int>}
+    {"id": <str>, "event": "progress", "frame": <int>, "progress": <float>}
+    {"id": <str>, "event": "saved", "frame": <int>}
+    {"id": <str>, "event": "exit", "code": <int>}
+    {"id": <str>, "event": "error", "message": <str>}  # Render could not be started. No exit event follows.
+    {"event": "pong"}
+
+If the connection is closed, the agent kills any renders that were started over it.
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from uuid import uuid4
+
+from rendercontroller.constants import BLENDER, TERRAGEN, RENDERING, FAILED
+from rendercontroller.renderthread import (
+    RenderThread,
+    BlenderRenderThread,
+    Terragen3RenderThread,
+    KILL_GRACE,
+)
+
+logger = logging.getLogger("agent")
+
+DEFAULT_PORT = 2021
+
+
+class OutputParser(object):
+    """Turns lines of render engine output into progress events.
+
+    Progress events are only sent when the whole-number percentage changes, because render engines may
+    report progress thousands of times per frame.
+    """
+
+    def __init__(self, frames: Sequence[int]):
+        # Frame number reported by the most recent progress line.
+        self.frame = frames[0]
+        # Whole-number percentage in the last progress event.
+        self.percent: Optional[int] = None
+
+    def progress(self, progress: float) -> List[Dict[str, Any]]:
+        if int(progress) == self.percent:
+            return []
+        self.percent = int(progress)
+        return [{"event": "progress", "frame": self.frame, "progress": progress}]
+
+    def saved(self) -> List[Dict[str, Any]]:
+        self.percent = None
+        return [{"event": "saved", "frame": self.frame}]
+
+    def parse(self, line: bytes) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class BlenderOutputParser(OutputParser):
+    """Turns lines of Blender output into progress events."""
+
+    def parse(self, line: bytes) -> List[Dict[str, Any]]:
+        if line.startswith(b"Fra:"):
+            frame, progress = BlenderRenderThread.parse_progress(line)
+            if frame is not None and frame != self.frame:
+                self.frame = frame
+                self.percent = None
+            if progress is None:
+                return []
+            return self.progress(progress)
+        if line.startswith(b"Saved:"):
+            return self.saved()
+        return []
+
+
+class TerragenOutputParser(OutputParser):
+    """Turns lines of Terragen output into progress events."""
+
+    def parse(self, line: bytes) -> List[Dict[str, Any]]:
+        if line.startswith(b"Rendering"):
+            progress = Terragen3RenderThread.parse_progress(line)
+            if progress is None:
+                return []
+            return self.progress(progress)
+        if line.startswith(b"Finished"):
+            return self.saved()
+        return []
+
+
+PARSERS = {BLENDER: BlenderOutputParser, TERRAGEN: TerragenOutputParser}
+
+
+class AgentServer(socketserver.ThreadingTCPServer):
+    """Listens for connections from the render server.
+
+    :param dict executables: Path to the executable for each render engine.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, executables: Dict[str, str]):
+        self.executables = executables
+        super().__init__(server_address, AgentHandler)
+
+    def command(self, engine: str, path: str, first: int, last: int) -> List[str]:
+        """Returns the command to render frames `first` through `last` of a project."""
+        if engine not in self.executables:
+            raise ValueError(f"No executable configured for {engine}.")
+        exe = self.executables[engine]
+        if engine == BLENDER:
+            if first == last:
+                return [exe, "-b", "-noaudio", path, "-f", str(first)]
+            # Blender processes args in order, so range must be set before -a.
+            return [exe, "-b", "-noaudio", path, "-s", str(first), "-e", str(last), "-a"]
+        if first != last:
+            raise ValueError("Terragen cannot render more than one frame per process.")
+        return [exe, "-p", path, "-hide", "-exit", "-r", "-f", str(first)]
+
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    """Handles one connection from the render server, which may run any number of renders."""
+
+    server: AgentServer
+
+    def setup(self) -> None:
+        super().setup()
+        self._lock = threading.Lock()
+        self.renders: Dict[str, subprocess.Popen] = {}
+
+    def handle(self) -> None:
+        logger.info(f"Connection from {self.client_address[0]}")
+        for bline in self.rfile:
+            try:
+                msg = json.loads(bline)
+                op = msg["op"]
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Invalid request: {bline!r}")
+                continue
+            if op == "render":
+                self.render(msg)
+            elif op == "kill":
+                self.kill(msg.get("id"))
+            elif op == "ping":
+                self.send({"event": "pong"})
+            else:
+                logger.warning(f"Unknown op: {op}")
+        logger.info(f"Connection from {self.client_address[0]} closed.")
+        with self._lock:
+            render_ids = list(self.renders)
+        for render_id in render_ids:
+            self.kill(render_id)
+
+    def send(self, msg: Dict[str, Any]) -> None:
+        data = (json.dumps(msg) + "\n").encode("UTF-8")
+        with self._lock:
+            try:
+                self.wfile.write(data)
+            except OSError:
+                # Connection lost. `handle()` will kill the renders when it notices.
+                pass
+
+    def render(self, msg: Dict[str, Any]) -> None:
+        render_id = msg.get("id")
+        try:
+            engine = msg["engine"]
+            first, last = msg["frames"]
+            cmd = self.server.command(engine, msg["path"], int(first), int(last))
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                # Own process group, so the renderer and anything it spawns can be killed together.
+                start_new_session=True,
+            )
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            logger.warning(f"Failed to start render {render_id}: {e}")
+            self.send({"id": render_id, "event": "error", "message": str(e)})
+            return
+        with self._lock:
+            self.renders[render_id] = proc
+        logger.info(f"Started render {render_id} pid={proc.pid}: {' '.join(cmd)}")
+        self.send({"id": render_id, "event": "started", "pid": proc.pid})
+        parser = PARSERS[engine](range(int(first), int(last) + 1))
+        threading.Thread(target=self._watch, args=(render_id, proc, parser), daemon=True).start()
+
+    def _watch(self, render_id: str, proc: subprocess.Popen, parser) -> None:
+        """Reports progress of a render process until it exits."""
+        for line in proc.stdout:
+            for event in parser.parse(line):
+                event["id"] = render_id
+                self.send(event)
+        code = proc.wait()
+        with self._lock:
+            self.renders.pop(render_id, None)
+        logger.info(f"Render {render_id} exited with code {code}.")
+        self.send({"id": render_id, "event": "exit", "code": code})
+
+    def kill(self, render_id: Optional[str]) -> None:
+        with self._lock:
+            proc = self.renders.get(render_id)
+        if not proc:
+            return
+        logger.info(f"Killing render {render_id} pid={proc.pid}")
+        self._signal(proc, signal.SIGTERM)
+        # Escalate if the renderer ignores SIGTERM.
+        timer = threading.Timer(KILL_GRACE, self._signal, args=(proc, signal.SIGKILL))
+        timer.daemon = True
+        timer.start()
+
+    @staticmethod
+    def _signal(proc: subprocess.Popen, sig: int) -> None:
+        """Sends a signal to the render process and everything it started, if it is still running."""
+        if proc.poll() is not None:
+            return
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+class AgentClient(object):
+    """Connection to the agent on one render node.
+
+    Renders register a callback that receives their events.  The connection is opened when it is first
+    needed and reopened if it is lost.  If it is lost, every render that was running over it receives a
+    `lost` event, since the agent kills them when the connection closes.
+    """
+
+    def __init__(self, node: str, port: int = DEFAULT_PORT, connect_timeout: float = 10.0):
+        self.node = node
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+
+    def _connect(self) -> socket.socket:
+        with self._lock:
+            if self._sock:
+                return self._sock
+            sock = socket.create_connection((self.node, self.port), timeout=self.connect_timeout)
+            sock.settimeout(None)
+            self._sock = sock
+        threading.Thread(target=self._read, args=(sock,), daemon=True).start()
+        logger.info(f"Connected to agent on {self.node}:{self.port}")
+        return sock
+
+    def _send(self, msg: Dict[str, Any]) -> None:
+        sock = self._connect()
+        data = (json.dumps(msg) + "\n").encode("UTF-8")
+        try:
+            with self._send_lock:
+                sock.sendall(data)
+        except OSError:
+            self._disconnected(sock)
+            raise
+
+    def _read(self, sock: socket.socket) -> None:
+        try:
+            for bline in sock.makefile("rb"):
+                try:
+                    msg = json.loads(bline)
+                except ValueError:
+                    logger.warning(f"Invalid message from agent on {self.node}: {bline!r}")
+                    continue
+                render_id = msg.get("id")
+                with self._lock:
+                    if msg.get("event") in ("exit", "error"):
+                        handler = self._handlers.pop(render_id, None)
+                    else:
+                        handler = self._handlers.get(render_id)
+                if handler:
+                    handler(msg)
+        except OSError:
+            pass
+        finally:
+            self._disconnected(sock)
+
+    def _disconnected(self, sock: socket.socket) -> None:
+        with self._lock:
+            if self._sock is not sock:
+                return
+            self._sock = None
+            handlers, self._handlers = self._handlers, {}
+        sock.close()
+        logger.warning(f"Lost connection to agent on {self.node}.")
+        for render_id, handler in handlers.items():
+            handler({"id": render_id, "event": "lost"})
+
+    def render(
+        self,
+        render_id: str,
+        engine: str,
+        path: str,
+        first: int,
+        last: int,
+        on_event: Callable[[Dict[str, Any]], None],
+    ) -> None:
+        """Starts rendering frames `first` through `last` of a project.
+
+        :param str render_id: Unique ID of this render.
+        :param on_event: Called with each event for this render, from the connection's reader thread.
+        :raises OSError: If the agent can't be reached.
+        """
+        self._connect()
+        with self._lock:
+            self._handlers[render_id] = on_event
+        try:
+            self._send(
+                {"op": "render", "id": render_id, "engine": engine, "path": path, "frames": [first, last]}
+            )
+        except OSError:
+            with self._lock:
+                self._handlers.pop(render_id, None)
+            raise
+
+    def kill(self, render_id: str) -> None:
+        """Kills a render. Does nothing if the agent can't be reached, since it kills renders when the
+        connection is lost anyway."""
+        try:
+            self._send({"op": "kill", "id": render_id})
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        with self._lock:
+            sock = self._sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class AgentConnections(object):
+    """Keeps one `AgentClient` per render node, shared by all jobs."""
+
+    def __init__(self, port: int = DEFAULT_PORT):
+        self.port = port
+        self._lock = threading.Lock()
+        self._clients: Dict[str, AgentClient] = {}
+
+    def get(self, node: str) -> AgentClient:
+        with self._lock:
+            if node not in self._clients:
+                self._clients[node] = AgentClient(node, self.port)
+            return self._clients[node]
+
+    def close_all(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            client.close()
+
+
+class AgentRenderThread(RenderThread):
+    """Renders a frame or chunk of frames with the agent on the render node.
+
+    The agent knows the PID of the render process and parses its output, so this class only has to
+    act on the events it sends.
+    """
+
+    def __init__(self, *args, agent: AgentClient, engine: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        if engine == TERRAGEN and len(self.frames) > 1:
+            raise ValueError("Terragen cannot render more than one frame per process.")
+        self.agent = agent
+        self.engine = engine
+        self.render_id = uuid4().hex
+        self.events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        # Set when the agent reports that the render process has exited.
+        self.exited = threading.Event()
+
+    def stop(self) -> None:
+        """Stops the render."""
+        if not self.status == RENDERING:
+            return
+        # In a new thread in case the connection is slow.
+        threading.Thread(target=self.agent.kill, args=(self.render_id,)).start()
+
+    def _kill(self, timeout: float) -> bool:
+        """Kills the render with the agent, which reports when the process has exited."""
+        self.agent.kill(self.render_id)
+        return self.exited.wait(timeout)
+
+    def _abort(self) -> None:
+        """Wakes the worker if it is waiting for an event."""
+        self.events.put({"event": "timeout"})
+
+    def worker(self) -> None:
+        """Runs in a new threading.Thread and renders the specified frames."""
+        self.logger.debug("Started worker thread.")
+        self.status = RENDERING
+        try:
+            self.agent.render(
+                self.render_id, self.engine, self.path, self.frame, self.end_frame, self.events.put
+            )
+        except OSError as e:
+            self.status = FAILED
+            self.logger.warning(f"Failed to render: could not reach agent: {e}")
+        while self.status == RENDERING:
+            try:
+                event = self.events.get(timeout=1.0)
+            except queue.Empty:
+                pass
+            else:
+                self.timeout_timer = time.time()
+                self.handle_event(event)
+            if self.status == RENDERING and self.is_timed_out():
+                self.status = FAILED
+                self.logger.warning("Failed to render: timed out")
+                self.agent.kill(self.render_id)
+        self.stop_render_timer()
+        self.logger.debug("Worker thread exited.")
+
+    def handle_event(self, event: Dict[str, Any]) -> None:
+        kind = event.get("event")
+        if kind == "progress":
+            self.progress = float(event["progress"])
+        elif kind == "saved":
+            self.logger.debug(f"Frame {event['frame']} saved.")
+            self.frame_saved(int(event["frame"]))
+        elif kind == "started":
+            self.pid = event["pid"]
+            self.logger.info(f"Started render process pid={self.pid}.")
+        elif kind == "exit":
+            self.exited.set()
+            if self.status == RENDERING:
+                self.status = FAILED
+                self.logger.warning(
+                    f"Failed to render: process exited with code {event.get('code')} before all frames were saved."
+                )
+        elif kind == "error":
+            self.status = FAILED
+            self.logger.warning(f"Failed to render: {event.get('message')}")
+        elif kind == "lost":
+            self.status = FAILED
+            self.logger.warning("Failed to render: lost connection to agent.")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("Render node agent for RenderController.")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on. Default: 0.0.0.0")
+    parser.add_argument(
+        "-p", "--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on. Default: {DEFAULT_PORT}"
+    )
+    parser.add_argument("--blender", help="Path to Blender executable.")
+    parser.add_argument("--terragen", help="Path to Terragen executable.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log debug messages.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    executables = {}
+    if args.blender:
+        executables[BLENDER] = args.blender
+    if args.terragen:
+        executables[TERRAGEN] = args.terragen
+    if not executables:
+        parser.error("At least one of --blender or --terragen is required.")
+    with AgentServer((args.host, args.port), executables) as server:
+        logger.info(f"Listening on {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
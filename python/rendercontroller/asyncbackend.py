@@ -0,0 +1,152 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import sys
+import threading
+from typing import Awaitable, Dict, Set
+
+logger = logging.getLogger("asyncbackend")
+
+
+class AsyncioBackend(object):
+    """Runs render processes from a single asyncio event loop thread.
+
+    With the default backend, every frame that is rendering holds a thread blocked reading the output of its
+    SSH process.  Render threads given an AsyncioBackend instead run `worker_async()` as a task in this
+    backend's event loop, so any number of render processes are started, read and reaped by one thread.
+    The RenderThread objects, and so the `Executor` interface, are the same either way.
+
+    Processes are reaped with pidfds where available (Linux 5.3+).  Before Python 3.12, asyncio's default
+    is to reap each process with a thread of its own, so the backend's event loop is given a pidfd watcher
+    of its own (see `_PidfdEventLoop`).
+    """
+
+    def __init__(self):
+        self.loop = _PidfdEventLoop() if _needs_pidfd_watcher() else asyncio.new_event_loop()
+        self._lock = threading.Lock()
+        # Keeps references to tasks started with `spawn()`, which the event loop does not.
+        self._background: Set[asyncio.Task] = set()
+        self._active = 0
+        self._started = 0
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        logger.debug("Started event loop.")
+        self.loop.run_forever()
+        logger.debug("Event loop stopped.")
+
+    def submit(self, coro: Awaitable[None]) -> concurrent.futures.Future:
+        """Runs a coroutine in the event loop. May be called from any thread."""
+        with self._lock:
+            self._active += 1
+            self._started += 1
+        return asyncio.run_coroutine_threadsafe(self._track(coro), self.loop)
+
+    async def _track(self, coro: Awaitable[None]) -> None:
+        try:
+            await coro
+        except Exception:
+            logger.exception("Task raised an exception.")
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def spawn(self, coro: Awaitable[None]) -> None:
+        """Starts a background task, e.g. to reap a process. Must be called from the event loop."""
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def metrics(self) -> Dict[str, int]:
+        """Returns the number of tasks that are running and the total number started."""
+        with self._lock:
+            return {"async_tasks": self._active, "async_tasks_started": self._started}
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stops the event loop.
+
+        :param float timeout: Seconds to wait for background tasks, e.g. reaping processes that are exiting.
+            Tasks that are still running after that are cancelled.
+        """
+
+        async def drain():
+            if self._background:
+                await asyncio.wait(set(self._background), timeout=timeout)
+            for task in asyncio.all_tasks() - {asyncio.current_task()}:
+                task.cancel()
+
+        asyncio.run_coroutine_threadsafe(drain(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+def _needs_pidfd_watcher() -> bool:
+    """Returns True if asyncio would not reap child processes with pidfds by itself, but they are supported."""
+    if sys.version_info >= (3, 12) or sys.platform == "win32":
+        # Python 3.12+ uses pidfds by default when they are supported.
+        return False
+    if not hasattr(asyncio, "PidfdChildWatcher") or not hasattr(os, "pidfd_open"):
+        return False
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except OSError:
+        # Not supported by the kernel.
+        return False
+    return True
+
+
+class _PidfdEventLoop(asyncio.SelectorEventLoop):
+    """Event loop that reaps its child processes with a pidfd watcher of its own, as Python 3.12+ does.
+
+    Before 3.12, event loops use the child watcher of the global event loop policy.  Setting one there would
+    change how every event loop in the process reaps processes, and the watcher would be closed, with
+    processes still pending, as soon as anything else set a watcher (e.g. another backend).  Only used on
+    versions where `_needs_pidfd_watcher()` is True.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._watcher = asyncio.PidfdChildWatcher()
+        self._watcher.attach_loop(self)
+        self._children: Set[int] = set()
+
+    async def _make_subprocess_transport(
+        self, protocol, args, shell, stdin, stdout, stderr, bufsize, extra=None, **kwargs
+    ):
+        # Same as the base class, except that the watcher is this loop's rather than the policy's.
+        from asyncio.unix_events import _UnixSubprocessTransport
+
+        waiter = self.create_future()
+        transp = _UnixSubprocessTransport(
+            self, protocol, args, shell, stdin, stdout, stderr, bufsize, waiter=waiter, extra=extra, **kwargs
+        )
+        pid = transp.get_pid()
+        self._children.add(pid)
+        self._watcher.add_child_handler(pid, self._child_watcher_callback, transp)
+        try:
+            await waiter
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except BaseException:
+            transp.close()
+            await transp._wait()
+            raise
+        return transp
+
+    def _child_watcher_callback(self, pid, returncode, transp):
+        self._children.discard(pid)
+        super()._child_watcher_callback(pid, returncode, transp)
+
+    def close(self) -> None:
+        if self._children:
+            logger.debug(f"Closing event loop with {len(self._children)} child processes still running.")
+        # Removing the handlers first lets the watcher be closed without warning about them.
+        for pid in self._children:
+            self._watcher.remove_child_handler(pid)
+        self._children.clear()
+        self._watcher.close()
+        super().close()
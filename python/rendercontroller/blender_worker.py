@@ -0,0 +1,52 @@
+"""Persistent render worker that runs inside Blender on a render node.
+
+This module is not imported by rendercontroller. Its source is sent to the render node and executed by
+Blender with `blender -b <project.blend> --python-expr <source>`, so the project file is loaded only once
+no matter how many frames the node renders.  Communication uses stdin and stdout:
+
+    Worker prints `RC_READY <pid>` when the project has been loaded.
+    For each line read from stdin containing a frame number, the worker renders the frame exactly as
+    `blender -b <project.blend> -f <frame>` would, then prints `RC_DONE <frame> <seconds>` or, if
+    rendering failed, `RC_ERROR <frame> <message>`.
+    The worker exits when stdin is closed.
+
+All other output is Blender's normal output, which rendercontroller parses for progress.
+"""
+
+import os
+import sys
+import time
+
+import bpy
+
+
+def render_frame(frame: int) -> None:
+    """Renders and saves a single frame using the output settings in the project file."""
+    scene = bpy.context.scene
+    scene.frame_start = frame
+    scene.frame_end = frame
+    bpy.ops.render.render(animation=True)
+
+
+def main() -> None:
+    print(f"RC_READY {os.getpid()}", flush=True)
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            frame = int(line)
+        except ValueError:
+            print(f"RC_ERROR {line} Invalid frame number", flush=True)
+            continue
+        start = time.time()
+        try:
+            render_frame(frame)
+        except Exception as e:
+            print(f"RC_ERROR {frame} {e}", flush=True)
+            continue
+        print(f"RC_DONE {frame} {time.time() - start:.3f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,26 @@ import threading
 import os.path
 import time
 import inspect
-from typing import Sequence, Dict, Any, Type, List, Optional
+import heapq
+import itertools
+from typing import Sequence, Dict, Any, Type, List, Optional, Iterator, Union, Callable, Tuple, Set
 from uuid import uuid4
-from collections import OrderedDict
-from rendercontroller.job import RenderJob
+from collections import defaultdict
+from rendercontroller.job import RenderJob, STOP_TIMEOUT
+from rendercontroller.scheduler import NodeAllocator, Dispatcher
+from rendercontroller.stats import NodeStats
+from rendercontroller.pool import WorkerPool
+from rendercontroller.ssh import SSHConnections
+from rendercontroller.agent import AgentConnections, DEFAULT_PORT as AGENT_PORT
+from rendercontroller.asyncbackend import AsyncioBackend
+from rendercontroller.watchdog import Watchdog
+from rendercontroller.renderthread import ssh_kill
 from rendercontroller.database import StateDatabase, DBFILE_NAME
-from rendercontroller.util import Config
+from rendercontroller.util import Config, frame_path
 from rendercontroller.exceptions import (
     JobNotFoundError,
     JobStatusError,
+    NodeNotFoundError,
 )
 from rendercontroller.constants import WAITING, RENDERING
 
@@ -24,44 +35,220 @@ class RenderQueue(object):
 
     This is something like a hybrid of a list and an OrderedDict, which allows accessing
     elements both by index and key, and adds some higher level methods specific to render jobs.
+
+    Internally, jobs are stored in a dict keyed by ID, their order is kept in a list of IDs and
+    a reverse index maps each ID to its position, so lookups by ID, by position and of a job's
+    position are all O(1).  Reordering only has to renumber the span of jobs that actually shifted,
+    so appending and popping the last job are O(1) and moving a job costs O(distance moved).
+
+    Jobs are also indexed by status.  The queue registers itself as a status listener on every job
+    it holds, so the status buckets are updated by `RenderJob._set_status()` as jobs change state.
+    This keeps status counts cheap to get no matter how many finished jobs are in the queue.
+
+    Waiting jobs are additionally kept in a heap ordered by priority (highest first), then by queue
+    position, which is used to select the next job to render.  Entries are invalidated lazily: when a
+    job stops waiting or its priority changes, its old entry is left in the heap and discarded when it
+    reaches the top.  Heap entries are ordered by a rank that follows queue order rather than by the
+    position itself, because positions shift when jobs ahead are removed.  Ranks only have to be
+    reassigned (and the heap rebuilt) after a job is inserted or moved, not when jobs are appended
+    or removed.
+
+    Callables in `change_listeners` are invoked with no arguments after any change to the contents,
+    order, or job statuses of the queue.
     """
 
     def __init__(self):
-        self.jobs = OrderedDict()
-        self.index = 0
-
-    def __iter__(self):
-        self.index = 0
-        return self
-
-    def __next__(self) -> RenderJob:
-        if self.index >= len(self.jobs):
-            raise StopIteration
-        i = self.index
-        self.index += 1
-        return tuple(self.jobs.values())[i]
+        self.jobs: Dict[str, RenderJob] = {}
+        self._order: List[str] = []
+        self._positions: Dict[str, int] = {}
+        # Status -> {job ID: job}.  Buckets are unordered; queue order comes from _positions.
+        self._by_status: Dict[str, Dict[str, RenderJob]] = defaultdict(dict)
+        self._job_status: Dict[str, str] = {}
+        # Heap of (-priority, rank, entry_id, job_id) for waiting jobs.  An entry is only valid if entry_id
+        # matches _entry_ids[job_id] and the job is still waiting.
+        self._waiting_heap: List[Tuple[int, int, int, str]] = []
+        self._entry_ids: Dict[str, int] = {}
+        self._entry_counter = itertools.count()
+        self._ranks: Dict[str, int] = {}  # Job ID -> rank.  Ranks sort in the same order as positions.
+        self._next_rank = 0
+        self._ranks_valid = True
+        # Queue is modified by the HTTP server and read by the task thread and render jobs.
+        self._lock = threading.RLock()
+        self.change_listeners: List[Callable[[], None]] = []
+
+    def __iter__(self) -> Iterator[RenderJob]:
+        # Iterate over a snapshot so callers are not affected by concurrent changes to the queue.
+        return iter(self.values())
 
     def __len__(self) -> int:
-        return len(self.jobs)
+        return len(self._order)
 
     def __str__(self) -> str:
-        return f"RenderQueue{tuple(f'{k}:{v}' for k, v in self.jobs.items())}"
+        return f"RenderQueue{tuple(f'{k}:{self.jobs[k]}' for k in self._order)}"
 
-    def __getitem__(self, item: int) -> RenderJob:
+    def __getitem__(self, item: Union[int, slice]) -> Union[RenderJob, List[RenderJob]]:
         """Returns job by index (queue position).  This is the same as get_by_position()."""
-        return tuple(self.jobs.values())[item]
+        if isinstance(item, slice):
+            return [self.jobs[i] for i in self._order[item]]
+        return self.jobs[self._order[item]]
 
     def __contains__(self, id) -> bool:
-        if id in self.jobs:
-            return True
-        return False
+        return id in self.jobs
+
+    def _renumber(self, start: int, stop: int) -> None:
+        """Updates the position index for queue positions in range(start, stop)."""
+        for n in range(max(start, 0), min(stop, len(self._order))):
+            self._positions[self._order[n]] = n
+
+    def _normalize_index(self, index: int) -> int:
+        """Converts index to the position list.insert() would actually place an item at."""
+        size = len(self._order)
+        if index < 0:
+            index += size
+        return min(max(index, 0), size)
+
+    def _place(self, id: str, index: int) -> None:
+        """Puts an ID that is not currently in the order list at position `index`."""
+        index = self._normalize_index(index)
+        self._order.insert(index, id)
+        self._renumber(index, len(self._order))
+
+    def _unplace(self, id: str) -> int:
+        """Removes an ID from the order list and returns the position it occupied."""
+        old = self._positions.pop(id)
+        del self._order[old]
+        self._renumber(old, len(self._order))
+        return old
+
+    def _index_status(self, job: RenderJob) -> None:
+        """Files job in the bucket for its current status, removing it from its previous bucket."""
+        old = self._job_status.get(job.id)
+        new = job.status
+        if old is not None:
+            self._by_status[old].pop(job.id, None)
+        self._by_status[new][job.id] = job
+        self._job_status[job.id] = new
+        if new == WAITING and old != WAITING:
+            self._push_waiting(job)
+
+    def _unindex_status(self, id: str) -> None:
+        status = self._job_status.pop(id)
+        self._by_status[status].pop(id, None)
+        # Any heap entry for this job is now invalid.
+        self._entry_ids.pop(id, None)
+
+    def _push_waiting(self, job: RenderJob) -> None:
+        """Adds a heap entry for a waiting job, invalidating any previous entry for it."""
+        if not self._ranks_valid:
+            return  # Heap will be rebuilt before it is next used.
+        entry_id = next(self._entry_counter)
+        self._entry_ids[job.id] = entry_id
+        heapq.heappush(
+            self._waiting_heap, (-job.priority, self._ranks[job.id], entry_id, job.id)
+        )
+        # Stale entries are normally discarded as they surface, but low priority ones may not surface
+        # for a long time, so compact the heap if they start to dominate it.
+        if len(self._waiting_heap) > 2 * len(self._by_status[WAITING]) + 64:
+            self._rebuild_waiting_heap()
+
+    def _rebuild_waiting_heap(self) -> None:
+        """Reassigns ranks from queue positions and rebuilds the heap from the waiting bucket."""
+        self._ranks = dict(self._positions)
+        self._next_rank = len(self._order)
+        self._ranks_valid = True
+        self._entry_ids.clear()
+        self._waiting_heap = []
+        for job in self._by_status[WAITING].values():
+            entry_id = next(self._entry_counter)
+            self._entry_ids[job.id] = entry_id
+            self._waiting_heap.append(
+                (-job.priority, self._ranks[job.id], entry_id, job.id)
+            )
+        heapq.heapify(self._waiting_heap)
 
-    def append(self, job: RenderJob) -> None:
+    def _invalidate_ranks(self) -> None:
+        """Called when a job is inserted or moved, which breaks the order of existing ranks."""
+        self._ranks_valid = False
+        self._waiting_heap = []
+        self._entry_ids.clear()
+
+    def _add(self, job: RenderJob) -> None:
+        """Adds a new job to the job and status indexes.  Job must already be placed in the order list."""
         self.jobs[job.id] = job
+        if job.id not in self._ranks:
+            # Job was appended, so it goes after every other job.  (Insert invalidates all ranks anyway.)
+            self._ranks[job.id] = self._next_rank
+            self._next_rank += 1
+        # Register before indexing so a status change between the two cannot be missed.
+        job.add_status_listener(self.status_changed)
+        self._index_status(job)
+
+    def _notify_change(self) -> None:
+        # Called after the lock is released so listeners are free to use the queue.
+        for callback in list(self.change_listeners):
+            callback()
+
+    def status_changed(self, job: RenderJob, old_status: str) -> None:
+        """Status listener callback. Moves job to the bucket matching its new status."""
+        with self._lock:
+            if self.jobs.get(job.id) is not job:
+                # Job was removed from queue.
+                return
+            self._index_status(job)
+        self._notify_change()
+
+    def priority_changed(self, job: RenderJob) -> None:
+        """Must be called after a job's priority has changed, so it is scheduled accordingly."""
+        with self._lock:
+            if self.jobs.get(job.id) is not job:
+                return
+            if self._job_status[job.id] == WAITING:
+                self._push_waiting(job)
+        self._notify_change()
+
+    def append(self, job: RenderJob) -> None:
+        with self._lock:
+            if job.id in self.jobs:
+                # Same behavior as OrderedDict: replace the job but keep its position.
+                self._replace(job)
+            else:
+                self._order.append(job.id)
+                self._positions[job.id] = len(self._order) - 1
+                self._add(job)
+        self._notify_change()
+
+    def extend(self, jobs: Sequence[RenderJob]) -> None:
+        """Appends several jobs to the end of the queue at once.
+
+        Listeners are notified once after all jobs have been added.
+        """
+        with self._lock:
+            for job in jobs:
+                if job.id in self.jobs:
+                    self._replace(job)
+                else:
+                    self._order.append(job.id)
+                    self._positions[job.id] = len(self._order) - 1
+                    self._add(job)
+        self._notify_change()
+
+    def _replace(self, job: RenderJob) -> None:
+        old = self.jobs[job.id]
+        if old is not job:
+            old.remove_status_listener(self.status_changed)
+            self._unindex_status(job.id)
+            self._add(job)
 
     def pop(self, id: str) -> RenderJob:
         """Remove and return a job by its id."""
-        return self.jobs.pop(id)
+        with self._lock:
+            job = self.jobs.pop(id)
+            self._unplace(id)
+            self._unindex_status(id)
+            self._ranks.pop(id, None)
+            job.remove_status_listener(self.status_changed)
+        self._notify_change()
+        return job
 
     def get_by_id(self, id: str) -> RenderJob:
         """Returns job identified by id, else raises KeyError."""
@@ -69,48 +256,73 @@ class RenderQueue(object):
 
     def get_by_position(self, index: int) -> RenderJob:
         """Returns job by its position in queue (index), else raises IndexError."""
-        return self.__getitem__(index)
+        return self.jobs[self._order[index]]
 
     def insert(self, job: RenderJob, index: int) -> None:
         """Inserts a job at a specific position in queue (index)."""
-        items = list(self.jobs.items())
-        items.insert(index, (job.id, job))
-        self.jobs = OrderedDict(items)
+        with self._lock:
+            if job.id in self.jobs:
+                self._move(job.id, index)
+                self._replace(job)
+            else:
+                self._place(job.id, index)
+                self._invalidate_ranks()
+                self._add(job)
+        self._notify_change()
 
     def keys(self) -> List[str]:
-        return [job.id for job in self.jobs.values()]
+        return list(self._order)
 
     def values(self) -> List[RenderJob]:
-        return list(self.jobs.values())
+        return [self.jobs[i] for i in self._order]
 
     def move(self, id: str, index: int) -> None:
         """Moves job specified by `id` to a new position (index)."""
-        job = self.jobs.pop(id)
-        self.insert(job, index)
+        with self._lock:
+            self._move(id, index)
+        self._notify_change()
+
+    def _move(self, id: str, index: int) -> None:
+        if id not in self.jobs:
+            raise KeyError(id)
+        old = self._positions.pop(id)
+        del self._order[old]
+        new = self._normalize_index(index)
+        self._order.insert(new, id)
+        # Only jobs between the old and new positions have shifted.
+        self._renumber(min(old, new), max(old, new) + 1)
+        self._invalidate_ranks()
 
     def get_next_waiting(self) -> Optional[RenderJob]:
-        """Returns first item in queue with status Waiting. If none found, returns None."""
-        for j in self.jobs.values():
-            if j.status == WAITING:
-                return j
-        return None
+        """Returns the waiting job with the highest priority, or the first in queue if priorities are equal.
+
+        If no jobs are waiting, returns None.
+        """
+        with self._lock:
+            if not self._ranks_valid:
+                self._rebuild_waiting_heap()
+            heap = self._waiting_heap
+            while heap:
+                _, _, entry_id, job_id = heap[0]
+                if self._entry_ids.get(job_id) == entry_id and self._job_status.get(job_id) == WAITING:
+                    return self.jobs[job_id]
+                heapq.heappop(heap)
+            return None
 
     def count_status(self, status: str) -> int:
         """Returns the number of jobs with matching status."""
-        n = 0
-        for j in self.jobs.values():
-            if j.status == status:
-                n += 1
-        return n
+        return len(self._by_status.get(status, ()))
+
+    def get_by_status(self, status: str) -> List[RenderJob]:
+        """Returns all jobs with matching status in queue order."""
+        with self._lock:
+            jobs = list(self._by_status.get(status, {}).values())
+            jobs.sort(key=lambda j: self._positions[j.id])
+            return jobs
 
     def get_position(self, id: str) -> int:
         """Returns position of job in queue (i.e. it's index)."""
-        n = 0
-        for i in self.jobs.keys():
-            if i == id:
-                return n
-            n += 1
-        raise KeyError(id)
+        return self._positions[id]
 
 
 class RenderController(object):
@@ -119,6 +331,27 @@ class RenderController(object):
     def __init__(self, config: Type[Config]) -> None:
         self.config = config
         self.queue = RenderQueue()
+        # Held while adding new jobs so their queue positions can be known before they are queued.
+        self._new_jobs_lock = threading.Lock()
+        self.allocator = NodeAllocator()
+        self.node_stats = NodeStats()
+        self.dispatcher = Dispatcher(interval=self.config.get("dispatch_interval", 1.0))
+        self.worker_pool = WorkerPool(
+            self.config.get("render_threads", 0) or max(2 * len(self.config.render_nodes), 1)
+        )
+        self.ssh: Optional[SSHConnections] = None
+        if self.config.get("ssh_multiplexing", False):
+            self.ssh = SSHConnections(
+                persist=self.config.get("ssh_control_persist", 600),
+                control_dir=self.config.get("ssh_control_dir", None),
+            )
+        self.agents: Optional[AgentConnections] = None
+        if self.config.get("render_transport", "ssh") == "agent":
+            self.agents = AgentConnections(port=self.config.get("agent_port", AGENT_PORT))
+        self.async_backend: Optional[AsyncioBackend] = None
+        if self.config.get("render_backend", "threads") == "asyncio":
+            self.async_backend = AsyncioBackend()
+        self.watchdog = Watchdog()
         self.db = StateDatabase(os.path.join(self.config.work_dir, DBFILE_NAME))
         self.db.initialize()
         self.task_thread = TaskThread(self)
@@ -127,6 +360,10 @@ class RenderController(object):
         jobs = self.db.get_all_jobs()
         if jobs:
             self.restore_jobs(jobs)
+        # Any change to the queue may mean it's time to start another job. Not registered until
+        # the queue is fully restored so a waiting job can't be started ahead of a resumed one.
+        self.queue.change_listeners.append(self.task_thread.notify)
+        self.task_thread.notify()
 
     @property
     def render_nodes(self) -> Sequence[str]:
@@ -138,18 +375,38 @@ class RenderController(object):
         """Automatically start next job in queue?."""
         return self.config.autostart
 
+    @property
+    def max_concurrent_jobs(self) -> int:
+        """Maximum number of jobs autostart may render at the same time."""
+        return self.config.get("max_concurrent_jobs", 1)
+
     @property
     def idle(self) -> bool:
         """Returns True if no jobs are currently rendering."""
-        for job in self.queue.values():
-            if job.status == RENDERING:
-                return False
-        return True
+        return self.queue.count_status(RENDERING) == 0
+
+    @property
+    def has_capacity(self) -> bool:
+        """Returns True if autostart may start another job."""
+        return self.queue.count_status(RENDERING) < self.max_concurrent_jobs
+
+    @property
+    def can_backfill(self) -> bool:
+        """Returns True if backfill is enabled and every rendering job is in its tail.
+
+        When a job reaches its tail (i.e. all of its remaining frames are rendering), it no longer needs
+        the nodes that are not working on those frames, so they can be lent to the next job in queue.
+        """
+        if not self.config.get("backfill", False):
+            return False
+        rendering = self.queue.get_by_status(RENDERING)
+        return bool(rendering) and all(job.in_tail() for job in rendering)
 
     def enable_autostart(self) -> None:
         """Enable automatic rendering jobs in the render queue."""
         self.config.autostart = True
         logger.info("Enabled autostart")
+        self.task_thread.notify()
 
     def disable_autostart(self) -> None:
         """Disable automatic rendering of jobs in the render queue."""
@@ -158,6 +415,7 @@ class RenderController(object):
 
     def restore_jobs(self, jobs: List[Dict]):
         """Create new RenderJobs from a list of job parameter dicts. Used to restore server state after restart."""
+        self._reconcile_in_flight(jobs)
         for j in jobs:
             logger.info(f"Restoring job {j['id']} from disk.")
             job = RenderJob(
@@ -175,15 +433,105 @@ class RenderController(object):
                 time_stop=j["time_stop"],
                 time_offset=time.time() - j["time_start"],
                 frames_completed=j["frames_completed"],
+                weight=j["weight"],
+                allocator=self.allocator,
+                priority=j["priority"],
+                chunk_size=j["chunk_size"],
+                node_stats=self.node_stats,
+                dispatcher=self.dispatcher,
+                worker_pool=self.worker_pool,
+                ssh=self.ssh,
+                agents=self.agents,
+                async_backend=self.async_backend,
+                watchdog=self.watchdog,
+                output_path=j.get("output_path", ""),
             )
+            self._watch_job(job)
             self.queue.append(job)
 
+    def _reconcile_in_flight(self, jobs: List[Dict]) -> None:
+        """Accounts for frames that were rendering when the server last shut down or crashed.
+
+        Frames whose output file was written after they were sent to the node are marked complete, so frames
+        that finished while the server was down are not rendered again.  Then any render processes that may
+        still be running are killed, so they don't compete with the resumed jobs for the nodes.  All other
+        frames that were rendering are rendered again.
+
+        :param jobs: Job parameter dicts from the database, updated in place.
+        """
+        orphans = []
+        for j in jobs:
+            in_flight = j.get("in_flight")
+            if not in_flight:
+                continue
+            saved = set()
+            for node, state in in_flight.items():
+                saved |= self._saved_frames(j.get("output_path", ""), state["frames"], state["time_start"])
+                # Agents kill their render processes when the server disconnects.
+                if state["pid"] and not self.agents and node in self.config.render_nodes:
+                    orphans.append((node, state["pid"], j["path"]))
+            saved -= j["frames_completed"]
+            if saved:
+                logger.info(
+                    f"Found {len(saved)} frames of job {j['id']} saved while the server was down: "
+                    f"{', '.join(str(f) for f in sorted(saved))}"
+                )
+                j["frames_completed"] |= saved
+                self.db.update_job_frames_completed(j["id"], j["frames_completed"])
+            j["in_flight"] = {}
+            self.db.update_job_in_flight(j["id"], {})
+        if orphans:
+            self._kill_orphans(orphans)
+
+    @staticmethod
+    def _saved_frames(output_path: str, frames: Sequence[int], since: float) -> Set[int]:
+        """Returns frames whose output file was modified at or after `since`.
+
+        :param output_path: Output path of the job with #s for the frame number. See `util.output_pattern()`.
+        """
+        saved = set()
+        if not output_path:
+            return saved
+        for frame in frames:
+            try:
+                if os.stat(frame_path(output_path, frame)).st_mtime >= since:
+                    saved.add(frame)
+            except OSError:
+                pass
+        return saved
+
+    def _kill_orphans(self, processes: Sequence[Tuple[str, int, str]]) -> None:
+        """Kills render processes left running by the last server, in parallel and within `stop_timeout`.
+
+        :param processes: Sequence of (node, pid, project path).  Processes are only killed if their command
+            line includes the project path, in case the PID has since been reused.
+        """
+        deadline = time.monotonic() + self.config.get("stop_timeout", STOP_TIMEOUT)
+        confirmed: Dict[Tuple[str, int], bool] = {}
+
+        def kill(node: str, pid: int, path: str) -> None:
+            logger.info(f"Killing render process pid={pid} left running on {node}.")
+            timeout = max(deadline - time.monotonic(), 0.0)
+            confirmed[(node, pid)] = ssh_kill(node, pid, timeout, self.ssh, match=path)
+
+        threads = [threading.Thread(target=kill, args=p, daemon=True) for p in processes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0.0))
+        for node, pid, _ in processes:
+            if not confirmed.get((node, pid), False):
+                logger.warning(f"Could not confirm render process pid={pid} on {node} was killed.")
+
     def new_job(
         self,
         path: str,
         start_frame: int,
         end_frame: int,
         render_nodes: List[str],
+        weight: float = 1.0,
+        priority: int = 0,
+        chunk_size: int = 1,
     ) -> str:
         """
         Creates a new render job and places it in queue.
@@ -192,6 +540,11 @@ class RenderController(object):
         :param int start_frame: Start frame number.
         :param int end_frame: End frame number.
         :param list render_nodes: List of render nodes to enable for this job.
+        :param float weight: Relative share of nodes the job gets when rendering concurrently with others.
+        :param int priority: Waiting jobs with higher priority are started first.
+        :param int chunk_size: Max number of consecutive frames to render per process. Rendering several
+            frames at once avoids the overhead of starting the render engine for each frame, which can be
+            significant for short frames. Ignored for render engines that do not support it.
         :return str: ID of newly created job.
         """
         job = RenderJob(
@@ -201,24 +554,124 @@ class RenderController(object):
             start_frame=start_frame,
             end_frame=end_frame,
             render_nodes=render_nodes,
+            weight=weight,
+            allocator=self.allocator,
+            priority=priority,
+            chunk_size=chunk_size,
+            node_stats=self.node_stats,
+            dispatcher=self.dispatcher,
+            worker_pool=self.worker_pool,
+            ssh=self.ssh,
+            agents=self.agents,
+            async_backend=self.async_backend,
+            watchdog=self.watchdog,
         )
-        self.queue.append(job)
+        self._watch_job(job)
         # Note: Database insertion, deletion and queue changes are performed by this class.
-        # DB updates are delegated to RenderJob instances.
-        self.db.insert_job(
-            job.id,
-            job.status,
-            path,
-            start_frame,
-            end_frame,
-            render_nodes,
-            0.0,
-            0.0,
-            [],
-            self.queue.get_position(job.id),
-        )
+        # DB updates are delegated to RenderJob instances.  The job must be in the database before
+        # it is queued, because queueing it may start it immediately.
+        with self._new_jobs_lock:
+            self.db.insert_job(
+                job.id,
+                job.status,
+                path,
+                start_frame,
+                end_frame,
+                render_nodes,
+                0.0,
+                0.0,
+                [],
+                len(self.queue),
+                weight=job.weight,
+                priority=job.priority,
+                chunk_size=job.chunk_size,
+            )
+            self.queue.append(job)
         return job.id
 
+    def new_jobs(self, specs: Sequence[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Creates several render jobs and places them in queue.
+
+        All jobs are validated before any are added. Jobs that fail validation are skipped, and
+        the rest are inserted into the database in a single transaction and appended to the
+        queue in the same order as `specs`.
+
+        :param specs: Sequence of dicts whose keys are the arguments of `new_job()`.
+        :return list: One dict for each spec, either {"job_id": id} if the job was created
+            or {"error": message} if it was not.
+        """
+        results: List[Dict[str, str]] = []
+        jobs = []
+        for spec in specs:
+            try:
+                job = RenderJob(
+                    config=self.config,
+                    id=uuid4().hex,
+                    path=spec["path"],
+                    start_frame=spec["start_frame"],
+                    end_frame=spec["end_frame"],
+                    render_nodes=spec["render_nodes"],
+                    weight=spec.get("weight", 1.0),
+                    allocator=self.allocator,
+                    priority=spec.get("priority", 0),
+                    chunk_size=spec.get("chunk_size", 1),
+                    node_stats=self.node_stats,
+                    dispatcher=self.dispatcher,
+                    worker_pool=self.worker_pool,
+                    ssh=self.ssh,
+                    agents=self.agents,
+                    async_backend=self.async_backend,
+                    watchdog=self.watchdog,
+                )
+            except KeyError as e:
+                results.append({"error": f"Missing required data: {e}"})
+                continue
+            except (ValueError, TypeError, NodeNotFoundError) as e:
+                results.append({"error": str(e)})
+                continue
+            jobs.append(job)
+            results.append({"job_id": job.id})
+        if not jobs:
+            return results
+        for job in jobs:
+            self._watch_job(job)
+        # Jobs are queued only after they are in the database, as in new_job().  If the insert fails,
+        # none of them are queued.
+        with self._new_jobs_lock:
+            start = len(self.queue)
+            self.db.insert_jobs(
+                [
+                    {
+                        "id": job.id,
+                        "status": job.status,
+                        "path": job.path,
+                        "start_frame": job.start_frame,
+                        "end_frame": job.end_frame,
+                        "render_nodes": job.get_enabled_nodes(),
+                        "time_start": 0.0,
+                        "time_stop": 0.0,
+                        "frames_completed": [],
+                        "queue_position": start + i,
+                        "weight": job.weight,
+                        "priority": job.priority,
+                        "chunk_size": job.chunk_size,
+                    }
+                    for i, job in enumerate(jobs)
+                ]
+            )
+            self.queue.extend(jobs)
+        logger.info(f"Created {len(jobs)} of {len(specs)} jobs in batch.")
+        return results
+
+    def _job_in_tail(self, job: RenderJob) -> None:
+        """Tail listener callback. Wakes task thread so it can backfill idle nodes."""
+        self.task_thread.notify()
+
+    def _watch_job(self, job: RenderJob) -> None:
+        """Registers controller callbacks with a new job."""
+        job.add_tail_listener(self._job_in_tail)
+
     def _try_get_job(self, job_id: str) -> RenderJob:
         """Returns an instance of RenderJob matching job_id, otherwise throws JobNotFoundError."""
         try:
@@ -242,9 +695,13 @@ class RenderController(object):
             return job.id
         return None
 
-    def stop(self, job_id: str) -> None:
-        """Stops the specified job."""
-        self._try_get_job(job_id).stop()
+    def stop(self, job_id: str, timeout: Optional[float] = None) -> List[str]:
+        """Stops the specified job.
+
+        :param timeout: Max seconds to wait for render processes to be killed. Default is `stop_timeout` in config.
+        :returns: Nodes where the render process could not be confirmed killed.
+        """
+        return self._try_get_job(job_id).stop(timeout)
 
     def reset_waiting(self, job_id: str) -> None:
         """Reset STOPPED job to WAITING so it can be started automatically by autostart."""
@@ -259,6 +716,7 @@ class RenderController(object):
         # Note: Database insertion, deletion and queue changes are performed by this class.
         # DB updates are delegated to RenderJob instances.
         self.db.delete_job(job_id)
+        self.node_stats.forget(job_id)
 
     def enable_node(self, job_id: str, node: str) -> None:
         """
@@ -278,40 +736,94 @@ class RenderController(object):
         """
         self._try_get_job(job_id).disable_node(node)
 
+    def set_weight(self, job_id: str, weight: float) -> None:
+        """
+        Sets the relative share of render nodes a job gets when rendering concurrently with other jobs.
+
+        :param str job_id: ID of job to modify.
+        :param float weight: New weight. Must be greater than zero.
+        """
+        self._try_get_job(job_id).set_weight(weight)
+
+    def set_priority(self, job_id: str, priority: int) -> None:
+        """
+        Sets the priority of a job.  When autostart is enabled, waiting jobs are started in order of
+        priority (highest first), and jobs with equal priority are started in queue order.
+
+        :param str job_id: ID of job to modify.
+        :param int priority: New priority.
+        """
+        job = self._try_get_job(job_id)
+        job.set_priority(priority)
+        self.queue.priority_changed(job)
+
+    def get_worker_metrics(self) -> Dict[str, float]:
+        """Returns metrics for the threads that run render processes. See `WorkerPool.metrics()` and
+        `AsyncioBackend.metrics()`."""
+        metrics = self.worker_pool.metrics()
+        if self.async_backend:
+            metrics.update(self.async_backend.metrics())
+        return metrics
+
     def get_all_job_data(self) -> List[Dict[str, Any]]:
         """Returns complete status info about all jobs on server."""
-        data = []
-        for job in self.queue.values():
-            data.append(self.get_job_data(job.id))
-        return data
+        return [job.snapshot() for job in self.queue.values()]
+
+    def get_all_job_data_json(self) -> bytes:
+        """Same as `get_all_job_data()`, but returns it serialized as UTF-8 encoded JSON."""
+        return b"[" + b", ".join(job.snapshot_json() for job in self.queue.values()) + b"]"
 
     def get_job_data(self, job_id: str) -> Dict[str, Any]:
-        """Returns status info for a render job."""
-        ret = self._try_get_job(job_id).dump()
-        # frames_completed can potentially be fairly large, and is neither used
-        # by the web UI nor JSON serializable, so just remove it.
-        ret.pop("frames_completed")
-        return ret
+        """Returns status info for a render job.
 
-    def shutdown(self) -> None:
-        """Prepares controller for clean shutdown."""
+        The returned dict is cached and shared between callers, so do not modify it.
+        """
+        return self._try_get_job(job_id).snapshot()
+
+    def get_job_data_json(self, job_id: str) -> bytes:
+        """Same as `get_job_data()`, but returns it serialized as UTF-8 encoded JSON."""
+        return self._try_get_job(job_id).snapshot_json()
+
+    def shutdown(self, restart: bool = False) -> None:
+        """Prepares controller for clean shutdown.
+
+        :param restart: If True, rendering jobs are suspended instead of stopped, so they are resumed as
+            soon as the server starts again. See `RenderJob.suspend()`.
+        """
         logger.debug("Shutting down controller")
         self.task_thread.shutdown()
         # Must stop task thread first or it might autostart waiting jobs
         logger.debug("Attempting to stop running jobs.")
-        for job in self.queue.values():
-            if job.status == RENDERING:
+        for job in self.queue.get_by_status(RENDERING):
+            if restart:
+                logger.debug(f"Attempting to suspend {job.id}")
+                job.suspend()
+            else:
                 logger.debug(f"Attempting to stop {job.id}")
                 job.stop()
+        self.dispatcher.shutdown()
+        self.worker_pool.shutdown()
+        if self.ssh:
+            self.ssh.close_all()
+        if self.agents:
+            self.agents.close_all()
+        if self.async_backend:
+            self.async_backend.shutdown()
+        self.watchdog.shutdown()
         logger.debug("Controller shutdown complete.")
 
 
 class TaskThread(object):
-    """Thread to perform periodic background tasks."""
+    """Thread to perform background tasks, such as starting the next job in queue.
+
+    The thread sleeps until `notify()` is called, which the controller does whenever something
+    happens that might require action, e.g. a job is added, reordered, reset or changes status.
+    """
 
     def __init__(self, controller: RenderController):
         self.controller = controller
         self.stop = False
+        self._wakeup = threading.Event()
         self._thread = threading.Thread(target=self.mainloop, daemon=True)
 
     def start(self) -> None:
@@ -320,16 +832,33 @@ class TaskThread(object):
     def running(self) -> bool:
         return self._thread.is_alive()
 
+    def notify(self) -> None:
+        """Wakes the thread so it can check whether there is anything to do."""
+        self._wakeup.set()
+
     def shutdown(self) -> None:
         logger.debug("Attempting to terminate task thread.")
         self.stop = True
+        self.notify()
         self._thread.join()  # Wait for any cleanup tasks to finish
 
     def mainloop(self) -> None:
         logger.debug("Starting task thread.")
         while not self.stop:
-            time.sleep(1)
-            if self.controller.autostart:
-                if self.controller.idle:
-                    self.controller.start_next()
+            self._wakeup.wait()
+            # Clear before checking state. A notify() that arrives while we are working
+            # will set the event again, so it cannot be lost.
+            self._wakeup.clear()
+            if self.stop:
+                break
+            try:
+                if self.controller.autostart:
+                    if self.controller.has_capacity:
+                        self.controller.start_next()
+                    elif self.controller.can_backfill:
+                        job_id = self.controller.start_next()
+                        if job_id:
+                            logger.info(f"Backfilling idle nodes with job {job_id}.")
+            except Exception:
+                logger.exception("Task thread caught exception while starting next job.")
         logger.debug("Terminated task thread.")
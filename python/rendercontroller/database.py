@@ -1,7 +1,7 @@
 import time
 import json
 import sqlite3
-from typing import List, Sequence, Dict, Tuple, Set
+from typing import List, Sequence, Dict, Tuple, Set, Any, Optional
 
 
 DBFILE_NAME = "rcontroller.sqlite"
@@ -26,10 +26,23 @@ class StateDatabase(object):
             "frames_completed BLOB",
             "queue_position INTEGER",
             "timestamp FLOAT",
+            # Columns below were added after the initial release. New columns must be appended
+            # to the end of this list and have a default value so they can be added to existing
+            # databases.
+            "weight REAL DEFAULT 1.0",
+            "priority INTEGER DEFAULT 0",
+            "chunk_size INTEGER DEFAULT 1",
+            "in_flight BLOB DEFAULT '{}'",
+            "output_path TEXT DEFAULT ''",
         ]
         self.execute(
             f"CREATE TABLE IF NOT EXISTS jobs ({', '.join(jobs_schema)})", commit=True
         )
+        # Upgrade databases created by older versions.
+        columns = [row[1] for row in self.execute("PRAGMA table_info(jobs)")]
+        for column in jobs_schema:
+            if column.split()[0] not in columns:
+                self.execute(f"ALTER TABLE jobs ADD COLUMN {column}", commit=True)
 
     def insert_job(
         self,
@@ -43,13 +56,70 @@ class StateDatabase(object):
         time_stop: float,
         frames_completed: Set[int],
         queue_position: int,
+        weight: float = 1.0,
+        priority: int = 0,
+        chunk_size: int = 1,
+        in_flight: Optional[Dict[str, Dict[str, Any]]] = None,
+        output_path: str = "",
     ) -> None:
         """Adds a new RenderJob to the database."""
-        query = (
-            "INSERT INTO jobs (id, status, path, start_frame, end_frame, render_nodes, time_start, time_stop, "
-            "frames_completed, queue_position, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        self.execute(
+            self._insert_job_query,
+            self._insert_job_params(
+                id,
+                status,
+                path,
+                start_frame,
+                end_frame,
+                render_nodes,
+                time_start,
+                time_stop,
+                frames_completed,
+                queue_position,
+                weight,
+                priority,
+                chunk_size,
+                in_flight,
+                output_path,
+            ),
+            commit=True,
+        )
+
+    def insert_jobs(self, jobs: Sequence[Dict[str, Any]]) -> None:
+        """Adds several new RenderJobs to the database in a single transaction.
+
+        :param jobs: Sequence of dicts whose keys are the keyword arguments of `insert_job()`.
+        """
+        self.executemany(
+            self._insert_job_query,
+            [self._insert_job_params(**job) for job in jobs],
         )
-        params = (
+
+    _insert_job_query = (
+        "INSERT INTO jobs (id, status, path, start_frame, end_frame, render_nodes, time_start, time_stop, "
+        "frames_completed, queue_position, timestamp, weight, priority, chunk_size, in_flight, output_path) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+
+    @staticmethod
+    def _insert_job_params(
+        id: str,
+        status: str,
+        path: str,
+        start_frame: int,
+        end_frame: int,
+        render_nodes: Sequence[str],
+        time_start: float,
+        time_stop: float,
+        frames_completed: Set[int],
+        queue_position: int,
+        weight: float = 1.0,
+        priority: int = 0,
+        chunk_size: int = 1,
+        in_flight: Optional[Dict[str, Dict[str, Any]]] = None,
+        output_path: str = "",
+    ) -> Tuple:
+        return (
             id,
             status,
             path,
@@ -63,8 +133,12 @@ class StateDatabase(object):
             ),  # Because set is not JSON serializable.
             queue_position,
             time.time(),
+            weight,
+            priority,
+            chunk_size,
+            json.dumps(in_flight if in_flight else {}),
+            output_path,
         )
-        self.execute(query, params, commit=True)
 
     def update_job_status(self, id: str, status: str) -> None:
         self.execute(
@@ -100,6 +174,35 @@ class StateDatabase(object):
             commit=True,
         )
 
+    def update_job_weight(self, id: str, weight: float) -> None:
+        self.execute(
+            f"UPDATE jobs SET weight = ?, timestamp = ? WHERE id = ?",
+            (weight, time.time(), id),
+            commit=True,
+        )
+
+    def update_job_priority(self, id: str, priority: int) -> None:
+        self.execute(
+            f"UPDATE jobs SET priority = ?, timestamp = ? WHERE id = ?",
+            (priority, time.time(), id),
+            commit=True,
+        )
+
+    def update_job_in_flight(self, id: str, in_flight: Dict[str, Dict[str, Any]]) -> None:
+        """Saves the frames that are rendering on each node. See `RenderJob.in_flight()`."""
+        self.execute(
+            f"UPDATE jobs SET in_flight = ?, timestamp = ? WHERE id = ?",
+            (json.dumps(in_flight), time.time(), id),
+            commit=True,
+        )
+
+    def update_job_output_path(self, id: str, output_path: str) -> None:
+        self.execute(
+            f"UPDATE jobs SET output_path = ?, timestamp = ? WHERE id = ?",
+            (output_path, time.time(), id),
+            commit=True,
+        )
+
     def update_nodes(self, job_id: str, render_nodes: Sequence[str]) -> None:
         self.execute(
             f"UPDATE jobs SET render_nodes = ?, timestamp = ? WHERE id = ?",
@@ -121,6 +224,11 @@ class StateDatabase(object):
             "frames_completed": set(json.loads(row[8])),
             "queue_position": row[9],
             "timestamp": row[10],
+            "weight": row[11],
+            "priority": row[12],
+            "chunk_size": row[13],
+            "in_flight": json.loads(row[14]),
+            "output_path": row[15],
         }
 
     def get_job(self, id) -> Dict:
@@ -149,3 +257,12 @@ class StateDatabase(object):
             con.commit()
         con.close()
         return ret
+
+    def executemany(self, query: str, params: Sequence[Tuple]) -> None:
+        """Executes a query once for each set of params, and commits them all as one transaction."""
+        con = sqlite3.connect(self.filepath)
+        try:
+            with con:  # Commits on success, rolls back on exception
+                con.executemany(query, params)
+        finally:
+            con.close()
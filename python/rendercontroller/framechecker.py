@@ -1,12 +1,197 @@
 #!/usr/bin/env python3
 """
-Script to check a directory of sequentially-numbered files for missing items between a given start and end value.
+Script to check directories of sequentially-numbered files for missing items between a given start and end value.
 """
 
 
 import os
+import re
 import sys
+import json
 import argparse
+import itertools
+import concurrent.futures
+from typing import Any, Dict, Iterator, List, Optional, Sequence as SequenceType, Set, Tuple
+
+# The frame number is the last number in the file name (without extension). Everything before it is the
+# prefix, and anything after it (e.g. `_L` for a stereo view) the suffix.
+FILENAME_PATTERN = re.compile(r"^(.*[^0-9])?([0-9]+)([^0-9]*)$")
+# Turns a bitmap of frames found into a bitmap of frames missing.
+_INVERT = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+
+class Sequence(object):
+    """Files in a directory that differ only by frame number, e.g. `beauty.0001.exr`, `beauty.0002.exr`...
+
+    Frame numbers with more digits than the rest are part of the same sequence, e.g. `img_9999.png` and
+    `img_10000.png`.  `padding` is the fewest digits of any of them, i.e. the width frame numbers are padded
+    to with zeros.
+    """
+
+    def __init__(self, prefix: str, suffix: str):
+        """
+        :param str prefix: File name before the frame number.
+        :param str suffix: File name after the frame number, including the extension.
+        """
+        self.prefix = prefix
+        self.suffix = suffix
+        self.frames: Set[int] = set()
+        self.padding = 0
+
+    def add(self, frame: int, digits: int) -> None:
+        """Adds a file to the sequence.
+
+        :param int frame: Frame number.
+        :param int digits: Number of digits in the file name's frame number.
+        """
+        self.frames.add(frame)
+        if not self.padding or digits < self.padding:
+            self.padding = digits
+
+    @property
+    def pattern(self) -> str:
+        """File name with #s in place of the frame number, like Blender output paths."""
+        return f"{self.prefix}{'#' * self.padding}{self.suffix}"
+
+    @property
+    def first(self) -> int:
+        return min(self.frames)
+
+    @property
+    def last(self) -> int:
+        return max(self.frames)
+
+    def filename(self, frame: int) -> str:
+        """Returns the name the file for a frame would have."""
+        return f"{self.prefix}{frame:0{self.padding}d}{self.suffix}"
+
+    def missing(self, start: Optional[int] = None, end: Optional[int] = None) -> List[int]:
+        """Returns frames from `start` through `end` that are not in the sequence.
+
+        :param int start: First frame expected. Default is the first frame in the sequence.
+        :param int end: Last frame expected. Default is the last frame in the sequence.
+        """
+        if not self.frames:
+            return []
+        start = self.first if start is None else start
+        end = self.last if end is None else end
+        return missing_frames(self.frames, start, end)
+
+
+def missing_frames(found: Set[int], start: int, end: int) -> List[int]:
+    """Returns frames from `start` through `end` that are not in `found`."""
+    if end < start:
+        return []
+    bitmap = bytearray(end - start + 1)
+    for frame in found:
+        if start <= frame <= end:
+            bitmap[frame - start] = 1
+    return list(itertools.compress(range(start, end + 1), bitmap.translate(_INVERT)))
+
+
+def find_sequences(path: str, extensions: Optional[SequenceType[str]] = None) -> List[Sequence]:
+    """Returns the sequences of numbered files in a directory, sorted by pattern.
+
+    Hidden files and files without a number in their name are ignored.
+
+    :param str path: Directory to check.
+    :param extensions: Extensions (including period) of files to check. Not case sensitive.
+        Default is `Framechecker.default_exts`.
+    """
+    return _scan(path, extensions, False)[0]
+
+
+def _scan(
+    path: str, extensions: Optional[SequenceType[str]], subdirs: bool
+) -> Tuple[List[Sequence], List[str]]:
+    """Same as `find_sequences()`, but also returns the paths of subdirectories (except hidden ones) if
+    `subdirs` is True, so a tree can be scanned without reading any directory twice."""
+    exts = {e.lower().lstrip(".") for e in (extensions or Framechecker.default_exts)}
+    sequences: Dict[Tuple[str, str], Sequence] = {}
+    dirs = []
+    match = FILENAME_PATTERN.match
+    with os.scandir(path) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith("."):
+                continue
+            base, dot, ext = name.rpartition(".")
+            if not dot or ext.lower() not in exts:
+                if subdirs and entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                continue
+            m = match(base)
+            if not m or not entry.is_file():
+                continue
+            prefix, digits, suffix = m.groups()
+            key = (prefix or "", suffix + dot + ext)
+            seq = sequences.get(key)
+            if seq is None:
+                seq = sequences[key] = Sequence(*key)
+            seq.add(int(digits), len(digits))
+    return sorted(sequences.values(), key=lambda s: s.pattern), dirs
+
+
+def format_ranges(frames: SequenceType[int]) -> str:
+    """Formats sorted frame numbers as comma-separated ranges, e.g. `1-100,105,110-120`."""
+    ranges = []
+    for _, group in itertools.groupby(enumerate(frames), lambda item: item[1] - item[0]):
+        group = list(group)
+        first, last = group[0][1], group[-1][1]
+        ranges.append(str(first) if first == last else f"{first}-{last}")
+    return ",".join(ranges)
+
+
+def check_directories(
+    paths: SequenceType[str],
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    extensions: Optional[SequenceType[str]] = None,
+    recursive: bool = False,
+    workers: int = 16,
+) -> Iterator[Dict[str, Any]]:
+    """Checks many directories for missing frames at once, and yields the results as each one is done.
+
+    Reading directories on a network filesystem is slow, but mostly waiting, so they are read by a pool of
+    `workers` threads.  Yields a dict for each sequence of files found, in the order directories finish:
+    `{"directory", "pattern", "padding", "first", "last", "found", "missing_count", "missing"}`, where
+    `missing` is a string of ranges from `format_ranges()`.  Directories that can't be read yield
+    `{"directory", "error"}`, as do directories in `paths` with no numbered files.
+
+    :param paths: Directories to check.
+    :param int start: First frame expected. Default is the first frame of each sequence.
+    :param int end: Last frame expected. Default is the last frame of each sequence.
+    :param extensions: See `find_sequences()`.
+    :param bool recursive: Check subdirectories too. Subdirectories with no numbered files are skipped.
+    :param int workers: Number of threads.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan, path, extensions, recursive): (path, True) for path in paths}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                path, given = pending.pop(future)
+                try:
+                    sequences, subdirs = future.result()
+                except OSError as e:
+                    yield {"directory": path, "error": e.strerror or str(e)}
+                    continue
+                for subdir in subdirs:
+                    pending[pool.submit(_scan, subdir, extensions, recursive)] = (subdir, False)
+                if not sequences and given:
+                    yield {"directory": path, "error": "No suitable files found in directory."}
+                for seq in sequences:
+                    missing = seq.missing(start, end)
+                    yield {
+                        "directory": path,
+                        "pattern": seq.pattern,
+                        "padding": seq.padding,
+                        "first": seq.first,
+                        "last": seq.last,
+                        "found": len(seq.frames),
+                        "missing_count": len(missing),
+                        "missing": format_ranges(missing),
+                    }
 
 
 class Framechecker(object):
@@ -20,95 +205,103 @@ class Framechecker(object):
         self.startframe = startframe
         self.endframe = endframe
         self.allowed_extensions = allowed_extensions or self.default_exts
-        # now try to get directory contents
         if not os.path.isdir(self.path):
             raise ValueError("Path must be a directory")
-        self.dir_contents = os.listdir(self.path)
+        self.sequences = find_sequences(self.path, self.allowed_extensions)
         # make sure there are some files we can parse
-        for item in self.dir_contents:
-            self.base, self.ext = os.path.splitext(item)
-            if self.ext in self.allowed_extensions:
-                filesok = True
-                break
-            else:
-                filesok = False
-        if not filesok:
+        if not self.sequences:
             raise RuntimeError("No suitable files found in directory.")
+        self.filename = self.sequences[0].filename(self.sequences[0].first)
+        self.base, self.ext = os.path.splitext(self.filename)
 
     def calculate_indices(self, filename=None):
-        """Attempts to determine the slice indices needed to isolate sequential
-        file numbers within a typical filename. Assuming the sequential numbers go
-        to the end of the file base name, traverse the base name backwards looking
-        for the first non-numerical character. Assume the adjacent number is the
-        beginning of the sequential numbers. Returns a tuple with left and right
-        indices as integers. Returns false if nothing was found.
-
-        Optinal basename arg changes the value of self.base. Used to account for
-        changes in filename length during iteration."""
+        """Returns the left and right slice indices of the sequential file number in a file's base name,
+        i.e. the last number in it.
+
+        Optional filename arg changes the value of self.base."""
         if filename:
             self.base, self.ext = os.path.splitext(filename)
-        i = len(self.base) - 1
-        while i >= 0:
-            char = self.base[i]
-            if not char.isdigit():
-                left = i + 1
-                right = len(self.base)
-                return (left, right)
-            i -= 1
-        # loop finished with nothing found
-        raise RuntimeError("Unable to parse filename:", self.base)
+        m = FILENAME_PATTERN.match(self.base)
+        if not m:
+            raise RuntimeError("Unable to parse filename:", self.base)
+        return m.span(2)
+
+    def check(self) -> List[Tuple[Sequence, List[int]]]:
+        """Returns (sequence, missing frames) for each sequence of files in the directory."""
+        return [(seq, seq.missing(self.startframe, self.endframe)) for seq in self.sequences]
 
     def generate_lists(self):
-        """Given left and right slice indices, returns lists of directory contents,
-        frames expected, frames found and frames missing."""
-        frames_expected = []
-        frames_found = []
-        frames_missing = []
-        # generate list of expected frames
-        for frame in range(self.startframe, self.endframe + 1):
-            frames_expected.append(frame)
-        # generate list of found frames, i.e. a list of sequential file numbers
-        for item in self.dir_contents:
-            # ignore hidden files
-            if item[0] == ".":
-                continue
-            # ignore files that don't have allowed extensions
-            if not os.path.splitext(item)[-1] in self.allowed_extensions:
-                continue
-            self.filename = item
-            left, right = self.calculate_indices(filename=item)
-            frame = int(item[left:right])
-            frames_found.append(frame)
-        # now compare to get list of missing frames
-        for frame in frames_expected:
-            if not frame in frames_found:
-                frames_missing.append(frame)
+        """Returns lists of directory contents, frames expected, frames found and frames missing.
+
+        Frames are found if they are in any sequence in the directory. Use `check()` to check each one."""
+        found = set()
+        for seq in self.sequences:
+            found |= seq.frames
         return (
             self.filename,
-            self.dir_contents,
-            frames_expected,
-            frames_found,
-            frames_missing,
+            os.listdir(self.path),
+            list(range(self.startframe, self.endframe + 1)),
+            sorted(found),
+            missing_frames(found, self.startframe, self.endframe),
         )
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser(__doc__)
-    parser.add_argument("-s", "--start", help="Start value", type=int, required=True)
-    parser.add_argument("-e", "--end", help="End value", type=int, required=True)
+def main(argv: Optional[SequenceType[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog="Exits with status 1 if any frames are missing, or 2 if any directory could not be checked.",
+    )
+    parser.add_argument(
+        "-s", "--start", help="Start value. Default: first file of each sequence", type=int
+    )
+    parser.add_argument(
+        "-e", "--end", help="End value. Default: last file of each sequence", type=int
+    )
+    parser.add_argument(
+        "-x",
+        "--extensions",
+        help=f"Comma-separated extensions of files to check. Default: {','.join(Framechecker.default_exts)}",
+    )
+    parser.add_argument(
+        "-r", "--recursive", help="Check subdirectories too.", action="store_true"
+    )
+    parser.add_argument(
+        "-j", "--jobs", help="Number of directories to read at once. Default: 16", type=int, default=16
+    )
     parser.add_argument(
-        "DIRECTORY", help="Directory containing sequentially-numbered files.", type=str
+        "--json",
+        help="Print a JSON object for each sequence of files on its own line (NDJSON).",
+        action="store_true",
+    )
+    parser.add_argument(
+        "DIRECTORY", help="Directories containing sequentially-numbered files.", type=str, nargs="+"
     )
 
-    args = parser.parse_args()
-    fc = Framechecker(args.DIRECTORY, args.start, args.end)
-    fc.calculate_indices()
-    name, dirconts, expected, found, missing = fc.generate_lists()
-    if not missing:
-        print("No missing frames found")
-        return 0
-    print(f"Possible missing frames: {str(missing)[1:-1]}")
-    return 1
+    args = parser.parse_args(argv)
+    exts = args.extensions.split(",") if args.extensions else None
+    # Name directories in output unless only one is being checked.
+    show_dir = len(args.DIRECTORY) > 1 or args.recursive
+    ret = 0
+    results = check_directories(
+        args.DIRECTORY, args.start, args.end, exts, args.recursive, max(args.jobs, 1)
+    )
+    for result in results:
+        if "error" in result:
+            ret = 2
+        elif result["missing"] and not ret:
+            ret = 1
+        if args.json:
+            print(json.dumps(result), flush=True)
+            continue
+        if "error" in result:
+            print(f"{result['directory']}: {result['error']}", file=sys.stderr, flush=True)
+            continue
+        name = os.path.join(result["directory"], result["pattern"]) if show_dir else result["pattern"]
+        if result["missing"]:
+            print(f"{name}: Possible missing frames: {result['missing']}", flush=True)
+        else:
+            print(f"{name}: No missing frames found", flush=True)
+    return ret
 
 
 if __name__ == "__main__":
@@ -1,40 +1,70 @@
 import threading
 import time
+import json
+import functools
+import math
 import os.path
 import queue
 import logging
-from typing import Type, List, Tuple, Sequence, Dict, Optional, Any, Set
+from typing import (
+    Type,
+    List,
+    Tuple,
+    Sequence,
+    Dict,
+    Optional,
+    Any,
+    Set,
+    Callable,
+    Iterable,
+    TYPE_CHECKING,
+)
 from rendercontroller.constants import (
     WAITING,
     RENDERING,
     STOPPED,
     FINISHED,
-    FAILED,
     BLENDER,
     TERRAGEN,
 )
 from rendercontroller.renderthread import (
+    CompletionRecord,
     RenderThread,
     BlenderRenderThread,
+    BlenderWorkerProcess,
+    PersistentBlenderRenderThread,
     Terragen3RenderThread,
 )
-from rendercontroller.util import format_time, Config
+from rendercontroller.util import format_time, output_pattern, Config
+from rendercontroller.stats import NodeStats
+from rendercontroller.scheduler import Dispatcher
+from rendercontroller.pool import WorkerPool
+from rendercontroller.ssh import SSHConnections
+from rendercontroller.agent import AgentConnections, AgentRenderThread
+from rendercontroller.asyncbackend import AsyncioBackend
+from rendercontroller.watchdog import Watchdog
 from rendercontroller.exceptions import JobStatusError, NodeNotFoundError
 from rendercontroller.database import StateDatabase, DBFILE_NAME
 
+if TYPE_CHECKING:
+    from rendercontroller.scheduler import NodeAllocator
 
 threadlock = threading.Lock()
 
+# Confidence level of the bounds given by `RenderJob.estimate_remaining()`. 1.645 => 90%.
+ESTIMATE_Z_SCORE = 1.645
+# Default max seconds `RenderJob.stop()` waits for render processes to be killed.
+STOP_TIMEOUT = 15.0
+
 
 class Executor(object):
     """Manages the execution of a render process on a particular node.
 
     Deep lore: Why does this class even exist? The plan has long been to remove the SSH dependency and
-    run a client on render nodes to manage render processes locally. It's not clear if that will ever
-    materialize because SSH has worked well enough for our purposes so far, but this class was added in
-    the spirit of modularity to provide a generic interface between the frame distribution logic and the
-    render execution logic. If and when the client is implemented, the RenderThreads will live there,
-    which is why we don't want RenderJob to invoke them directly.
+    run a client on render nodes to manage render processes locally. This class was added in the spirit of
+    modularity to provide a generic interface between the frame distribution logic and the render execution
+    logic, which is why we don't want RenderJob to invoke RenderThreads directly.  The client now exists
+    (see `agent.py`): if `agents` is given, frames are rendered by the agent on the node, otherwise by SSH.
     """
 
     def __init__(
@@ -44,14 +74,37 @@ class Executor(object):
         path: str,
         node: str,
         enabled: bool = False,
+        on_update: Optional[Callable[[], None]] = None,
+        completions: Optional["queue.Queue[CompletionRecord]"] = None,
+        pool: Optional[WorkerPool] = None,
+        ssh: Optional[SSHConnections] = None,
+        agents: Optional[AgentConnections] = None,
+        backend: Optional[AsyncioBackend] = None,
+        watchdog: Optional[Watchdog] = None,
     ):
         self.config = config
         self.job_id = job_id
         self.node = node
         self.path = path
         self.enabled = enabled
+        # Passed to RenderThreads, which call it when render progress changes.
+        self.on_update = on_update
+        # Passed to RenderThreads, which post a CompletionRecord to it when the render process exits.
+        self.completions = completions
+        # Passed to RenderThreads, which run on its threads if given.
+        self.pool = pool
+        # Passed to RenderThreads, which run SSH commands over its master connections if given.
+        self.ssh = ssh
+        # If given, frames are rendered by the agent on the render node instead of by SSH.
+        self.agents = agents
+        # If given, SSH render processes are run from its event loop instead of a thread each.
+        self.backend = backend
+        # Passed to RenderThreads, which it fails if the node stops sending output.
+        self.watchdog = watchdog
         self.idle: bool = True
         self.thread: Optional[RenderThread] = None
+        # Number of frames_finished already returned by pop_finished_frames()
+        self._frames_popped = 0
 
         self.logger = logging.getLogger(
             f"{job_id} {os.path.basename(path)} Executor.{node}"
@@ -65,6 +118,11 @@ class Executor(object):
         else:
             raise ValueError("Could not determine render engine from filename.")
         self.logger.debug(f"Set render engine to {self.engine}")
+        # Use a long-running Blender process to render all of this job's frames on this node?
+        self.persistent: bool = self.engine == BLENDER and bool(
+            self.config.get("blender_persistent_worker", False)
+        )
+        self.worker_process: Optional[BlenderWorkerProcess] = None
 
     @property
     def status(self) -> str:
@@ -80,10 +138,51 @@ class Executor(object):
 
     @property
     def frame(self) -> Optional[int]:
+        """Frame currently rendering. If rendering a chunk, this changes as frames are finished."""
+        if self.thread:
+            return self.thread.current_frame
+        return None
+
+    @property
+    def frames(self) -> Tuple[int, ...]:
+        """All frames in the chunk assigned to this node."""
+        if self.thread:
+            return self.thread.frames
+        return ()
+
+    @property
+    def pid(self) -> Optional[int]:
+        """ID of the render process on the node, if known."""
+        if self.thread:
+            return self.thread.pid
+        return None
+
+    @property
+    def output_path(self) -> Optional[str]:
+        """File the last frame was saved to, if the render engine reports it."""
         if self.thread:
-            return self.thread.frame
+            return self.thread.output_path
         return None
 
+    @property
+    def supports_chunks(self) -> bool:
+        """True if the render engine can render more than one frame per process."""
+        return self.engine == BLENDER
+
+    def pop_finished_frames(self) -> List[int]:
+        """Returns frames in the current chunk that have been saved since the last call."""
+        if not self.thread:
+            return []
+        finished = self.thread.frames_finished[self._frames_popped :]
+        self._frames_popped += len(finished)
+        return finished
+
+    def unfinished_frames(self) -> List[int]:
+        """Returns frames in the current chunk that have not been saved."""
+        if self.thread:
+            return self.thread.unfinished_frames()
+        return []
+
     def elapsed_time(self) -> float:
         if self.thread:
             return self.thread.elapsed_time()
@@ -119,18 +218,64 @@ class Executor(object):
         self.logger.debug("Caller acknowledged frame done.")
         self.idle = True
 
-    def render(self, frame: int) -> None:
-        """Renders a frame"""
+    def render(self, frame: int, end_frame: Optional[int] = None) -> None:
+        """Renders a frame, or all frames from `frame` through `end_frame` if `end_frame` is given."""
         if self.thread and self.thread.status == RENDERING:
             raise RuntimeError("Node already has an active render process.")
-        self.logger.debug(f"Assigned frame {frame}")
-        if self.engine == BLENDER:
+        if end_frame is not None and end_frame != frame:
+            if not self.supports_chunks:
+                raise ValueError(f"{self.engine} cannot render more than one frame per process.")
+            self.logger.debug(f"Assigned frames {frame}-{end_frame}")
+        else:
+            self.logger.debug(f"Assigned frame {frame}")
+        if self.agents:
+            self.thread = AgentRenderThread(
+                config=self.config,
+                job_id=self.job_id,
+                node=self.node,
+                path=self.path,
+                frame=frame,
+                on_update=self.on_update,
+                end_frame=end_frame,
+                completions=self.completions,
+                pool=self.pool,
+                watchdog=self.watchdog,
+                agent=self.agents.get(self.node),
+                engine=self.engine,
+            )
+        elif self.engine == BLENDER and self.persistent:
+            if not self.worker_process or not self.worker_process.is_alive():
+                self.worker_process = BlenderWorkerProcess(
+                    self.config, self.job_id, self.node, self.path, ssh=self.ssh
+                )
+            self.thread = PersistentBlenderRenderThread(
+                config=self.config,
+                job_id=self.job_id,
+                node=self.node,
+                path=self.path,
+                frame=frame,
+                on_update=self.on_update,
+                end_frame=end_frame,
+                completions=self.completions,
+                pool=self.pool,
+                watchdog=self.watchdog,
+                ssh=self.ssh,
+                process=self.worker_process,
+            )
+        elif self.engine == BLENDER:
             self.thread = BlenderRenderThread(
                 config=self.config,
                 job_id=self.job_id,
                 node=self.node,
                 path=self.path,
                 frame=frame,
+                on_update=self.on_update,
+                end_frame=end_frame,
+                completions=self.completions,
+                pool=self.pool,
+                watchdog=self.watchdog,
+                ssh=self.ssh,
+                backend=self.backend,
             )
         elif self.engine == TERRAGEN:
             self.thread = Terragen3RenderThread(
@@ -139,9 +284,16 @@ class Executor(object):
                 node=self.node,
                 path=self.path,
                 frame=frame,
+                on_update=self.on_update,
+                completions=self.completions,
+                pool=self.pool,
+                watchdog=self.watchdog,
+                ssh=self.ssh,
+                backend=self.backend,
             )
         else:
             raise RuntimeError("No suitable RenderThread subclass found.")
+        self._frames_popped = 0
         self.idle = False
         self.thread.start()
 
@@ -152,6 +304,31 @@ class Executor(object):
             self.thread.stop()
         self.logger.debug("Executor terminated.")
 
+    def kill(self, timeout: float) -> bool:
+        """Kills the render process and waits up to `timeout` seconds for it to exit.
+
+        :returns: True if the render process is confirmed to have exited, or there was none.
+        """
+        if not self.thread:
+            return True
+        return self.thread.kill(timeout)
+
+    def close(self) -> None:
+        """Releases resources held between frames, i.e. the persistent worker process if there is one.
+
+        Must only be called when the executor is idle.
+        """
+        if self.worker_process:
+            self.worker_process.close()
+            self.worker_process = None
+
+    def reset(self, enabled: bool) -> None:
+        """Prepares the executor to be reused when a job is started again. Must only be called when idle."""
+        self.enabled = enabled
+        self.idle = True
+        self.thread = None
+        self._frames_popped = 0
+
 
 class RenderJob(object):
     """Represents a project to be rendered."""
@@ -169,6 +346,18 @@ class RenderJob(object):
         time_stop: float = 0.0,
         time_offset: float = 0.0,
         frames_completed: Optional[Set[int]] = None,
+        weight: float = 1.0,
+        allocator: Optional["NodeAllocator"] = None,
+        priority: int = 0,
+        chunk_size: int = 1,
+        node_stats: Optional[NodeStats] = None,
+        dispatcher: Optional[Dispatcher] = None,
+        worker_pool: Optional[WorkerPool] = None,
+        ssh: Optional[SSHConnections] = None,
+        agents: Optional[AgentConnections] = None,
+        async_backend: Optional[AsyncioBackend] = None,
+        watchdog: Optional[Watchdog] = None,
+        output_path: str = "",
     ):
         self.config = config
         self.id = id
@@ -184,13 +373,59 @@ class RenderJob(object):
         self.time_start = time_start
         self.time_stop = time_stop
         self.time_offset = time_offset
+        if not (math.isfinite(weight) and weight > 0):
+            raise ValueError("Weight must be a finite number greater than zero.")
+        # Relative share of render nodes this job gets when rendering concurrently with other jobs.
+        self.weight = weight
+        # Jobs with higher priority are started first by autostart.
+        self.priority = priority
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be at least 1.")
+        # Max number of consecutive frames to send to a node at once. See `_next_chunk()`.
+        self.chunk_size = chunk_size
+        # Shares nodes with other jobs. If None, job does not coordinate with other jobs at all.
+        self.allocator = allocator
+        # Render speed history, used to decide which nodes get which frames. Usually shared with other jobs.
+        self.node_stats = node_stats if node_stats else NodeStats()
+        # Calls `dispatch()` when nodes may be ready for frames. Usually shared with other jobs.
+        self.dispatcher = dispatcher if dispatcher else Dispatcher()
+        # Runs render threads. If None, each render thread starts its own thread.
+        self.worker_pool = worker_pool
+        # Persistent SSH connections to render nodes. If None, every SSH command opens a new connection.
+        self.ssh = ssh
+        # Connections to agents on render nodes. If given, they are used instead of SSH.
+        self.agents = agents
+        # Runs SSH render processes from one event loop. If None, each render has a thread.
+        self.async_backend = async_backend
+        # Fails renders on nodes that stop sending output. If None, hung nodes are only detected when they do.
+        self.watchdog = watchdog
+        # Estimated render time of finished frames on an average node, in seconds. See `_estimated_cost()`.
+        self.frame_costs: Dict[int, float] = {}
+        # Render time of each finished frame (or average per frame for chunks), in the order they finished.
+        self.frame_durations: List[float] = []
+        self._straggler_threshold_cache: Tuple[int, Optional[float]] = (0, None)
+        # Where frames are saved, as a path with #s for the frame number. See `util.output_pattern()`.
+        self.output_path = output_path
+        # Last value of `in_flight()` saved to the database.
+        self._in_flight_saved: Dict[str, Dict[str, Any]] = {}
+        # Set by `suspend()`, after which the saved in-flight state is left alone for the next server.
+        self._suspended: bool = False
 
         self._stop: bool = False
         self._test_obj = (
             None  # Unit tests may use this to inject an instrumentation object.
         )
         self.db = StateDatabase(os.path.join(self.config.work_dir, DBFILE_NAME))
-        self.master_thread: threading.Thread
+        # Callables that are invoked as callback(job, old_status) every time the status changes.
+        self.status_listeners: List[Callable[["RenderJob", str], None]] = []
+        # Callables that are invoked as callback(job) when the last queued frame is sent to a node.
+        self.tail_listeners: List[Callable[["RenderJob"], None]] = []
+        # Incremented every time the state reported by `dump()` changes. See `snapshot()`.
+        self.version: int = 0
+        self._snapshot: Optional[Tuple[Tuple[int, int, int], Dict[str, Any], bytes]] = None
+        self._snapshot_lock = threading.Lock()
+        # Set when the job has stopped dispatching frames, i.e. it has finished or was stopped.
+        self._dispatch_done = threading.Event()
         self.executors: Dict[str, Executor] = {}
         self.logger = logging.getLogger(
             f"{self.id} {os.path.basename(self.path)} RenderJob"
@@ -214,6 +449,8 @@ class RenderJob(object):
         # to the offline node, which can result in it not being successfully re-rendered until all other
         # frames have finished, or in certain cases a deadlock.
         self.skip_list: List[str] = []
+        # Nodes rendering a copy of a frame that was stopped because another copy finished first.
+        self._cancelled: Set[str] = set()
 
         self._reset_render_state(render_nodes)
         self.logger.info(
@@ -225,40 +462,146 @@ class RenderJob(object):
             self.render()
 
     def _set_status(self, status: str) -> None:
-        """Sets job status and updates it in database."""
-        with threadlock:  # This method can be called from both public methods and master_thread.
+        """Sets job status, updates it in database and notifies status listeners."""
+        with threadlock:  # This method can be called from both public methods and the dispatcher thread.
+            old = self.status
             self.status = status
             self.db.update_job_status(self.id, status)
+        self._touch()
+        # Call listeners outside the lock so they are free to call back into this job.
+        for callback in list(self.status_listeners):
+            callback(self, old)
+
+    def add_status_listener(self, callback: Callable[["RenderJob", str], None]) -> None:
+        """Registers a callable to be invoked as callback(job, old_status) when job status changes."""
+        if callback not in self.status_listeners:
+            self.status_listeners.append(callback)
+
+    def remove_status_listener(self, callback: Callable[["RenderJob", str], None]) -> None:
+        """Unregisters a status listener. Does nothing if callback is not registered."""
+        if callback in self.status_listeners:
+            self.status_listeners.remove(callback)
+
+    def add_tail_listener(self, callback: Callable[["RenderJob"], None]) -> None:
+        """Registers a callable to be invoked as callback(job) when the job enters its tail (see `in_tail()`)."""
+        if callback not in self.tail_listeners:
+            self.tail_listeners.append(callback)
+
+    def in_tail(self) -> bool:
+        """Returns True if job is rendering and every remaining frame has been sent to a node.
+
+        In this state the job cannot use any more nodes than it already has, and will not be able to
+        until it either finishes or a frame fails and is returned to the queue.
+        """
+        return self.status == RENDERING and not self._stop and self.queue.empty()
 
     def render(self) -> None:
         """Starts the render."""
         if self.status == RENDERING:
             raise JobStatusError("Job is already rendering.")
+        if self._stop and not self._dispatch_done.is_set():
+            # Stopped, but render threads on unresponsive nodes have not finished yet.
+            raise JobStatusError("Job is still stopping.")
         if self.time_start or self.time_stop:
             # Resuming a render
             self.logger.debug("Resetting render state.")
             self._reset_render_state(self.get_enabled_nodes())
         self._set_status(RENDERING)
         self._start_timer()
-        self.master_thread.start()
+        if self.allocator:
+            self.allocator.register(self)
+        self.dispatcher.add(self)
 
-    def stop(self) -> None:
-        """Stops the render and attempts to terminate all active render processes."""
+    def stop(self, timeout: Optional[float] = None) -> List[str]:
+        """Stops the render and terminates all active render processes.
+
+        Render processes on all nodes are killed in parallel, and this returns within `timeout` seconds
+        even if some nodes do not respond.  The job is STOPPED either way, but cannot be started again until
+        the render threads for those nodes have finished.
+
+        :param timeout: Max seconds to wait. Default is `stop_timeout` in config.
+        :returns: Nodes where the render process could not be confirmed killed.
+        """
         if self.status != RENDERING:
             raise JobStatusError("Job is not rendering.")
+        if timeout is None:
+            timeout = self.config.get("stop_timeout", STOP_TIMEOUT)
+        deadline = time.monotonic() + timeout
         self.logger.info("Stopping job.")
-        self._stop = True
-        for executor in self.executors.values():
-            executor.stop()
-        if self.master_thread.is_alive():
-            self.logger.debug(f"Waiting for master thread to exit.")
-            self.master_thread.join()
+        unconfirmed = self._kill_all(deadline)
         self._stop_timer()
         self._set_status(STOPPED)
         elapsed, avg, rem = self.get_times()
         self.logger.info(
             f"Stopped render after {format_time(elapsed)}. Avg time per frame: {format_time(avg)}."
         )
+        if unconfirmed:
+            self.logger.warning(f"Could not confirm render processes were killed on {', '.join(unconfirmed)}.")
+        return unconfirmed
+
+    def suspend(self, timeout: Optional[float] = None) -> List[str]:
+        """Stops the render for a server restart, but leaves the job RENDERING so it resumes when the server
+        starts again.
+
+        Frames that are rendering are saved with `in_flight()` before their render processes are killed like
+        `stop()` does.  When the server starts again, frames that were saved before the processes died are
+        found from their output files, and processes that could not be confirmed killed are killed then.
+
+        :param timeout: Max seconds to wait. Default is `stop_timeout` in config.
+        :returns: Nodes where the render process could not be confirmed killed.
+        """
+        if self.status != RENDERING:
+            raise JobStatusError("Job is not rendering.")
+        if timeout is None:
+            timeout = self.config.get("stop_timeout", STOP_TIMEOUT)
+        deadline = time.monotonic() + timeout
+        self.logger.info("Suspending job for restart.")
+        in_flight = self.in_flight()
+        self._suspended = True
+        self.db.update_job_in_flight(self.id, in_flight)
+        unconfirmed = self._kill_all(deadline)
+        # Processes confirmed killed don't need to be killed again.
+        for node, state in in_flight.items():
+            if node not in unconfirmed:
+                state["pid"] = None
+        self.db.update_job_in_flight(self.id, in_flight)
+        self._stop_timer()
+        if unconfirmed:
+            self.logger.warning(f"Could not confirm render processes were killed on {', '.join(unconfirmed)}.")
+        return unconfirmed
+
+    def _kill_all(self, deadline: float) -> List[str]:
+        """Stops dispatching frames and kills all render processes in parallel, waiting until `deadline`
+        (`time.monotonic()`) at most.
+
+        :returns: Nodes where the render process could not be confirmed killed.
+        """
+        self._stop = True
+        if self.allocator:
+            # This job no longer needs more nodes than it is using.
+            self.allocator.invalidate()
+        confirmed: Dict[str, bool] = {}
+
+        def kill(executor: Executor) -> None:
+            confirmed[executor.node] = executor.kill(max(deadline - time.monotonic(), 0.0))
+
+        threads = []
+        for executor in self.executors.values():
+            if executor.is_idle():
+                continue
+            thread = threading.Thread(target=kill, args=(executor,), daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0.0))
+        self.dispatcher.notify(self)
+        self.logger.debug(f"Waiting for executors to finish.")
+        self._dispatch_done.wait(max(deadline - time.monotonic(), 0.0))
+        return sorted(
+            ex.node
+            for ex in self.executors.values()
+            if not ex.is_idle() and not confirmed.get(ex.node, False)
+        )
 
     def reset_waiting(self) -> None:
         """If job has been stopped, reset status to waiting so it can be started by autostart."""
@@ -277,6 +620,10 @@ class RenderJob(object):
         ex.enable()
         self.logger.info(f"Enabled {node} for rendering.")
         self.db.update_nodes(self.id, self.get_enabled_nodes())
+        self._touch()
+        if self.allocator:
+            self.allocator.invalidate()
+        self.dispatcher.notify(self, node)
 
     def disable_node(self, node: str) -> None:
         """Disables a node for rendering on this job."""
@@ -289,6 +636,52 @@ class RenderJob(object):
         ex.disable()
         self.logger.info(f"Disabled {node} for rendering.")
         self.db.update_nodes(self.id, self.get_enabled_nodes())
+        self._touch()
+        if self.allocator:
+            self.allocator.invalidate()
+
+    def set_weight(self, weight: float) -> None:
+        """Sets the relative share of render nodes this job gets when rendering concurrently with others."""
+        if not (math.isfinite(weight) and weight > 0):
+            raise ValueError("Weight must be a finite number greater than zero.")
+        self.weight = weight
+        self.logger.info(f"Set weight to {weight}.")
+        self.db.update_job_weight(self.id, weight)
+        self._touch()
+        if self.allocator:
+            self.allocator.invalidate()
+            # Other jobs may now be entitled to nodes this job is not using.
+            self.dispatcher.notify_all()
+
+    def set_priority(self, priority: int) -> None:
+        """Sets the priority used to choose which waiting job autostart renders next."""
+        self.priority = priority
+        self.logger.info(f"Set priority to {priority}.")
+        self.db.update_job_priority(self.id, priority)
+        self._touch()
+
+    def node_demand(self) -> int:
+        """Returns the number of nodes this job can currently keep busy."""
+        active = sum(1 for ex in self.executors.values() if not ex.is_idle())
+        if self._stop:
+            return active
+        queued = self.queue.qsize()
+        chunks = math.ceil(queued / self._effective_chunk_size(queued))
+        return min(len(self.get_enabled_nodes()), chunks + active)
+
+    def can_use_node(self, node: str) -> bool:
+        """Returns True if job would send a frame to the node if it were available."""
+        try:
+            ex = self.executors[node]
+        except KeyError:
+            return False
+        return (
+            ex.is_enabled()
+            and ex.is_idle()
+            and node not in self.skip_list
+            and not self._stop
+            and not self.queue.empty()
+        )
 
     def get_progress(self) -> float:
         """Returns percent complete."""
@@ -301,9 +694,14 @@ class RenderJob(object):
 
         If job is rendering but no frames have yet finished, avg_time_per_frame and est_time_remaining
         will both be 0.0. This is obviously not accurate, but less messy than dealing with infinities
-        or multiple return types."""
+        or multiple return types. See `estimate_remaining()` for how est_time_remaining is calculated."""
+        elapsed, avg = self._get_elapsed_and_avg()
+        return elapsed, avg, self.estimate_remaining()[0]
+
+    def _get_elapsed_and_avg(self) -> Tuple[float, float]:
+        """Returns tuple of (elapsed_time, avg_time_per_frame) in seconds."""
         if not self.time_start:
-            return 0.0, 0.0, 0.0
+            return 0.0, 0.0
         if self.time_stop:
             elapsed = self.time_stop - self.time_start
         else:
@@ -312,14 +710,107 @@ class RenderJob(object):
             avg = elapsed / len(self.frames_completed)
         else:
             avg = 0.0
-        rem = (
-            (self.end_frame - self.start_frame + 1) - len(self.frames_completed)
-        ) * avg
-        return elapsed, avg, rem
+        return elapsed, avg
+
+    def estimate_remaining(self) -> Tuple[float, float, float]:
+        """Estimates the time needed to finish rendering the job.
+
+        Each node is assumed to render at its own rate, taken from the moving average of its frame times (see
+        `NodeStats`).  Frames that are rendering count as partly done according to their progress, and the
+        frames left in queue are shared between the enabled nodes (limited to the job's share of nodes if
+        it is sharing them with other jobs) in proportion to their rates.
+
+        The bounds are a 90% confidence interval based on how much each node's frame times vary, so they are
+        close to the estimate for jobs with consistent frame times and far apart when frame times are erratic.
+        If there is no history to base this on (e.g. no frames have finished since the server was started),
+        the estimate is the average time per frame so far times the number of frames left, and the bounds
+        are equal to it.
+
+        :return tuple: (estimate, lower_bound, upper_bound) in seconds.
+        """
+        remaining = (self.end_frame - self.start_frame + 1) - len(self.frames_completed)
+        if remaining <= 0:
+            return 0.0, 0.0, 0.0
+        nodes = self._get_estimate_nodes()
+        stats = {node: self.node_stats.frame_time_stats(self.id, node) for node in nodes}
+        if not nodes or None in stats.values():
+            rem = remaining * self._get_elapsed_and_avg()[1]
+            return rem, rem, rem
+        # Work left on frames that are rendering, in frames.
+        in_flight = {}
+        queued = remaining
+        for node in nodes:
+            executor = self.executors[node]
+            if executor.is_idle():
+                in_flight[node] = 0.0
+                continue
+            unfinished = [f for f in executor.unfinished_frames() if f not in self.frames_completed]
+            queued -= len(unfinished)
+            in_flight[node] = max(0.0, len(unfinished) - executor.progress / 100.0)
+        queued = max(0, queued)
+        # Uncertainty of each node's average frame time, plus the scatter of the frames it has left to
+        # render, which partly averages out over many frames.
+        frames_per_node = queued / len(nodes) + 1
+        alpha = self.node_stats.alpha
+        error = ESTIMATE_Z_SCORE * math.sqrt(alpha / (2 - alpha) + 1 / frames_per_node)
+        estimates = []
+        for sign in (0, -1, 1):
+            frame_times = {}
+            for node, (mean, std) in stats.items():
+                frame_times[node] = max(mean + sign * error * std, mean * 0.1)
+            estimates.append(
+                self._drain_time(
+                    queued,
+                    [(in_flight[node] * t, t) for node, t in frame_times.items()],
+                )
+            )
+        return estimates[0], estimates[1], estimates[2]
+
+    def _get_estimate_nodes(self) -> List[str]:
+        """Returns nodes expected to render the rest of the job: the ones that are rendering, plus the
+        fastest idle enabled nodes up to the job's share if it is sharing nodes with other jobs."""
+        busy = [node for node, ex in self.executors.items() if not ex.is_idle()]
+        idle = [
+            node
+            for node in self.node_stats.rank(self.get_enabled_nodes())
+            if node not in busy
+        ]
+        share = self.allocator.share(self.id) if self.allocator else 0
+        if share:
+            idle = idle[: max(0, share - len(busy))]
+        return busy + idle
+
+    @staticmethod
+    def _drain_time(queued: int, nodes: Sequence[Tuple[float, float]]) -> float:
+        """Returns the time for nodes to finish the frames they are rendering plus `queued` more frames.
+
+        :param int queued: Number of frames that have not been sent to a node.
+        :param nodes: Sequence of (busy, frame_time) tuples where `busy` is the number of seconds until the node
+            finishes the frames it's rendering, and `frame_time` is seconds to render each frame after that.
+        """
+        finish = max((busy for busy, _ in nodes), default=0.0)
+        if queued <= 0 or not nodes:
+            return finish
+        # Frames are treated as divisible, so find t such that nodes have rendered `queued` frames between
+        # them after t seconds, i.e. the sum of (t - busy) / frame_time over nodes that are free before t.
+        done = 0.0
+        rate = 0.0
+        t = 0.0
+        for busy, frame_time in sorted(nodes):
+            if rate and t + (queued - done) / rate <= busy:
+                break
+            done += rate * (busy - t)
+            t = busy
+            rate += 1 / frame_time
+        t += (queued - done) / rate
+        # A frame can't be divided between nodes, so the job can't finish before some node renders a whole one.
+        first_frame = min(busy + frame_time for busy, frame_time in nodes)
+        return max(t, first_frame, finish)
 
     def dump(self) -> Dict[str, Any]:
         """Returns dict of all necessary information to define this job's current state."""
-        elapsed, avg, rem = self.get_times()
+        elapsed, avg = self._get_elapsed_and_avg()
+        rem, rem_low, rem_high = self.estimate_remaining()
         return {
             "id": self.id,
             "path": self.path,
@@ -331,11 +822,57 @@ class RenderJob(object):
             "time_elapsed": elapsed,
             "time_avg_per_frame": avg,
             "time_remaining": rem,
+            "time_remaining_low": rem_low,
+            "time_remaining_high": rem_high,
             "frames_completed": self.frames_completed,
             "progress": self.get_progress(),
             "node_status": self.get_nodes_status(),
+            "weight": self.weight,
+            "priority": self.priority,
+            "chunk_size": self.chunk_size,
+            "node_share": self.allocator.share(self.id) if self.allocator else None,
         }
 
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns a cached copy of `dump()` for status queries, minus `frames_completed`.
+
+        The snapshot is only rebuilt when `version` has changed since the last call, or once per second while
+        rendering so that elapsed and remaining times stay current.  It is shared between callers, so it must
+        be treated as read-only.
+        """
+        return self._get_snapshot()[1]
+
+    def snapshot_json(self) -> bytes:
+        """Returns `snapshot()` serialized as UTF-8 encoded JSON."""
+        return self._get_snapshot()[2]
+
+    def _get_snapshot(self) -> Tuple[Tuple[int, int, int], Dict[str, Any], bytes]:
+        # Read version *before* building the snapshot, so a concurrent change can only make it newer than its key.
+        # The allocator version only matters while the job has a share, otherwise the share is always 0.
+        sharing = self.allocator and (self.status == RENDERING or self.allocator.is_registered(self.id))
+        key = (
+            self.version,
+            self.allocator.version if sharing else 0,
+            int(time.time()) if self.status == RENDERING else 0,
+        )
+        with self._snapshot_lock:
+            if self._snapshot is None or self._snapshot[0] != key:
+                data = self.dump()
+                # frames_completed can potentially be fairly large, and is neither used
+                # by the web UI nor JSON serializable, so just remove it.
+                data.pop("frames_completed")
+                self._snapshot = (key, data, bytes(json.dumps(data), "UTF-8"))
+            return self._snapshot
+
+    def _touch(self) -> None:
+        """Increments `version`. Must be called *after* any change to the state reported by `dump()`."""
+        self.version += 1
+
+    def _executor_updated(self, node: str) -> None:
+        """Called by executors (from their render threads) when their status or progress changes."""
+        self._touch()
+        self.dispatcher.notify(self, node)
+
     def executors_active(self) -> bool:
         """Returns True if any frames are currently rendering, else False."""
         for executor in self.executors.values():
@@ -343,6 +880,34 @@ class RenderJob(object):
                 return True
         return False
 
+    def in_flight(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the frames that are rendering, for restoring the job after a restart or crash.
+
+        :returns: Dict of `{node: {"frames": [...], "pid": ..., "time_start": ...}}` for every node with frames
+            that have not been saved.  `pid` is the render process on the node, or None if not known yet.
+        """
+        ret = {}
+        for node, executor in self.executors.items():
+            if executor.is_idle():
+                continue
+            frames = [f for f in executor.unfinished_frames() if f not in self.frames_completed]
+            if frames:
+                ret[node] = {
+                    "frames": frames,
+                    "pid": executor.pid,
+                    "time_start": executor.thread.time_start,
+                }
+        return ret
+
+    def _save_in_flight(self) -> None:
+        """Saves `in_flight()` to the database if it has changed."""
+        if self._suspended:
+            return
+        in_flight = self.in_flight()
+        if in_flight != self._in_flight_saved:
+            self.db.update_job_in_flight(self.id, in_flight)
+            self._in_flight_saved = in_flight
+
     def get_enabled_nodes(self) -> Tuple[str, ...]:
         return tuple(ex.node for ex in self.executors.values() if ex.is_enabled())
 
@@ -361,12 +926,33 @@ class RenderJob(object):
     def _reset_render_state(self, nodes_enabled: Sequence[str]) -> None:
         """Resets internal state in preparation for rendering."""
         self._stop = False
+        self._suspended = False
+        self._cancelled.clear()
+        executors = {}
         for node in self.config.render_nodes:
             enable = True if node in nodes_enabled else False
-            self.executors[node] = Executor(
-                self.config, self.id, self.path, node, enable
+            if node in self.executors:
+                # Reuse executors from the last time the job was rendered.
+                executors[node] = self.executors[node]
+                executors[node].reset(enable)
+                continue
+            executors[node] = Executor(
+                self.config,
+                self.id,
+                self.path,
+                node,
+                enable,
+                on_update=functools.partial(self._executor_updated, node),
+                completions=self.dispatcher.completions,
+                pool=self.worker_pool,
+                ssh=self.ssh,
+                agents=self.agents,
+                backend=self.async_backend,
+                watchdog=self.watchdog,
             )
-        self.master_thread = threading.Thread(target=self._mainloop, daemon=True)
+        self.executors = executors
+        self._dispatch_done = threading.Event()
+        self._touch()
 
     def _start_timer(self) -> None:
         """Starts the render timer by setting the `time_start` instance variable.
@@ -388,13 +974,15 @@ class RenderJob(object):
             self.time_stop = 0.0
         self.time_start = time.time() - correction
         self.time_offset = 0.0
+        self._touch()
         self.logger.debug(f"Started job timer: {self.time_start}")
         self.db.update_job_time_start(self.id, self.time_start)
 
     def _stop_timer(self) -> None:
         """Stops the render timer."""
-        with threadlock:  # This method can be called from both public methods and master_thread
+        with threadlock:  # This method can be called from both public methods and the dispatcher thread
             self.time_stop = time.time()
+            self._touch()
             self.logger.debug(f"Stopped job timer: {self.time_stop}")
             self.db.update_job_time_stop(self.id, self.time_stop)
 
@@ -407,28 +995,289 @@ class RenderJob(object):
             f"Finished render in {format_time(elapsed)}. Avg time per frame: {format_time(avg)}."
         )
 
+    def _collect_finished_frames(self, executor: Executor) -> None:
+        """Marks frames the executor has saved so far as complete.
+
+        When rendering a chunk, this is called while the executor is still rendering, so frames are
+        marked complete as soon as they are saved rather than when the whole chunk is done.
+        """
+        frames = [f for f in executor.pop_finished_frames() if f not in self.frames_completed]
+        if not frames:
+            # Nothing new, or another copy of the frame finished first. See `_speculate()`.
+            return
+        for frame in frames:
+            self.queue.task_done()
+            self.frames_completed.add(frame)
+            self.logger.info(f"Finished frame {frame} on {executor.node}.")
+            self._stop_copies(frame, executor)
+        self.db.update_job_frames_completed(self.id, self.frames_completed)
+        self._learn_output_path(executor)
+        self._touch()
+
+    def _learn_output_path(self, executor: Executor) -> None:
+        """Updates `output_path` from the file the executor's last frame was saved to, if known."""
+        path = executor.output_path
+        if not path or not executor.thread.frames_finished:
+            return
+        pattern = output_pattern(path, executor.thread.frames_finished[-1])
+        if pattern and pattern != self.output_path:
+            self.output_path = pattern
+            self.logger.debug(f"Frames are saved to {pattern}")
+            self.db.update_job_output_path(self.id, pattern)
+
+    def _rendering_elsewhere(self, frame: int, executor: Executor) -> List[Executor]:
+        """Returns any executors other than `executor` that are rendering a copy of a frame."""
+        return [
+            other
+            for other in self.executors.values()
+            if other is not executor
+            and not other.is_idle()
+            and other.node not in self._cancelled
+            and frame in other.unfinished_frames()
+        ]
+
+    def _stop_copies(self, frame: int, winner: Executor) -> None:
+        """Stops any other copies of a frame that has been finished by `winner`."""
+        for other in self._rendering_elsewhere(frame, winner):
+            self.logger.info(
+                f"Frame {frame} finished first on {winner.node}, stopping copy on {other.node}."
+            )
+            self._cancelled.add(other.node)
+            other.stop()
+
+    def _copy_stopped(self, executor: Executor) -> None:
+        """Prepares a node whose copy of a frame was stopped by `_stop_copies()` to receive a new frame."""
+        self._collect_finished_frames(executor)
+        self._cancelled.discard(executor.node)
+        self._return_to_queue(executor)
+        executor.ack_done()
+        self._release_node(executor.node)
+        self._touch()
+
+    def _return_to_queue(self, executor: Executor) -> List[int]:
+        """Returns an executor's unfinished frames to queue, except those that are being rendered elsewhere."""
+        unfinished = [
+            f
+            for f in executor.unfinished_frames()
+            if f not in self.frames_completed and not self._rendering_elsewhere(f, executor)
+        ]
+        # Put back in reverse order so they come out of the LiFo queue in ascending order.
+        for frame in reversed(unfinished):
+            self.queue.put(frame)
+        if unfinished:
+            self.logger.debug(f"Returned {self._format_frames(unfinished)} to queue.")
+            if self.allocator:
+                # May increase this job's demand.
+                self.allocator.invalidate()
+            # Any idle node may take them.
+            self.dispatcher.notify(self)
+        return unfinished
+
     def _frame_finished(self, executor: Executor) -> None:
-        """Marks a frame as finished and prepares the node to receive a new frame."""
-        self.queue.task_done()
+        """Marks a frame (or chunk) as finished and prepares the node to receive a new frame."""
+        self._collect_finished_frames(executor)
         self.logger.info(
-            f"Finished frame {executor.frame} on {executor.node} after {format_time(executor.elapsed_time())}."
+            f"Finished {self._format_frames(executor.frames)} on {executor.node} "
+            f"after {format_time(executor.elapsed_time())}."
         )
-        self.frames_completed.add(executor.frame)
+        self._record_frame_time(executor)
         executor.ack_done()
-        self.db.update_job_frames_completed(self.id, self.frames_completed)
+        self._release_node(executor.node)
+        self._touch()
         # Frame successfully finished, try to pop a node from skip list
         self._pop_skipped_node()
 
     def _frame_failed(self, executor: Executor) -> None:
-        """Marks a frame as failed and returns it to queue."""
-        self.logger.warning(f"Failed to render {executor.frame} on {executor.node}.")
-        self.queue.put(executor.frame)
-        self.logger.debug(f"Returned frame {executor.frame} to queue.")
+        """Marks a frame (or chunk) as failed and returns any frames that were not saved to queue."""
+        self._collect_finished_frames(executor)
+        self.logger.warning(
+            f"Failed to render {self._format_frames(executor.unfinished_frames())} on {executor.node}."
+        )
+        self._return_to_queue(executor)
         if not self._stop:
             # Doesn't count if failure was because job is being terminated.
             self.skip_list.append(executor.node)
             self.logger.debug(f"Added {executor.node} to skip list.")
         executor.ack_done()
+        self._release_node(executor.node)
+        self._touch()
+
+    @staticmethod
+    def _format_frames(frames: Sequence[int]) -> str:
+        if not frames:
+            return "no frames"
+        if len(frames) == 1:
+            return f"frame {frames[0]}"
+        return f"frames {frames[0]}-{frames[-1]}"
+
+    def _record_frame_time(self, executor: Executor) -> None:
+        """Adds the render time of a finished frame (or chunk) to the node's speed history."""
+        frames = executor.frames
+        if not frames:
+            return
+        seconds = executor.elapsed_time() / len(frames)
+        self.frame_durations.append(seconds)
+        self.node_stats.record(self.id, executor.node, seconds)
+        cost = seconds * self.node_stats.speed(executor.node)
+        for frame in frames:
+            self.frame_costs[frame] = cost
+
+    def _estimated_cost(self, frame: int) -> float:
+        """Estimates how long a frame will take to render on an average node.
+
+        Consecutive frames usually take about the same time to render, so this is the cost of the
+        nearest frame that has been rendered. Returns 0.0 if no frames have been rendered.
+        """
+        if not self.frame_costs:
+            return 0.0
+        nearest = min(self.frame_costs, key=lambda f: (abs(f - frame), f))
+        return self.frame_costs[nearest]
+
+    def _take_heaviest_frame(self) -> int:
+        """Takes the frame with the highest estimated cost from queue. Queue must not be empty."""
+        if not self.frame_costs:
+            return self.queue.get()
+        frames = []
+        while not self.queue.empty():
+            frames.append(self.queue.get())
+        heaviest = max(frames, key=self._estimated_cost)
+        frames.remove(heaviest)
+        for frame in reversed(frames):
+            self.queue.put(frame)
+        return heaviest
+
+    def _expected_finish(self, executor: Executor) -> Optional[float]:
+        """Returns the number of seconds until an executor is expected to finish a new frame if it were sent
+        one as soon as it is free, or None if there is no speed history to base this on."""
+        frame_time = self.node_stats.frame_time(self.id, executor.node)
+        if frame_time is None:
+            return None
+        if executor.is_idle():
+            return frame_time
+        busy = max(0.0, frame_time * len(executor.frames) - executor.elapsed_time())
+        return busy + frame_time
+
+    def _leave_for_faster_node(self, node: str) -> bool:
+        """Returns True if the next frame should be left for faster nodes instead of being sent to `node`.
+
+        Near the end of the job there are fewer frames left than nodes, and the job is not finished until the
+        last of them is. Sending one to a slow node just because it is free can take longer than waiting for a
+        fast node to finish the frame it's working on, so a node is passed over if at least as many other nodes
+        as there are frames left are expected to finish a frame sooner.
+        """
+        queued = self.queue.qsize()
+        if queued >= len(self.executors):
+            return False
+        own = self._expected_finish(self.executors[node])
+        if own is None:
+            return False
+        sooner = 0
+        for other in self.executors.values():
+            if other.node == node or not other.is_enabled() or other.node in self.skip_list:
+                continue
+            if other.is_idle() and self.allocator and self.allocator.owner(other.node) not in ("", self.id):
+                # Busy rendering another job.
+                continue
+            finish = self._expected_finish(other)
+            if finish is not None and finish < own:
+                sooner += 1
+                if sooner >= queued:
+                    return True
+        return False
+
+    def _straggler_threshold(self) -> Optional[float]:
+        """Returns how long a frame may render before a copy of it is sent to another node.
+
+        This is `speculation_factor` (from config) times the 90th percentile of the render times of finished
+        frames, or None if too few frames have finished to tell what is normal for this job.
+        """
+        count = len(self.frame_durations)
+        if count < self.config.get("speculation_min_frames", 3):
+            return None
+        if self._straggler_threshold_cache[0] != count:
+            durations = sorted(self.frame_durations)
+            p90 = durations[int(0.9 * (count - 1))]
+            threshold = p90 * self.config.get("speculation_factor", 2.0)
+            self._straggler_threshold_cache = (count, threshold)
+        return self._straggler_threshold_cache[1]
+
+    def _next_straggler(self) -> Optional[int]:
+        """Returns a frame that has been rendering so long it should be copied to another node, or None."""
+        threshold = self._straggler_threshold()
+        if threshold is None:
+            return None
+        for executor in self.executors.values():
+            if executor.is_idle() or executor.status != RENDERING:
+                continue
+            if executor.node in self._cancelled or len(executor.frames) != 1:
+                # Chunks are not copied. Chunks shrink to 1 frame near the end of the job anyway.
+                continue
+            frame = executor.frames[0]
+            if frame in self.frames_completed or self._rendering_elsewhere(frame, executor):
+                # Already copied.
+                continue
+            if executor.elapsed_time() > threshold:
+                return frame
+        return None
+
+    def _speculate(self, executor: Executor) -> None:
+        """Sends a copy of a straggling frame to an idle node.
+
+        When there are no frames left in queue, one slow or hung node can hold up the whole job. Whichever
+        copy of the frame finishes first is kept and the other is stopped, see `_stop_copies()`.
+        """
+        frame = self._next_straggler()
+        if frame is None or not self._claim_node(executor.node):
+            return
+        self.logger.info(
+            f"Frame {frame} is taking longer than expected, sending a copy to {executor.node}."
+        )
+        executor.render(frame)
+        self._touch()
+
+    def _effective_chunk_size(self, queued: int) -> int:
+        """Returns the number of frames to send to the next node.
+
+        Chunks are limited so the remaining frames are spread over all enabled nodes, otherwise a few nodes
+        would be left rendering large chunks at the end of the job while the rest sit idle.
+        """
+        if self.chunk_size == 1:
+            return 1
+        nodes = max(len(self.get_enabled_nodes()), 1)
+        return max(1, min(self.chunk_size, math.ceil(queued / nodes)))
+
+    def _next_chunk(self, executor: Executor) -> List[int]:
+        """Takes the next chunk of consecutive frames from queue. Queue must not be empty."""
+        queued = self.queue.qsize()
+        if queued <= len(self.get_enabled_nodes()):
+            # Only enough frames left for one per node. Nodes are offered frames fastest first,
+            # so give each the heaviest frame left.
+            return [self._take_heaviest_frame()]
+        size = self._effective_chunk_size(queued)
+        frames = [self.queue.get()]
+        if not executor.supports_chunks:
+            return frames
+        while len(frames) < size and not self.queue.empty():
+            frame = self.queue.get()
+            if frame != frames[-1] + 1:
+                # Not consecutive (e.g. a frame was returned to queue after failing), so leave it for next time.
+                self.queue.put(frame)
+                break
+            frames.append(frame)
+        return frames
+
+    def _claim_node(self, node: str) -> bool:
+        """Claims a node from the allocator. Returns True if job may send a frame to the node."""
+        if not self.allocator:
+            return True
+        return self.allocator.try_claim(self, node)
+
+    def _release_node(self, node: str) -> None:
+        """Returns a node to the allocator after a frame is done."""
+        if self.allocator:
+            self.allocator.release(self, node)
+            # Another job may be waiting for it.
+            self.dispatcher.notify_node(node)
 
     def _pop_skipped_node(self):
         """Removes the oldest node from the skip list."""
@@ -436,18 +1285,33 @@ class RenderJob(object):
             return
         node = self.skip_list.pop(0)
         self.logger.debug(f"Released {node} from skip list.")
+        self.dispatcher.notify(self, node)
+
+    def _frame_done(self, record: CompletionRecord) -> None:
+        """Handles a completion record posted by a render thread when its render process exited."""
+        executor = self.executors.get(record.node)
+        if (
+            not executor
+            or executor.is_idle()
+            or not executor.thread
+            or record.frames != executor.frames
+            or record.time_start != executor.thread.time_start
+        ):
+            self.logger.warning(f"Ignored stale completion record from {record.node}.")
+            return
+        self._collect_finished_frames(executor)
+        if executor.node in self._cancelled:
+            self._copy_stopped(executor)
+        elif record.status == FINISHED:
+            self._frame_finished(executor)
+        else:
+            self._frame_failed(executor)
 
     def _executor_is_ready(self, executor: Executor) -> bool:
         if not executor.is_idle():
-            # Check if executor is done and collect exit status.
-            if executor.status == FINISHED:
-                self._frame_finished(executor)
-            elif executor.status == FAILED:
-                self._frame_failed(executor)
-                return False
-            else:
-                # Executor still rendering
-                return False
+            # Still rendering. Collect any frames saved so far, the rest are handled by `_frame_done()`.
+            self._collect_finished_frames(executor)
+            return False
         if not executor.is_enabled():
             return False
         if executor.node in self.skip_list:
@@ -457,40 +1321,73 @@ class RenderJob(object):
             return False
         return True
 
-    def _mainloop(self) -> None:
-        """Runs in a new threading.Thread.  Manages the rendering of all the frames for this job."""
-        self.logger.debug("Started master thread.")
+    def dispatch(
+        self, nodes: Optional[Iterable[str]] = None, completions: Iterable[CompletionRecord] = ()
+    ) -> None:
+        """Handles finished renders, assigns frames to any nodes that are ready, and cleans up when
+        the job is done.
+
+        Called from the dispatcher thread whenever something happens that may allow a frame to be sent to a
+        node, see `Dispatcher`. Only the nodes concerned are checked, so this is cheap enough to call for
+        every event.
+
+        :param nodes: Nodes to check, or None to check all of them.
+        :param completions: Completion records posted by this job's render threads since the last call.
+        """
         # Counts only used for unit testing.
         if self._test_obj:
-            self._test_obj.reset("outer_count")
             self._test_obj.reset("inner_count")
-        while True:
-            time.sleep(0.01)
+        for record in completions:
+            self._frame_done(record)
+            if nodes is not None:
+                nodes = set(nodes) | {record.node}
+        if self.skip_list and len(self.skip_list) >= len(self.get_enabled_nodes()):
+            self.logger.debug(f"All nodes are in skip list. Releasing oldest one.")
+            self._pop_skipped_node()
+
+        # Check status of nodes, fastest first, and assign frames.
+        if nodes is None:
+            nodes = self.config.render_nodes
+        for node in self.node_stats.rank(nodes):
             if self._test_obj:
-                self._test_obj.inc("outer_count")
-            if self._stop:
-                # Stop requested, but keep going until all executors have finished and we have ack'd them.
-                if not self.executors_active():
-                    self.logger.debug("All executors done. Stopping mainloop")
-                    break
-            elif self.queue.empty() and not self.executors_active():
-                self._render_finished()
-                break
+                self._test_obj.inc("inner_count")
+            executor = self.executors[node]
+            if not self._executor_is_ready(executor):
+                continue
+            if self.queue.empty():
+                if self.config.get("speculative_execution", False):
+                    self._speculate(executor)
+            elif not self._leave_for_faster_node(node) and self._claim_node(node):
+                frames = self._next_chunk(executor)
+                self.logger.info(f"Sending {self._format_frames(frames)} to {node}.")
+                executor.render(frames[0], frames[-1])
+                self._touch()
+                if self.queue.qsize() == 0:
+                    self.logger.debug("Sent last queued frame.")
+                    if self.allocator:
+                        # Job can use no more nodes than it has now, so others may be entitled to more.
+                        self.allocator.invalidate()
+                    for callback in list(self.tail_listeners):
+                        callback(self)
 
-            if self.skip_list and len(self.skip_list) >= len(self.get_enabled_nodes()):
-                self.logger.debug(f"All nodes are in skip list. Releasing oldest one.")
-                self._pop_skipped_node()
+        self._save_in_flight()
+        if self._stop:
+            # Stop requested, but wait until all executors have finished and we have ack'd them.
+            if not self.executors_active():
+                self.logger.debug("All executors done. Stopping dispatch.")
+                self._dispatch_finished()
+        elif self.queue.empty() and not self.executors_active():
+            self._render_finished()
+            self._dispatch_finished()
 
-            # Iterate through nodes, check status, and assign frames.
-            if self._test_obj:
-                self._test_obj.reset("inner_count")
-            for node in self.config.render_nodes:
-                if self._test_obj:
-                    self._test_obj.inc("inner_count")
-                executor = self.executors[node]
-                if self._executor_is_ready(executor) and not self.queue.empty():
-                    frame = self.queue.get()
-                    self.logger.info(f"Sending frame {frame} to {node}.")
-                    executor.render(frame)
-
-        self.logger.debug("Master thread exited.")
+    def _dispatch_finished(self) -> None:
+        """Releases resources held while rendering, after the last executor has finished."""
+        self.dispatcher.remove(self)
+        for executor in self.executors.values():
+            executor.close()
+        if self.allocator:
+            self.allocator.unregister(self)
+            # Other jobs may now claim the nodes this job was entitled to.
+            self.dispatcher.notify_all()
+        self._dispatch_done.set()
+        self.logger.debug("Stopped dispatching frames.")
@@ -0,0 +1,114 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("pool")
+
+
+class WorkerPool(object):
+    """A bounded pool of reusable threads that run render threads' workers.
+
+    Each render of a frame (or chunk) needs a thread to run the render process and parse its output.
+    Instead of starting a new thread for every frame, `RenderThread.start()` submits its worker to the
+    pool, which runs it on an idle thread if there is one.  New threads are only started when all existing
+    threads are busy, up to `max_threads`.  If that limit is reached, workers wait in a FIFO queue until a
+    thread is free.  Threads that have been idle for `idle_timeout` seconds exit, so the pool shrinks
+    again when nothing is rendering.
+    """
+
+    def __init__(self, max_threads: int, idle_timeout: float = 60.0):
+        """
+        :param int max_threads: Maximum number of threads.
+        :param float idle_timeout: Seconds a thread waits for work before exiting.
+        """
+        if max_threads < 1:
+            raise ValueError("Pool must have at least one thread.")
+        self.max_threads = max_threads
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._tasks: "queue.SimpleQueue[Optional[Callable[[], None]]]" = queue.SimpleQueue()
+        self._threads = 0
+        # Threads waiting for a task that has not been submitted yet.
+        self._idle = 0
+        # Tasks submitted while all threads were busy and the pool was full.
+        self._waiting = 0
+        self._shutdown = False
+        # Counters for `metrics()`.
+        self._time_created = time.monotonic()
+        self._threads_created = 0
+        self._threads_peak = 0
+        self._tasks_submitted = 0
+
+    def submit(self, task: Callable[[], None]) -> None:
+        """Runs a callable on a pool thread."""
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Worker pool has been shut down.")
+            self._tasks_submitted += 1
+            self._tasks.put(task)
+            if self._idle:
+                # One of the idle threads will take it.
+                self._idle -= 1
+            elif self._threads < self.max_threads:
+                self._start_thread()
+            else:
+                self._waiting += 1
+                logger.warning(f"All {self.max_threads} worker threads are busy, task must wait.")
+
+    def _start_thread(self) -> None:
+        """Starts a new thread. Must be called with `_lock` held."""
+        self._threads += 1
+        self._threads_created += 1
+        self._threads_peak = max(self._threads_peak, self._threads)
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self) -> None:
+        while True:
+            try:
+                task = self._tasks.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    if not self._idle:
+                        # A task was submitted for this thread, it just hasn't been taken yet.
+                        continue
+                    self._idle -= 1
+                    self._threads -= 1
+                return
+            if task is None:
+                # Shutdown
+                return
+            try:
+                task()
+            except Exception:
+                logger.exception("Task raised an exception.")
+            with self._lock:
+                if self._waiting:
+                    # Take the next task that has been waiting for a free thread.
+                    self._waiting -= 1
+                else:
+                    self._idle += 1
+
+    def metrics(self) -> Dict[str, float]:
+        """Returns thread counts and the rates at which threads are started and tasks are submitted."""
+        with self._lock:
+            minutes = max(time.monotonic() - self._time_created, 1.0) / 60.0
+            return {
+                "threads": self._threads,
+                "threads_busy": self._threads - self._idle,
+                "threads_peak": self._threads_peak,
+                "max_threads": self.max_threads,
+                "tasks_waiting": self._waiting,
+                "threads_created": self._threads_created,
+                "tasks_submitted": self._tasks_submitted,
+                "threads_created_per_min": self._threads_created / minutes,
+                "tasks_submitted_per_min": self._tasks_submitted / minutes,
+            }
+
+    def shutdown(self) -> None:
+        """Stops idle threads. Threads that are running a task exit when it is done."""
+        with self._lock:
+            self._shutdown = True
+            for _ in range(self._threads):
+                self._tasks.put(None)
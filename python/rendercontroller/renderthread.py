@@ -1,12 +1,13 @@
+import asyncio
 import time
 import threading
 import logging
-import shutil
 import subprocess
 import os.path
 import re
 import shlex
-from typing import Type, Optional
+import queue
+from typing import Type, Optional, Callable, List, Tuple, Sequence, NamedTuple, Union, TYPE_CHECKING
 from rendercontroller.constants import (
     WAITING,
     RENDERING,
@@ -15,40 +16,189 @@ from rendercontroller.constants import (
     LOG_EVERYTHING,
 )
 from rendercontroller.util import Config
+from rendercontroller.pool import WorkerPool
+from rendercontroller.ssh import SSHConnections, ssh_command
+
+# Seconds a render process has to exit after SIGTERM before it is sent SIGKILL.
+KILL_GRACE = 5.0
+
+if TYPE_CHECKING:
+    from rendercontroller.asyncbackend import AsyncioBackend
+    from rendercontroller.watchdog import Watchdog
+
+
+class CompletionRecord(NamedTuple):
+    """Posted by a RenderThread to its completion queue when the render process exits."""
+
+    job_id: str
+    node: str
+    frames: Tuple[int, ...]  # All frames in the chunk
+    frames_finished: Tuple[int, ...]  # Frames that were saved
+    status: str  # FINISHED or FAILED
+    time_start: float
+    time_stop: float
+    pid: Optional[int]
+
+
+class FrameLoggerAdapter(logging.LoggerAdapter):
+    """Prefixes log messages with the frame being rendered.
+
+    Render threads are created for every frame, but loggers live as long as the program does, so the
+    frame is added to messages rather than to the logger name.
+    """
+
+    def process(self, msg, kwargs):
+        return f"frame {self.extra['frame']}: {msg}", kwargs
 
 
 class RenderThread(object):
-    """Base class for thread objects that handle rendering a single frame with a particular render engine.
+    """Base class for thread objects that handle rendering a frame, or a contiguous range of frames (a chunk)
+    in a single process, with a particular render engine.
 
     At a minimum, subclasses must implement the `worker` and `stop` methods, and assign values to the
     public instance variables described below.
 
         status: str = Status of render process: WAITING, RENDERING, FINISHED, or FAILED.
-        progress: float = Percent progress of this render process.
+        progress: float = Percent progress of the frame currently rendering.
+
+    Subclasses must also call `frame_saved()` every time a frame is written to disk. This sets the status
+    to FINISHED once every frame in the chunk has been saved.  If the process fails partway through a
+    chunk, `frames_finished` tells the caller which frames do not have to be rendered again.
+
+    Observers may pass an `on_update` callable, which is called with no arguments every time `progress` or
+    `status` changes or a frame is saved.
+
+    If a `WorkerPool` is given, `worker()` runs on one of the pool's threads instead of a new thread.
+    If `SSHConnections` are given, SSH commands run over the node's persistent master connection.
+    If an `AsyncioBackend` is given, `worker_async()` runs in the backend's event loop instead of `worker()`
+    running in a thread.  Only subclasses that implement `worker_async()` accept a backend.
 
     Timers: This class includes two built-in timers: a render timer and a timeout timer. The render timer
     measures the total time taken to render a frame. The timeout timer measures the time since the last
-    update received from the render process. The base class does not implement any action when the timeout
-    limit is exceeded, so subclasses should implement it as appropriate.
+    update received from the render process, and subclasses must reset it every time they receive one.
+    If a `Watchdog` is given, it calls `timed_out()` when the timeout limit is exceeded, even if the worker
+    is blocked waiting for output.
     """
 
     def __init__(
-        self, config: Type[Config], job_id: str, node: str, path: str, frame: int
+        self,
+        config: Type[Config],
+        job_id: str,
+        node: str,
+        path: str,
+        frame: int,
+        on_update: Optional[Callable[[], None]] = None,
+        end_frame: Optional[int] = None,
+        completions: Optional["queue.Queue[CompletionRecord]"] = None,
+        pool: Optional[WorkerPool] = None,
+        ssh: Optional[SSHConnections] = None,
+        backend: Optional["AsyncioBackend"] = None,
+        watchdog: Optional["Watchdog"] = None,
     ):
         self.config = config
+        self.job_id = job_id
         self.node = node
         self.path = path
-        self.frame = frame
-        self.status = WAITING
-        self.progress: float = 0.0
-        self.logger = logging.getLogger(
-            f"{job_id} {os.path.basename(self.path)} {self.__class__.__name__} frame {frame} on {node}"
+        self.frame = frame  # First frame of chunk
+        self.end_frame = end_frame if end_frame is not None else frame
+        if self.end_frame < self.frame:
+            raise ValueError("End frame cannot be less than start frame.")
+        self.frames: Tuple[int, ...] = tuple(range(self.frame, self.end_frame + 1))
+        # Frames that have been saved, in the order they were saved. Only appended to by the worker thread.
+        self.frames_finished: List[int] = []
+        self._status = WAITING
+        self.on_update = on_update
+        self.completions = completions
+        # ID of the render process, if known.
+        self.pid: Optional[int] = None
+        # File the last frame was saved to, if the render engine reports it.
+        self.output_path: Optional[str] = None
+        self._progress: float = 0.0
+        self.logger = FrameLoggerAdapter(
+            logging.getLogger(
+                f"{job_id} {os.path.basename(self.path)} {self.__class__.__name__} on {node}"
+            ),
+            {"frame": frame},
         )
-        self.thread = threading.Thread(target=self.worker, daemon=True)
+        # Checked once rather than for every line of output, which is almost never logged.
+        self.log_output = self.logger.isEnabledFor(LOG_EVERYTHING)
+        self.pool = pool
+        self.ssh = ssh
+        self.backend = backend
+        self.watchdog = watchdog
+        # Local SSH process that is running the render, if any.
+        self.proc: Optional[Union[subprocess.Popen, asyncio.subprocess.Process]] = None
+        self.thread: Optional[threading.Thread] = None
+        if not pool and not backend:
+            self.thread = threading.Thread(target=self._run, daemon=True)
         self.time_start: float = 0.0
         self.time_stop: float = 0.0
         self.timeout_timer: float = 0.0
 
+    @property
+    def progress(self) -> float:
+        return self._progress
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @status.setter
+    def status(self, value: str) -> None:
+        if value == self._status:
+            return
+        self._status = value
+        if self.on_update:
+            self.on_update()
+
+    @property
+    def current_frame(self) -> int:
+        """Returns the frame that is rendering, i.e. the first frame in the chunk that has not been saved."""
+        for frame in self.frames:
+            if frame not in self.frames_finished:
+                return frame
+        return self.frames[-1]
+
+    def unfinished_frames(self) -> List[int]:
+        """Returns frames in the chunk that have not been saved."""
+        return [frame for frame in self.frames if frame not in self.frames_finished]
+
+    def frame_saved(self, frame: Optional[int] = None) -> None:
+        """Records that a frame has been saved. Must be called by subclasses after each frame is written.
+
+        :param frame: Frame number that was saved. If None or not an unfinished frame in this chunk,
+            the current frame is assumed.
+        """
+        if frame not in self.frames or frame in self.frames_finished:
+            frame = self.current_frame
+            if frame in self.frames_finished:
+                self.logger.warning("Frame saved, but every frame in chunk is already done.")
+                return
+        self.frames_finished.append(frame)
+        # Saving a frame is proof of life, so restart the timeout timer for the next one.
+        self.timeout_timer = time.time()
+        if len(self.frames_finished) == len(self.frames):
+            self.status = FINISHED
+        if self.on_update:
+            self.on_update()
+
+    @progress.setter
+    def progress(self, value: float) -> None:
+        self._progress = value
+        if self.on_update:
+            self.on_update()
+
+    def update_progress(self, value: float) -> None:
+        """Sets `progress`, but only notifies observers when the whole-number percentage changes.
+
+        Render engines may report progress thousands of times per frame, so subclasses should use this
+        when parsing their output.
+        """
+        if int(value) != int(self._progress):
+            self.progress = value
+        else:
+            self._progress = value
+
     def elapsed_time(self) -> float:
         """Returns time taken to render the frame in seconds."""
         if not self.time_start:
@@ -61,7 +211,12 @@ class RenderThread(object):
         """Spawns worker thread and starts the render."""
         self.time_start = time.time()
         self.timeout_timer = time.time()
-        self.thread.start()
+        if self.backend:
+            self.backend.submit(self._run_async())
+        elif self.pool:
+            self.pool.submit(self._run)
+        else:
+            self.thread.start()
 
     def is_timed_out(self) -> bool:
         """Returns True if `timeout_timer` exceeds the value for `node_timeout` set in config.
@@ -71,9 +226,9 @@ class RenderThread(object):
         The `node_timeout` threshold represents the maximum time we will wait between successive updates
         from the node, *not* the max total render time.
 
-        Subclasses may choose whether and how to make use of this in their `worker()` implementation,
-        but generally this method should be called every time an update is received from the server, and
-        if it returns True the caller should treat the frame as failed.
+        Subclasses should reset `timeout_timer` every time an update is received from the node.  Without a
+        `Watchdog`, they may also call this method before resetting it, and if it returns True treat the
+        frame as failed.
         """
         if (
             self.timeout_timer
@@ -89,6 +244,63 @@ class RenderThread(object):
         """Must be implemented by subclasses.  This method should terminate the active render process."""
         raise NotImplementedError
 
+    def kill(self, timeout: float) -> bool:
+        """Kills the render process and waits up to `timeout` seconds for it to exit.
+
+        Unlike `stop()`, this blocks, so callers stopping several renders should call it from a thread for
+        each.  If the process cannot be confirmed dead in time, the worker stops waiting for it anyway, so
+        the render thread always finishes soon after.
+
+        :param float timeout: Max seconds to wait, including the time to reach the node.
+        :returns: True if the render process is confirmed to have exited.
+        """
+        if self.status != RENDERING:
+            return True
+        confirmed = self._kill(timeout)
+        if not confirmed:
+            self.logger.warning(f"Could not confirm render process was killed within {timeout:.0f} seconds.")
+            self._abort()
+        return confirmed
+
+    def _kill(self, timeout: float) -> bool:
+        """Kills the render process and its process group by SSH and waits for them to exit.
+
+        Subclasses that do not run the render by SSH must override this.
+        """
+        if not self.pid:
+            self.logger.warning(
+                "Thread is rendering but no pid value is set. Unable to kill process."
+            )
+            return False
+        self.logger.info(f"Killing pid={self.pid}")
+        return ssh_kill(self.node, self.pid, timeout, self.ssh)
+
+    def timed_out(self) -> None:
+        """Fails the render because no update was received from the node for `node_timeout` seconds.
+
+        Called by the `Watchdog` from its own thread, so it must not block.  Kills the render process and
+        makes the worker stop waiting for output, so it exits and posts its completion record.
+        """
+        if self.status != RENDERING:
+            return
+        self.logger.warning("Failed to render: timed out")
+        self.stop()
+        self.status = FAILED
+        self._abort()
+
+    def _abort(self) -> None:
+        """Makes the worker stop waiting for output from the node.  Must not block.
+
+        The base implementation kills the local SSH process, so reading its output returns EOF.
+        """
+        proc = self.proc
+        if proc is None:
+            return
+        if self.backend:
+            self.backend.loop.call_soon_threadsafe(_kill_process, proc)
+        else:
+            _kill_process(proc)
+
     def worker(self) -> None:
         """Must be implemented by subclasses.
 
@@ -98,21 +310,157 @@ class RenderThread(object):
         """
         raise NotImplementedError
 
+    async def worker_async(self) -> None:
+        """Same as `worker()`, but runs as a task in the event loop of an `AsyncioBackend`.
+
+        Optional for subclasses.  Must not block the event loop.
+        """
+        raise NotImplementedError
+
+    def _ssh_render(self, cmd: str) -> None:
+        """Runs a render command on the node by SSH and parses its output with `parse_line()`, until the
+        status is no longer RENDERING.  For subclasses' `worker()`.
+        """
+        self.proc = subprocess.Popen(ssh_command(self.node, cmd, self.ssh), stdout=subprocess.PIPE)
+        for line in iter(self.proc.stdout.readline, ""):
+            if self.status != RENDERING:
+                break
+            if self.is_timed_out():
+                self.status = FAILED
+                self.logger.warning("Failed to render: timed out")
+                break
+            self.timeout_timer = time.time()
+            self.parse_line(line)
+
+    async def _ssh_render_async(self, cmd: str) -> None:
+        """Runs a render command on the node by SSH and parses its output with `parse_line()`, until the
+        status is no longer RENDERING.  For subclasses' `worker_async()`.
+        """
+        if self.ssh:
+            # Checking the master connection may block.
+            args = await asyncio.get_running_loop().run_in_executor(
+                None, ssh_command, self.node, cmd, self.ssh
+            )
+        else:
+            args = ssh_command(self.node, cmd)
+        proc = self.proc = await asyncio.create_subprocess_exec(*args, stdout=subprocess.PIPE)
+        try:
+            while self.status == RENDERING:
+                line = await proc.stdout.readline()
+                if self.is_timed_out():
+                    self.status = FAILED
+                    self.logger.warning("Failed to render: timed out")
+                    break
+                self.timeout_timer = time.time()
+                self.parse_line(line)
+        finally:
+            # SSH exits when the render process does. Don't wait for it here, but keep reading its output
+            # so it cannot block on a full pipe.
+            self.backend.spawn(proc.communicate())
+
+    async def _ssh_kill_async(self) -> None:
+        """Kills the remote render process by SSH, from the backend's event loop."""
+        self.logger.info(f"Attempting to kill pid={self.pid}")
+        if self.ssh:
+            args = await asyncio.get_running_loop().run_in_executor(
+                None, ssh_command, self.node, kill_command(self.pid), self.ssh
+            )
+        else:
+            args = ssh_command(self.node, kill_command(self.pid))
+        proc = await asyncio.create_subprocess_exec(*args)
+        await proc.wait()
+
+    def _start_kill(self) -> None:
+        """Starts killing the remote render process by SSH without waiting for it."""
+        if self.backend:
+            self.backend.submit(self._ssh_kill_async())
+        else:
+            # In a new thread in case SSH connection is slow.
+            threading.Thread(target=self._ssh_kill_thread).start()
+
+    def _ssh_kill_thread(self) -> None:
+        """Encapsulates ssh kill command in a new thread in case SSH connection is slow."""
+        self.logger.info(f"Attempting to kill pid={self.pid}")
+        subprocess.call(ssh_command(self.node, kill_command(self.pid), self.ssh))
+        self.logger.debug("ssh kill thread exited")
+
+    def completion_record(self) -> CompletionRecord:
+        """Returns a record of the outcome of this render."""
+        return CompletionRecord(
+            job_id=self.job_id,
+            node=self.node,
+            frames=self.frames,
+            frames_finished=tuple(self.frames_finished),
+            status=self.status,
+            time_start=self.time_start,
+            time_stop=self.time_stop,
+            pid=self.pid,
+        )
+
+    def _run(self) -> None:
+        """Runs `worker()`, then posts a `CompletionRecord` to `completions`.
+
+        The status in the record is always FINISHED or FAILED, even if the worker raised an exception or
+        returned without setting either.
+        """
+        self._begin()
+        try:
+            self.worker()
+        except Exception:
+            self.logger.exception("Worker raised an exception.")
+            self.status = FAILED
+        self._finish()
+
+    async def _run_async(self) -> None:
+        """Same as `_run()`, but runs `worker_async()`."""
+        self._begin()
+        try:
+            await self.worker_async()
+        except Exception:
+            self.logger.exception("Worker raised an exception.")
+            self.status = FAILED
+        self._finish()
+
+    def _begin(self) -> None:
+        """Starts the timeout timer and the watchdog once the worker is actually running.
+
+        This may be long after `start()` if the worker pool or event loop is busy, and the render must not
+        time out while it is still waiting for its turn.
+        """
+        self.timeout_timer = time.time()
+        if self.watchdog:
+            self.watchdog.watch(self)
+
+    def _finish(self) -> None:
+        if self.watchdog:
+            self.watchdog.unwatch(self)
+        if self.status != FINISHED and self.status != FAILED:
+            self.logger.warning(f"Worker exited with status {self.status}, assuming failed.")
+            self.status = FAILED
+        if not self.time_stop:
+            self.stop_render_timer()
+        if self.completions is not None:
+            self.completions.put(self.completion_record())
+
 
 class BlenderRenderThread(RenderThread):
     """Handles rendering a single frame in Blender.
 
-    Works with Cycles and Eevee, tested with Blender version 2.93.7 on MacOS and Linux.
+    Works with Cycles and Eevee, tested with Blender version 2.93.7 on MacOS and Linux.  Chunks of more than
+    one frame are rendered as an animation (`-s`/`-e`/`-a`) in a single Blender process.
     """
 
+    # Frame number and progress from a progress line, in one pass.  Supports both Blender output formats:
+    #   Cycles: "Fra:1 Mem:10.00M | ... | Rendered 5/10 Tiles"
+    #   Eevee:  "Fra:1 Mem:10.00M | ... | Rendering 25 / 100 samples"
+    progress_pattern = re.compile(
+        rb"Fra:([0-9]+)(?:.*Render(?:ed ([0-9]+)/([0-9]+) Tiles|ing\s+([0-9]+)\s+/\s+([0-9]+)\s+samples))?"
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.pid: Optional[int] = None
-        # Allow multiple regex patterns to support the different Blender output formats
-        self.patterns = (
-            re.compile("Rendered ([0-9]+)/([0-9]+) Tiles"),  # Cycles
-            re.compile("Rendering\s+([0-9]+)\s+/\s+([0-9]+)\s+samples"),  # Eevee
-        )
+        # Frame number reported by the most recent progress line.
+        self.rendering_frame: Optional[int] = None
         if self.node in self.config.macs:
             self.execpath = self.config.blenderpath_mac
         else:
@@ -130,69 +478,245 @@ class BlenderRenderThread(RenderThread):
                 "Thread is rendering but no pid value is set. Unable to kill process."
             )
             return
-        kill_thread = threading.Thread(target=self._ssh_kill_thread)
-        kill_thread.start()
+        self._start_kill()
 
-    def _ssh_kill_thread(self):
-        """Encapsulates ssh kill command in a new thread in case SSH connection is slow."""
-        self.logger.info(f"Attempting to kill pid={self.pid}")
-        subprocess.call([shutil.which("ssh"), self.node, f"kill {self.pid}"])
-        self.logger.debug("ssh kill thread exited")
+    def render_command(self) -> str:
+        """Returns the shell command that renders the frames on the node and prints the render process's PID."""
+        if len(self.frames) == 1:
+            frames = f"-f {self.frame}"
+        else:
+            # Blender processes args in order, so range must be set before -a.
+            frames = f"-s {self.frame} -e {self.end_frame} -a"
+        return background_command(
+            f"{shlex.quote(self.execpath)} -b -noaudio {shlex.quote(self.path)} {frames}"
+        )
 
     def worker(self) -> None:
         """Runs in a new threading.Thread and renders the specified frame."""
         self.logger.debug("Started worker thread.")
         self.status = RENDERING
-        if self.node in self.config.macs:
-            # Blender may be upper case in MacOS, but Linux pgrep implementations may lack -i option.
-            pgrep = "pgrep -i -n blender"
-        else:
-            pgrep = "pgrep -n blender"
-        cmd = f"{shlex.quote(self.execpath)} -b -noaudio {shlex.quote(self.path)} -f {self.frame} & {pgrep}"
-        proc = subprocess.Popen(
-            [shutil.which("ssh"), self.node, cmd], stdout=subprocess.PIPE
-        )
-        for line in iter(proc.stdout.readline, ""):
-            if self.status != RENDERING:
-                break
-            if self.is_timed_out():
-                self.status = FAILED
-                self.logger.warning("Failed to render: timed out")
-                break
-            self.parse_line(line)
+        self._ssh_render(self.render_command())
         self.stop_render_timer()
         self.logger.debug("Worker thread exited.")
 
+    async def worker_async(self) -> None:
+        """Same as `worker()`, for `AsyncioBackend`."""
+        self.logger.debug("Started worker task.")
+        self.status = RENDERING
+        await self._ssh_render_async(self.render_command())
+        self.stop_render_timer()
+        self.logger.debug("Worker task exited.")
+
+    @classmethod
+    def parse_progress(cls, bline: bytes) -> Tuple[Optional[int], Optional[float]]:
+        """Returns the frame number and percent progress from a line of Blender output, or None for either
+        if the line does not include it."""
+        m = cls.progress_pattern.match(bline)
+        if not m:
+            return None, None
+        frame, rendered, total, sample, samples = m.groups()
+        if rendered is None:
+            rendered, total = sample, samples
+        if not total or total == b"0":
+            return int(frame), None
+        return int(frame), int(rendered) / int(total) * 100
+
+    @staticmethod
+    def parse_saved_path(bline: bytes) -> str:
+        """Returns the file path from a Blender `Saved:` line.
+
+        Blender 2.8+ prints `Saved: '/path/0001.png'`, older versions `Saved: /path/0001.png Time: ...`.
+        """
+        path = _decode(bline[6:]).strip()
+        if path.startswith("'"):
+            return path[1:].partition("'")[0]
+        return path.split(" Time:")[0]
+
     def parse_line(self, bline: bytes) -> None:
-        try:
-            line: str = bline.decode("UTF-8").strip("\n")
-        except UnicodeDecodeError:
-            self.logger.exception(f"Failed to decode line to UTF-8")
-            return
-        if not line:  # Broken pipe
+        # Blender prints many lines for every frame, most of them progress lines, so each line is
+        # identified by its first bytes and only decoded if it is logged.
+        if not bline:  # Broken pipe
             self.status = FAILED
             self.logger.warning("Failed to render: broken pipe.")
             return
-        self.logger.log(level=LOG_EVERYTHING, msg=f'STDOUT "{line}"')
+        if self.log_output:
+            self.logger.log(LOG_EVERYTHING, f'STDOUT "{_decode(bline)}"')
         # Try to get progress from rendered parts
-        if line.startswith("Fra:"):
-            for regex in self.patterns:
-                m = regex.search(line)
-                if m:
-                    rendered, total = m.group(1), m.group(2)
-                    self.progress = int(rendered) / int(total) * 100
-                    return
+        if bline.startswith(b"Fra:"):
+            frame, progress = self.parse_progress(bline)
+            if frame is not None:
+                self.rendering_frame = frame
+            if progress is not None:
+                self.update_progress(progress)
+            return
+
+        # Detect if frame has finished rendering
+        if bline.startswith(b"Saved:"):
+            self.logger.debug(f"Detected frame {self.rendering_frame} saved.")
+            self.output_path = self.parse_saved_path(bline)
+            self.frame_saved(self.rendering_frame)
+            return
+
         # Detect PID from first return line
         # Convoluted because Popen.pid is the local ssh process, not the remote blender process.
-        if line.strip().isdigit():
-            self.pid = int(line.strip())
+        if bline[:1].isdigit() and bline.strip().isdigit():
+            self.pid = int(bline.strip())
             self.logger.info(f"Detected pid={self.pid}.")
+
+
+class BlenderWorkerProcess(object):
+    """A long-running Blender process on a render node that renders frames it receives on stdin.
+
+    The project file is loaded once when the process starts, and then any number of frames can be rendered
+    without reloading it. See `blender_worker.py` for the protocol.  Frames are rendered by
+    `PersistentBlenderRenderThread`, and only one thread may use the process at a time.
+    """
+
+    def __init__(
+        self,
+        config: Type[Config],
+        job_id: str,
+        node: str,
+        path: str,
+        ssh: Optional[SSHConnections] = None,
+    ):
+        self.config = config
+        self.node = node
+        self.path = path
+        self.ssh = ssh
+        self.proc: Optional[subprocess.Popen] = None
+        # PID of the remote Blender process. Set by PersistentBlenderRenderThread when the worker reports it.
+        self.pid: Optional[int] = None
+        self.logger = logging.getLogger(
+            f"{job_id} {os.path.basename(self.path)} {self.__class__.__name__} on {node}"
+        )
+        if self.node in self.config.macs:
+            self.execpath = self.config.blenderpath_mac
+        else:
+            self.execpath = self.config.blenderpath_linux
+
+    def start(self) -> None:
+        """Starts Blender and loads the project file."""
+        script_path = os.path.join(os.path.dirname(__file__), "blender_worker.py")
+        with open(script_path, "r") as f:
+            script = f.read()
+        cmd = (
+            f"{shlex.quote(self.execpath)} -b -noaudio {shlex.quote(self.path)} "
+            f"--python-expr {shlex.quote(script)}"
+        )
+        self.proc = subprocess.Popen(
+            ssh_command(self.node, cmd, self.ssh),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.logger.info("Started persistent Blender worker.")
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def send_frames(self, frames: Sequence[int]) -> None:
+        """Tells the worker to render frames, which it does one at a time in order."""
+        self.proc.stdin.write("".join(f"{frame}\n" for frame in frames).encode("UTF-8"))
+        self.proc.stdin.flush()
+
+    def readline(self) -> bytes:
+        return self.proc.stdout.readline()
+
+    def close(self) -> None:
+        """Tells the worker to exit after it finishes any frames it has already been sent."""
+        if not self.is_alive():
             return
+        self.logger.debug("Closing persistent Blender worker.")
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
 
-        # Detect if frame has finished rendering
-        if line.startswith("Saved:"):
-            self.status = FINISHED
-            self.logger.debug("Detected frame saved.")
+    def kill(self, timeout: Optional[float] = None) -> bool:
+        """Terminates the worker immediately.
+
+        :param timeout: Max seconds to wait for the worker to exit, or None to wait as long as it takes.
+        :returns: True if the worker is confirmed to have exited.
+        """
+        confirmed = False
+        if self.pid:
+            self.logger.info(f"Attempting to kill pid={self.pid}")
+            confirmed = ssh_kill(self.node, self.pid, timeout, self.ssh)
+        if self.is_alive():
+            self.proc.terminate()
+        return confirmed
+
+
+class PersistentBlenderRenderThread(BlenderRenderThread):
+    """Renders a frame or chunk of frames with a `BlenderWorkerProcess` instead of starting a new process.
+
+    If the worker process is not running, it is started first.  If rendering fails, the worker is killed
+    so it cannot report stale results to the next thread, and a new one will be started for the next frame.
+    """
+
+    def __init__(self, *args, process: BlenderWorkerProcess, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.process = process
+        self.pid = process.pid
+
+    def stop(self) -> None:
+        """Stops the render by killing the worker process."""
+        if not self.status == RENDERING:
+            return
+        kill_thread = threading.Thread(target=self.process.kill)
+        kill_thread.start()
+
+    def _kill(self, timeout: float) -> bool:
+        return self.process.kill(timeout)
+
+    def _abort(self) -> None:
+        """Kills the local SSH process of the worker, so reading its output returns EOF."""
+        if self.process.proc is not None:
+            _kill_process(self.process.proc)
+
+    def worker(self) -> None:
+        """Runs in a new threading.Thread and renders the specified frames."""
+        self.logger.debug("Started worker thread.")
+        self.status = RENDERING
+        try:
+            if not self.process.is_alive():
+                self.process.start()
+            self.process.send_frames(self.frames)
+        except OSError:
+            self.logger.exception("Failed to send frames to persistent worker.")
+            self.status = FAILED
+        while self.status == RENDERING:
+            if self.is_timed_out():
+                self.status = FAILED
+                self.logger.warning("Failed to render: timed out")
+                break
+            line = self.process.readline()
+            self.timeout_timer = time.time()
+            self.parse_line(line)
+        if self.status == FAILED:
+            # Bounded, so an unreachable node cannot keep the render thread from finishing.
+            self.process.kill(timeout=2 * KILL_GRACE)
+        self.stop_render_timer()
+        self.logger.debug("Worker thread exited.")
+
+    def parse_line(self, bline: bytes) -> None:
+        if not bline.startswith(b"RC_"):
+            if bline.startswith(b"Saved:"):
+                # Completion is reported by RC_DONE instead.
+                self.output_path = self.parse_saved_path(bline)
+                return
+            return super().parse_line(bline)
+        parts = bline.decode("UTF-8", errors="replace").split(maxsplit=2)
+        self.logger.log(level=LOG_EVERYTHING, msg=f'STDOUT "{" ".join(parts)}"')
+        if parts[0] == "RC_READY" and len(parts) > 1 and parts[1].isdigit():
+            self.pid = self.process.pid = int(parts[1])
+            self.logger.info(f"Worker ready with pid={self.pid}.")
+        elif parts[0] == "RC_DONE" and len(parts) > 1 and parts[1].isdigit():
+            self.logger.debug(f"Detected frame {parts[1]} saved.")
+            self.frame_saved(int(parts[1]))
+        elif parts[0] == "RC_ERROR":
+            self.status = FAILED
+            self.logger.warning(f"Failed to render: {' '.join(parts[1:])}")
 
 
 class Terragen3RenderThread(RenderThread):
@@ -200,11 +724,13 @@ class Terragen3RenderThread(RenderThread):
 
     Terragen 3 is quite outdated, so this class is only being included to avoid removing a major feature without
     prior warning.  It's not clear if support for Terragen 4 will be added or if Terragen will be dropped entirely.
+    Chunks are not supported, so it always renders exactly one frame.
     """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.pid: Optional[int] = None
+        if len(self.frames) > 1:
+            raise ValueError("Terragen cannot render more than one frame per process.")
         if self.node in self.config.macs:
             self.execpath = self.config.terragenpath_mac
         else:
@@ -222,66 +748,63 @@ class Terragen3RenderThread(RenderThread):
                 "Thread is rendering but no pid value is set. Unable to kill process."
             )
             return
-        kill_thread = threading.Thread(target=self._ssh_kill_thread)
-        kill_thread.start()
+        self._start_kill()
 
-    def _ssh_kill_thread(self):
-        """Encapsulates ssh kill command in a new thread in case SSH connection is slow."""
-        self.logger.info(f"Attempting to kill pid={self.pid}")
-        subprocess.call([shutil.which("ssh"), self.node, f"kill {self.pid}"])
-        self.logger.debug("ssh kill thread exited")
+    def render_command(self) -> str:
+        """Returns the shell command that renders the frame on the node and prints the render process's PID."""
+        cmd = background_command(
+            f"{shlex.quote(self.execpath)} -p {shlex.quote(self.path)} -hide -exit -r -f {self.frame}"
+        )
+        return f"{cmd}; wait"
 
     def worker(self) -> None:
         """Runs in a new threading.Thread and renders the specified frame."""
         self.logger.debug("Started worker thread.")
         self.status = RENDERING
-        if self.node in self.config.macs:
-            # Terragen may be upper case in MacOS, but Linux pgrep implementations may lack -i option.
-            pgrep = "pgrep -i -n terragen"
-        else:
-            pgrep = "pgrep -n terragen"
-        cmd = (
-            f"{shlex.quote(self.execpath)} -p {shlex.quote(self.path)} -hide "
-            + f"-exit -r -f {self.frame} & {pgrep} & wait"
-        )
-        proc = subprocess.Popen(
-            [shutil.which("ssh"), self.node, cmd], stdout=subprocess.PIPE
-        )
-        for line in iter(proc.stdout.readline, ""):
-            if self.status != RENDERING:
-                break
-            if self.is_timed_out():
-                self.status = FAILED
-                self.logger.warning("Failed to render: timed out")
-                break
-            self.parse_line(line)
+        self._ssh_render(self.render_command())
         self.stop_render_timer()
         self.logger.debug("Worker thread exited.")
 
-    def parse_line(self, bline: bytes) -> None:
+    async def worker_async(self) -> None:
+        """Same as `worker()`, for `AsyncioBackend`."""
+        self.logger.debug("Started worker task.")
+        self.status = RENDERING
+        await self._ssh_render_async(self.render_command())
+        self.stop_render_timer()
+        self.logger.debug("Worker task exited.")
+
+    @classmethod
+    def parse_progress(cls, bline: bytes) -> Optional[float]:
+        """Returns the percent progress from a "Rendering" line of Terragen output, e.g.
+        "Rendering pre pass... 40%", or None if it has none."""
+        end = bline.find(b"%")
+        if end < 0:
+            return None
         try:
-            line: str = bline.decode("UTF-8")
-        except UnicodeDecodeError:
-            self.logger.exception(f"Failed to decode line to UTF-8")
-            return
-        if not line:  # Broken pipe
+            return float(bline[bline.rfind(b" ", 0, end) + 1 : end])
+        except ValueError:
+            return None
+
+    def parse_line(self, bline: bytes) -> None:
+        if not bline:  # Broken pipe
             self.status = FAILED
             self.logger.warning("Failed to render: broken pipe.")
             return
-        self.logger.log(level=LOG_EVERYTHING, msg=f'STDOUT "{line}"')
+        if self.log_output:
+            self.logger.log(LOG_EVERYTHING, f'STDOUT "{_decode(bline)}"')
         # Terragen prints percent progress during render pass, so try to find that.
-        if line.startswith("Rendering"):
+        if bline.startswith(b"Rendering"):
             # NOTE: terragen ALWAYS has at least 2 passes, so progress will go to 100% at least twice.
             # We could track pass names, but probably not worth the effort since it doesn't affect
             # overall render progress.
-            for part in line.split():
-                if "%" in part:
-                    self.progress = float(part[:-1])
-                    return
+            progress = self.parse_progress(bline)
+            if progress is not None:
+                self.update_progress(progress)
+            return
 
         # Try to detect PID
-        if line.strip().isdigit():
-            pid = int(line.strip())
+        if bline[:1].isdigit() and bline.strip().isdigit():
+            pid = int(bline.strip())
             # Terragen echos the frame number at the start of the render, so we must ignore that.
             # If PID happens to be the same as the frame number, then this just means we cannot automatically
             # kill the remote render process if job is stopped. Not ideal, but not the end of the world.
@@ -291,6 +814,78 @@ class Terragen3RenderThread(RenderThread):
             return
 
         # Detect if frame has finished rendering
-        if line.startswith("Finished"):
-            self.status = FINISHED
+        if bline.startswith(b"Finished"):
             self.logger.debug("Detected frame finished.")
+            self.frame_saved(self.frame)
+
+
+def background_command(cmd: str) -> str:
+    """Returns a shell command that starts `cmd` in the background and prints its PID.
+
+    Where `setsid` is available (Linux), the process is started in a process group of its own, so anything
+    it starts is killed along with it by `kill_command()`.
+    """
+    return f"if command -v setsid >/dev/null 2>&1; then setsid {cmd} & else {cmd} & fi; echo $!"
+
+
+def kill_command(pid: int, grace: float = KILL_GRACE, match: Optional[str] = None) -> str:
+    """Returns a shell command that kills a process and waits for it to exit.
+
+    If the process leads a process group, the whole group is killed.  Otherwise, the process and its
+    children are.  They are sent SIGTERM, and SIGKILL if still running after `grace` seconds.  The command
+    exits with status 0 once they have exited, or 1 if they are still running 2 seconds after SIGKILL.
+
+    :param match: If given, the process is only killed if its command line contains this string, e.g. the
+        project file path.  Used when the PID may have been reused since it was recorded.
+    """
+    steps = max(int(grace * 2), 1)  # Checked every half second
+    check = ""
+    if match is not None:
+        check = f"ps -o args= -p $p 2>/dev/null | grep -qF -- {shlex.quote(match)} || exit 0; "
+    return (
+        f"p={int(pid)}; {check}"
+        "alive() { kill -0 -- -$p 2>/dev/null || kill -0 $p 2>/dev/null; }; "
+        "sig() { kill -$1 -- -$p 2>/dev/null || { pkill -$1 -P $p; kill -$1 $p; } 2>/dev/null; }; "
+        "sig TERM; i=0; "
+        "while alive; do "
+        f"i=$((i+1)); [ $i -eq {steps} ] && sig KILL; [ $i -gt {steps + 4} ] && exit 1; sleep 0.5; "
+        "done; exit 0"
+    )
+
+
+def ssh_kill(
+    node: str,
+    pid: int,
+    timeout: Optional[float],
+    connections: Optional[SSHConnections] = None,
+    match: Optional[str] = None,
+) -> bool:
+    """Kills a process on a node with `kill_command()` by SSH.
+
+    :param timeout: Max seconds to wait, including the time to reach the node, or None for no limit.
+    :param match: See `kill_command()`.
+    :returns: True if the process is confirmed to have exited.
+    """
+    try:
+        result = subprocess.run(
+            ssh_command(node, kill_command(pid, match=match), connections),
+            timeout=timeout,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    except subprocess.TimeoutExpired:
+        return False
+    return result.returncode == 0
+
+
+def _decode(bline: bytes) -> str:
+    """Decodes a line of output for logging."""
+    return bline.decode("UTF-8", errors="replace").rstrip("\r\n")
+
+
+def _kill_process(proc) -> None:
+    """Kills a local `subprocess.Popen` or `asyncio.subprocess.Process`, if it is still running."""
+    try:
+        proc.kill()
+    except ProcessLookupError:
+        pass
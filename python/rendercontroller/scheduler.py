@@ -0,0 +1,295 @@
+import threading
+import logging
+import queue
+import time
+from typing import Dict, List, Sequence, Tuple, Set, Optional, Union, TYPE_CHECKING
+from rendercontroller.renderthread import CompletionRecord
+
+if TYPE_CHECKING:
+    from rendercontroller.job import RenderJob
+
+logger = logging.getLogger("scheduler")
+
+
+def fair_shares(capacity: int, jobs: Sequence[Tuple[str, float, int]]) -> Dict[str, int]:
+    """Divides a number of render nodes between jobs in proportion to their weights.
+
+    Jobs that cannot use their full proportional share are given only what they can use, and the surplus
+    is divided between the remaining jobs (i.e. water-filling).  Fractional shares are rounded with the
+    largest remainder method, favoring jobs that appear earlier in `jobs` when remainders are equal.
+
+    :param int capacity: Number of nodes to divide.
+    :param jobs: Sequence of (job_id, weight, demand) tuples, where `demand` is the maximum number of nodes
+        the job is able to use.  Weights must be positive.
+    :return dict: Mapping of job ID to number of nodes.
+    """
+    shares = {job_id: 0 for job_id, _, _ in jobs}
+    active = [(job_id, weight, demand) for job_id, weight, demand in jobs if demand > 0]
+    remaining = capacity
+    while active and remaining > 0:
+        total = sum(weight for _, weight, _ in active)
+        satisfied = [j for j in active if j[2] <= remaining * j[1] / total]
+        if not satisfied:
+            break
+        for job_id, weight, demand in satisfied:
+            shares[job_id] = demand
+            remaining -= demand
+        active = [j for j in active if j not in satisfied]
+    if not active or remaining <= 0:
+        return shares
+    total = sum(weight for _, weight, _ in active)
+    exact = {job_id: remaining * weight / total for job_id, weight, _ in active}
+    for job_id in exact:
+        shares[job_id] = int(exact[job_id])
+    leftover = remaining - sum(shares[job_id] for job_id in exact)
+    by_remainder = sorted(
+        enumerate(exact), key=lambda i: (shares[i[1]] - exact[i[1]], i[0])
+    )
+    for _, job_id in by_remainder[:leftover]:
+        shares[job_id] += 1
+    return shares
+
+
+class NodeAllocator(object):
+    """Shares render nodes between jobs that are rendering at the same time.
+
+    Render jobs register with the allocator when they start rendering and must claim a node with
+    `try_claim()` before sending it a frame, then `release()` it when the frame is done.  A node can only
+    be claimed by one job at a time.  Each job is entitled to a share of the nodes proportional to its
+    weight (see `fair_shares()`), but nodes are never left idle just to honor the shares: a job that is
+    already using its share may still claim a node as long as no other job below its share is able to
+    use it. Frames are never preempted, so when a new job starts it takes over nodes as they finish
+    the frames they're working on.
+
+    Computing the shares asks every job for its demand and enabled nodes, so they are cached until a job
+    registers or unregisters, or `invalidate()` is called.  Jobs call it when their weight, enabled nodes or
+    demand change materially (e.g. the last queued frame was sent or frames were returned to queue), not for
+    every frame.  Shares may therefore be briefly stale, which only affects which job gets a free node first:
+    a job that can no longer use a node never holds it back from others (see `_contended()`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, "RenderJob"] = {}
+        self._owners: Dict[str, str] = {}  # Node -> ID of job rendering on it
+        self._usage: Dict[str, int] = {}  # Job ID -> number of nodes claimed
+        # Incremented whenever shares may have changed, so callers can cache them.
+        self.version: int = 0
+        self._cached_shares: Tuple[int, Dict[str, int]] = (-1, {})
+
+    def register(self, job: "RenderJob") -> None:
+        """Adds a job to the set of jobs sharing nodes."""
+        with self._lock:
+            self._jobs[job.id] = job
+            self._usage.setdefault(job.id, 0)
+            self.version += 1
+        logger.debug(f"Registered job {job.id}")
+
+    def unregister(self, job: "RenderJob") -> None:
+        """Removes a job and releases any nodes it still holds."""
+        with self._lock:
+            self._jobs.pop(job.id, None)
+            self._usage.pop(job.id, None)
+            for node in [n for n, owner in self._owners.items() if owner == job.id]:
+                del self._owners[node]
+            self.version += 1
+        logger.debug(f"Unregistered job {job.id}")
+
+    def _shares(self) -> Dict[str, int]:
+        """Returns each registered job's share, recomputing it only if `version` has changed."""
+        if self._cached_shares[0] == self.version:
+            return self._cached_shares[1]
+        capacity: Set[str] = set()
+        demands = []
+        for job in self._jobs.values():
+            capacity.update(job.get_enabled_nodes())
+            demands.append((job.id, job.weight, job.node_demand()))
+        shares = fair_shares(len(capacity), demands)
+        self._cached_shares = (self.version, shares)
+        return shares
+
+    def _contended(self, job: "RenderJob", node: str, shares: Dict[str, int]) -> bool:
+        """Returns True if another job that is below its share is able to use the node."""
+        for other in self._jobs.values():
+            if other is job:
+                continue
+            if self._usage[other.id] < shares[other.id] and other.can_use_node(node):
+                return True
+        return False
+
+    def try_claim(self, job: "RenderJob", node: str) -> bool:
+        """Claims a node for a job if it is free and the job is entitled to it.
+
+        :return bool: True if node was claimed and job may send it a frame.
+        """
+        with self._lock:
+            if job.id not in self._jobs or node in self._owners:
+                return False
+            shares = self._shares()
+            if self._usage[job.id] >= shares[job.id] and self._contended(job, node, shares):
+                return False
+            self._owners[node] = job.id
+            self._usage[job.id] += 1
+            return True
+
+    def release(self, job: "RenderJob", node: str) -> None:
+        """Releases a node claimed by a job."""
+        with self._lock:
+            if self._owners.get(node) != job.id:
+                return
+            del self._owners[node]
+            self._usage[job.id] -= 1
+
+    def invalidate(self) -> None:
+        """Signals that a job's weight, enabled nodes or demand changed, which may change everyone's share."""
+        with self._lock:
+            self.version += 1
+
+    def share(self, job_id: str) -> int:
+        """Returns the number of nodes a job is currently entitled to."""
+        with self._lock:
+            if job_id not in self._jobs:
+                return 0
+            return self._shares()[job_id]
+
+    def is_registered(self, job_id: str) -> bool:
+        """Returns True if a job is currently sharing nodes."""
+        return job_id in self._jobs
+
+    def owner(self, node: str) -> str:
+        """Returns ID of the job currently rendering on a node, or empty string if node is free."""
+        return self._owners.get(node, "")
+
+
+class Dispatcher(object):
+    """Sends frames to render nodes for all rendering jobs, from a single thread.
+
+    Rather than each job polling its nodes, the thread blocks on a queue of events that may allow a frame
+    to be sent to a node: a render thread made progress, a node was enabled or freed by another job, a frame
+    was returned to queue, etc.  Render threads also post a `CompletionRecord` to the same queue
+    (`completions`) when the render process exits, which is how jobs learn that a frame finished or failed.
+    Each event names a job and, usually, the one node it concerns, and only those nodes are checked by
+    `RenderJob.dispatch()`, so the work done is proportional to the number of events rather than the number
+    of nodes.  Events that arrive while the thread is busy are merged, so a burst of progress updates from
+    one node costs one check.
+
+    Every job is also checked in full once per `interval` seconds.  This catches decisions that depend
+    only on the passage of time, such as copying a straggling frame to an idle node.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        """
+        :param float interval: Seconds between full checks of every job.
+        """
+        self.interval = interval
+        # Holds CompletionRecords and (job_id, node) tuples, where None means all jobs or all nodes.
+        self.completions: "queue.Queue[Union[CompletionRecord, Tuple[Optional[str], Optional[str]], None]]"
+        self.completions = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, "RenderJob"] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._shutdown = False
+
+    def add(self, job: "RenderJob") -> None:
+        """Starts dispatching frames for a job. The job is removed with `remove()` when it is done."""
+        with self._lock:
+            self._jobs[job.id] = job
+            if not self._thread:
+                self._thread = threading.Thread(target=self._mainloop, daemon=True)
+                self._thread.start()
+        self.completions.put((job.id, None))
+        logger.debug(f"Dispatching job {job.id}")
+
+    def remove(self, job: "RenderJob") -> None:
+        """Stops dispatching frames for a job."""
+        with self._lock:
+            if self._jobs.get(job.id) is job:
+                del self._jobs[job.id]
+        logger.debug(f"Stopped dispatching job {job.id}")
+
+    def notify(self, job: "RenderJob", node: Optional[str] = None) -> None:
+        """Schedules a check of a job's nodes.
+
+        :param job: Job to check.
+        :param node: Node to check, or None to check all of the job's nodes.
+        """
+        self.completions.put((job.id, node))
+
+    def notify_node(self, node: str) -> None:
+        """Schedules a check of a node for every job, e.g. because one job has stopped using it."""
+        self.completions.put((None, node))
+
+    def notify_all(self) -> None:
+        """Schedules a full check of every job, e.g. because the jobs' shares of nodes have changed."""
+        self.completions.put((None, None))
+
+    def shutdown(self) -> None:
+        """Stops the dispatcher thread."""
+        self._shutdown = True
+        self.completions.put(None)
+        if self._thread:
+            self._thread.join()
+
+    def _next_events(
+        self, deadline: float
+    ) -> Tuple[Dict[str, Optional[Set[str]]], Dict[str, List[CompletionRecord]], float]:
+        """Waits for events until `deadline` (a `time.monotonic()` value), then merges all that are waiting.
+
+        :return: Tuple of (nodes to check, completion records, time of the next full check). Nodes to check
+            are keyed by job ID, with None meaning all nodes.  Events for jobs that are not being dispatched
+            are discarded.
+        """
+        items = []
+        try:
+            items.append(self.completions.get(timeout=max(0.0, deadline - time.monotonic())))
+            while True:
+                items.append(self.completions.get_nowait())
+        except queue.Empty:
+            pass
+        with self._lock:
+            job_ids = list(self._jobs)
+        events: Dict[str, Optional[Set[str]]] = {}
+        records: Dict[str, List[CompletionRecord]] = {}
+
+        def check(job_id: str, node: Optional[str]) -> None:
+            if job_id not in events:
+                events[job_id] = None if node is None else {node}
+            elif node is None:
+                events[job_id] = None
+            elif events[job_id] is not None:
+                events[job_id].add(node)
+
+        for item in items:
+            if item is None:
+                continue  # Shutdown
+            if isinstance(item, CompletionRecord):
+                records.setdefault(item.job_id, []).append(item)
+                check(item.job_id, item.node)
+                continue
+            job_id, node = item
+            for j in job_ids if job_id is None else [job_id]:
+                check(j, node)
+        if time.monotonic() >= deadline:
+            for job_id in job_ids:
+                events[job_id] = None
+            deadline = time.monotonic() + self.interval
+        for job_id in [j for j in events if j not in job_ids]:
+            del events[job_id]
+            if records.pop(job_id, None):
+                logger.warning(f"Discarded completion records for job {job_id}, which is not dispatching.")
+        return events, records, deadline
+
+    def _mainloop(self) -> None:
+        logger.debug("Started dispatcher thread.")
+        deadline = time.monotonic() + self.interval
+        while not self._shutdown:
+            events, records, deadline = self._next_events(deadline)
+            for job_id, nodes in events.items():
+                job = self._jobs.get(job_id)
+                if not job:
+                    continue
+                try:
+                    job.dispatch(nodes, records.get(job_id, ()))
+                except Exception:
+                    logger.exception(f"Failed to dispatch frames for job {job_id}")
+        logger.debug("Dispatcher thread exited.")
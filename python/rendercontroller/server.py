@@ -3,13 +3,14 @@ import http.server
 from http import HTTPStatus
 import json
 from json import JSONDecodeError
+import math
 import os
 import yaml
 import signal
 import selectors
 import socketserver
 import urllib.parse
-from typing import Sequence, Optional, Dict, List, Any, Union
+from typing import Sequence, Optional, Dict, List, Any
 from rendercontroller.controller import RenderController
 from rendercontroller.exceptions import JobNotFoundError, NodeNotFoundError
 from rendercontroller.util import Config, list_dir
@@ -29,6 +30,17 @@ logging.addLevelName(LOG_EVERYTHING, "EVERYTHING")
 logger = logging.getLogger("server")
 
 
+def parse_weight(value: Any) -> float:
+    """Converts a job weight from a request to a float.
+
+    Raises ValueError unless it is a finite number greater than zero, so `nan` and `inf` are rejected.
+    """
+    weight = float(value)
+    if not (math.isfinite(weight) and weight > 0):
+        raise ValueError(f"Invalid weight '{value}'")
+    return weight
+
+
 class ParsedPath(object):
     def __init__(self, parts: Sequence[str], query: Optional[str]) -> None:
         self.parts: Sequence[str] = parts
@@ -102,7 +114,7 @@ class TCPServer(ShutdownableTCPServer):
 
     def stop(self):
         logger.info("Shutting down")
-        self.controller.shutdown()
+        self.controller.shutdown(restart=self.controller.config.get("resume_on_restart", False))
         logger.debug("Attempting to stop TCP server")
         # super().shutdown()
         self.server_close()
@@ -128,20 +140,25 @@ class HttpHandler(http.server.SimpleHTTPRequestHandler):
         to handler method names.
     :param dict[str, str] config_handlers: Mapping of config endpoint options
         to handler method names.
+    :param dict[str, str] metrics_handlers: Mapping of metrics endpoint options
+        to handler method names.
     """
 
     controller: RenderController
     origin: str
     file_browser_base_dir: str
-    get_endpoints = {"job", "node", "config"}
+    get_endpoints = {"job", "node", "config", "metrics"}
     post_endpoints = {"job", "node", "storage", "config"}
     job_handlers = {
         "new": "new_job",
+        "new_batch": "new_job_batch",
         "info": "job_data",
         "start": "start_job",
         "stop": "stop_job",
         "delete": "delete_job",
         "reset_status": "reset_job_status",
+        "weight": "set_job_weight",
+        "priority": "set_job_priority",
     }
     node_handlers = {
         "list": "list_nodes",
@@ -150,6 +167,7 @@ class HttpHandler(http.server.SimpleHTTPRequestHandler):
     }
     storage_handlers = {"ls": "list_directory"}
     config_handlers = {"autostart": "configure_autostart"}
+    metrics_handlers = {"workers": "worker_metrics"}
 
     def __init__(self, *args, **kwargs) -> None:
         self._parsed_path: Optional[ParsedPath] = None
@@ -280,7 +298,15 @@ class HttpHandler(http.server.SimpleHTTPRequestHandler):
         :param data: Response data. Can be any JSON-serializable type.
         :param int code: HTTP response code.
         """
-        bdata = bytes(json.dumps(data), "UTF-8")
+        self.send_json_bytes(bytes(json.dumps(data), "UTF-8"), code)
+
+    def send_json_bytes(self, bdata: bytes, code: int = HTTPStatus.OK) -> None:
+        """
+        Sends a response that has already been serialized as JSON
+
+        :param bytes bdata: UTF-8 encoded JSON.
+        :param int code: HTTP response code.
+        """
         self.send_all_headers(code, "application/json; charset=UTF-8", len(bdata))
         self.wfile.write(bdata)
 
@@ -321,16 +347,16 @@ class HttpHandler(http.server.SimpleHTTPRequestHandler):
 
     def job_data(self) -> None:
         """Sends info about a render job."""
-        data: Union[Dict[str, Any], List[Dict[str, Any]]]
         if self.parsed_path.target:
             # Send data for specified job
-            data = self.controller.get_job_data(self.parsed_path.target)
-            if not data:
+            try:
+                data = self.controller.get_job_data_json(self.parsed_path.target)
+            except JobNotFoundError:
                 return self.send_error(HTTPStatus.NOT_FOUND, "Job ID not found")
         else:
             # No job ID specified, so send data about *all* jobs
-            data = self.controller.get_all_job_data()
-        self.send_json(data)
+            data = self.controller.get_all_job_data_json()
+        self.send_json_bytes(data)
 
     def start_job(self) -> None:
         """Starts a render job."""
@@ -351,10 +377,10 @@ class HttpHandler(http.server.SimpleHTTPRequestHandler):
             self.send_error(HTTPStatus.BAD_REQUEST, "Job ID not specified")
             return
         try:
-            self.controller.stop(self.parsed_path.target)
+            unconfirmed = self.controller.stop(self.parsed_path.target)
         except JobNotFoundError:
             return self.send_error(HTTPStatus.NOT_FOUND, "Job ID not found")
-        self.send_all_headers()
+        self.send_json({"unconfirmed": unconfirmed})
 
     def delete_job(self):
         """Deletes a render job."""
@@ -380,6 +406,42 @@ class HttpHandler(http.server.SimpleHTTPRequestHandler):
             return self.send_error(HTTPStatus.NOT_FOUND, "Job ID not found")
         self.send_all_headers()
 
+    def set_job_weight(self):
+        """Sets the relative share of render nodes a job gets when rendering concurrently with others."""
+        if not self.parsed_path.target:
+            logger.warning("Job ID not specified in '%s'" % self.parsed_path)
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Job ID not specified")
+        try:
+            weight = parse_weight(self.parsed_path.parts[3])
+        except IndexError:
+            return self.send_error(HTTPStatus.BAD_REQUEST, "No weight specified")
+        except ValueError:
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Invalid weight")
+        try:
+            self.controller.set_weight(self.parsed_path.target, weight)
+        except JobNotFoundError:
+            return self.send_error(HTTPStatus.NOT_FOUND, "Job ID not found")
+        except ValueError:
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Invalid weight")
+        self.send_all_headers()
+
+    def set_job_priority(self):
+        """Sets the priority used to choose which waiting job is started next."""
+        if not self.parsed_path.target:
+            logger.warning("Job ID not specified in '%s'" % self.parsed_path)
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Job ID not specified")
+        try:
+            priority = int(self.parsed_path.parts[3])
+        except IndexError:
+            return self.send_error(HTTPStatus.BAD_REQUEST, "No priority specified")
+        except ValueError:
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Invalid priority")
+        try:
+            self.controller.set_priority(self.parsed_path.target, priority)
+        except JobNotFoundError:
+            return self.send_error(HTTPStatus.NOT_FOUND, "Job ID not found")
+        self.send_all_headers()
+
     def new_job(self):
         """Creates a new render job and places it in queue."""
         data = self.receive_json()
@@ -388,11 +450,19 @@ class HttpHandler(http.server.SimpleHTTPRequestHandler):
             start = int(data["start_frame"])
             end = int(data["end_frame"])
             nodes = data["nodes"]
+            weight = parse_weight(data.get("weight", 1.0))
+            priority = int(data.get("priority", 0))
+            chunk_size = int(data.get("chunk_size", 1))
         except KeyError:
             logger.exception("New job request missing required data")
             return self.send_error(HTTPStatus.BAD_REQUEST, "Missing required data")
+        except (TypeError, ValueError) as e:
+            logger.warning(f"New job request has invalid data: {e}")
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Invalid data", str(e))
         try:
-            job_id = self.controller.new_job(path, start, end, nodes)
+            job_id = self.controller.new_job(
+                path, start, end, nodes, weight, priority, chunk_size
+            )
         except Exception as e:
             logger.exception("Error while creating job")
             error = str(e)
@@ -403,6 +473,52 @@ class HttpHandler(http.server.SimpleHTTPRequestHandler):
             )
         self.send_json({"job_id": job_id})
 
+    def new_job_batch(self):
+        """Creates several render jobs from a list of job specs and places them in queue.
+
+        Each item in the request has the same format as for `new_job`. Responds with a list containing
+        {"job_id": id} for each job that was created or {"error": message} for each job that was not,
+        in the same order as the request.
+        """
+        data = self.receive_json()
+        if data is None:
+            return  # receive_json already sent an error
+        if not isinstance(data, list):
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Expected a list of jobs")
+        results: List[Optional[Dict[str, str]]] = []
+        specs = []
+        for item in data:
+            try:
+                specs.append(
+                    {
+                        "path": item["path"],
+                        "start_frame": int(item["start_frame"]),
+                        "end_frame": int(item["end_frame"]),
+                        "render_nodes": item["nodes"],
+                        "weight": parse_weight(item.get("weight", 1.0)),
+                        "priority": int(item.get("priority", 0)),
+                        "chunk_size": int(item.get("chunk_size", 1)),
+                    }
+                )
+            except KeyError as e:
+                results.append({"error": f"Missing required data: {e}"})
+                continue
+            except (TypeError, ValueError, AttributeError) as e:
+                results.append({"error": f"Invalid data: {e}"})
+                continue
+            results.append(None)  # Filled in with controller's result below
+        try:
+            created = iter(self.controller.new_jobs(specs))
+        except Exception as e:
+            logger.exception("Error while creating jobs")
+            error = str(e)
+            return self.send_error(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                "Failed to create jobs",
+                f"Server caught {error}",
+            )
+        self.send_json([result if result else next(created) for result in results])
+
     def node(self) -> None:
         """Handles requests for the `node` endpoint."""
         self.exec_handler(self.node_handlers)
@@ -494,6 +610,14 @@ class HttpHandler(http.server.SimpleHTTPRequestHandler):
             return self.send_error(HTTPStatus.NOT_FOUND, "Invalid target")
         self.send_all_headers()
 
+    def metrics(self) -> None:
+        """Handles requests for the `metrics` endpoint."""
+        self.exec_handler(self.metrics_handlers)
+
+    def worker_metrics(self) -> None:
+        """Sends render thread pool metrics."""
+        self.send_json(self.controller.get_worker_metrics())
+
 
 def main(config_path: str) -> int:
     try:
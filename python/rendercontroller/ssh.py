@@ -0,0 +1,153 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("ssh")
+
+
+class SSHConnections(object):
+    """Keeps a persistent SSH master connection open to each render node.
+
+    Commands built by `command()` run over the node's master connection (OpenSSH ControlMaster), so
+    starting a render or killing a process doesn't have to open a new TCP connection and authenticate
+    again.  The master connection is started when a node is first used, and closes by itself after
+    it has been idle for `persist` seconds.  Before a command is built, the master is checked with
+    `ssh -O check` (at most once per `check_interval` seconds per node) and restarted if it has died.
+    If the master can't be started, commands still work: the first of them becomes the new master.
+
+    The control sockets are kept in a private directory that is removed by `close_all()`.
+    """
+
+    def __init__(
+        self,
+        persist: float = 600.0,
+        control_dir: Optional[str] = None,
+        check_interval: float = 30.0,
+        connect_timeout: float = 30.0,
+        check_timeout: float = 5.0,
+    ):
+        """
+        :param float persist: Seconds an idle master connection stays open.
+        :param str control_dir: Directory for control sockets. If None, a temporary directory is created.
+            Socket paths are limited to about 100 characters, so it should be short.
+        :param float check_interval: Minimum seconds between checks of a node's master connection.
+        :param float connect_timeout: Seconds to wait for a master connection to be established.
+        :param float check_timeout: Seconds to wait for a master connection to answer a check or exit request.
+            These only go to the local control socket, so they should be fast unless the master is stuck.
+        """
+        self.persist = persist
+        self.check_interval = check_interval
+        self.connect_timeout = connect_timeout
+        self.check_timeout = check_timeout
+        self._own_dir = control_dir is None
+        self.control_dir = control_dir if control_dir else tempfile.mkdtemp(prefix="rc-ssh-")
+        self._lock = threading.Lock()
+        self._node_locks: Dict[str, threading.Lock] = {}
+        # Node -> time.monotonic() of last successful check
+        self._checked: Dict[str, float] = {}
+
+    def _options(self) -> List[str]:
+        return [
+            "-o",
+            f"ControlPath={os.path.join(self.control_dir, '%C')}",
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPersist={int(self.persist)}",
+        ]
+
+    def _node_lock(self, node: str) -> threading.Lock:
+        with self._lock:
+            return self._node_locks.setdefault(node, threading.Lock())
+
+    def command(self, node: str, remote_cmd: str) -> List[str]:
+        """Returns arguments for `subprocess` to run a command on a node over its master connection."""
+        self.ensure_master(node)
+        return [shutil.which("ssh"), *self._options(), node, remote_cmd]
+
+    def check(self, node: str) -> bool:
+        """Returns True if the master connection to a node is running and answers within `check_timeout`."""
+        try:
+            result = subprocess.run(
+                [shutil.which("ssh"), *self._options(), "-O", "check", node],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=self.check_timeout,
+            )
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Timed out checking master connection to {node}.")
+            return False
+        return result.returncode == 0
+
+    def ensure_master(self, node: str) -> bool:
+        """Starts the master connection to a node if it is not running.
+
+        :return: True if the master connection is running.
+        """
+        with self._node_lock(node):
+            last = self._checked.get(node)
+            if last is not None and time.monotonic() - last < self.check_interval:
+                return True
+            if self.check(node):
+                self._checked[node] = time.monotonic()
+                return True
+            if last is not None:
+                logger.warning(f"Master connection to {node} is down, reconnecting.")
+            try:
+                # -f: go to background once connected. -N: master only, no remote command.
+                result = subprocess.run(
+                    [shutil.which("ssh"), *self._options(), "-M", "-N", "-f", node],
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=self.connect_timeout,
+                )
+            except subprocess.TimeoutExpired:
+                logger.error(f"Timed out opening master connection to {node}.")
+                self._checked.pop(node, None)
+                return False
+            if result.returncode != 0:
+                logger.error(f"Failed to open master connection to {node}.")
+                self._checked.pop(node, None)
+                return False
+            logger.info(f"Opened master connection to {node}.")
+            self._checked[node] = time.monotonic()
+            return True
+
+    def close(self, node: str) -> None:
+        """Closes the master connection to a node."""
+        with self._node_lock(node):
+            try:
+                subprocess.run(
+                    [shutil.which("ssh"), *self._options(), "-O", "exit", node],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=self.check_timeout,
+                )
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Timed out closing master connection to {node}.")
+            self._checked.pop(node, None)
+
+    def close_all(self) -> None:
+        """Closes all master connections and removes the control socket directory if it was created here."""
+        with self._lock:
+            nodes = list(self._node_locks)
+        for node in nodes:
+            self.close(node)
+        if self._own_dir:
+            shutil.rmtree(self.control_dir, ignore_errors=True)
+
+
+def ssh_command(node: str, remote_cmd: str, connections: Optional[SSHConnections] = None) -> List[str]:
+    """Returns arguments for `subprocess` to run a command on a node by SSH.
+
+    :param SSHConnections connections: If given, the command runs over the node's master connection.
+    """
+    if connections:
+        return connections.command(node, remote_cmd)
+    return [shutil.which("ssh"), node, remote_cmd]
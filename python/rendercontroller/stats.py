@@ -0,0 +1,109 @@
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class NodeStats(object):
+    """Keeps a history of how fast each render node renders frames.
+
+    Render times depend on the project at least as much as on the node, so time per frame is tracked
+    separately for each job, as an exponentially weighted moving average (EWMA) so that it follows changes
+    over the course of a job.  Each node also has a relative speed: how much faster (> 1.0) or slower (< 1.0)
+    it renders than the other nodes rendering the same job.  Relative speed carries over between jobs, so it
+    can be used to estimate how long a node will take to render a frame of a job it has not rendered yet.
+    Nodes with no history are assumed to have average speed (1.0).
+
+    The variance of each node's frame times is tracked the same way (an exponentially weighted variance),
+    so callers can tell how far to trust an estimate.
+    """
+
+    def __init__(self, alpha: float = 0.3):
+        """
+        :param float alpha: Weight of the newest sample in the moving averages. Must be > 0 and <= 1.
+        """
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError("Alpha must be greater than 0 and no more than 1.")
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._frame_times: Dict[str, Dict[str, float]] = {}  # Job ID -> node -> seconds per frame
+        self._frame_vars: Dict[str, Dict[str, float]] = {}  # Job ID -> node -> variance of seconds per frame
+        self._speeds: Dict[str, float] = {}  # Node -> relative speed
+
+    def _ewma(self, old: Optional[float], new: float) -> float:
+        if old is None:
+            return new
+        return self.alpha * new + (1.0 - self.alpha) * old
+
+    def record(self, job_id: str, node: str, seconds: float) -> None:
+        """Records the time a node took to render one frame of a job.
+
+        :param str job_id: ID of the job the frame belongs to.
+        :param str node: Name of the render node.
+        :param float seconds: Render time of the frame.
+        """
+        if seconds <= 0:
+            return
+        with self._lock:
+            times = self._frame_times.setdefault(job_id, {})
+            variances = self._frame_vars.setdefault(job_id, {})
+            if node in times:
+                delta = seconds - times[node]
+                times[node] += self.alpha * delta
+                variances[node] = (1.0 - self.alpha) * (variances[node] + self.alpha * delta**2)
+            else:
+                times[node] = seconds
+                variances[node] = 0.0
+            others = [t for n, t in times.items() if n != node]
+            if not others:
+                # Nothing to compare with yet.
+                return
+            speed = sum(others) / len(others) / times[node]
+            self._speeds[node] = self._ewma(self._speeds.get(node), speed)
+
+    def speed(self, node: str) -> float:
+        """Returns the relative speed of a node."""
+        return self._speeds.get(node, 1.0)
+
+    def frame_time(self, job_id: str, node: str) -> Optional[float]:
+        """Returns the expected time for a node to render one frame of a job in seconds.
+
+        If the node has not rendered any frames of the job, this is estimated from the time taken by
+        the nodes that have, scaled by relative speed.
+
+        :return: Expected seconds per frame, or None if no frames of the job have been rendered.
+        """
+        stats = self.frame_time_stats(job_id, node)
+        return stats[0] if stats else None
+
+    def frame_time_stats(self, job_id: str, node: str) -> Optional[Tuple[float, float]]:
+        """Returns the expected time for a node to render one frame of a job, and its standard deviation.
+
+        Like `frame_time()`, these are estimated from the other nodes if the node has not rendered any frames
+        of the job. The standard deviation is then assumed to be the same fraction of the expected time as it
+        is on average for the other nodes.
+
+        :return: Tuple of (mean, standard deviation) in seconds, or None if no frames of the job have been
+            rendered.
+        """
+        with self._lock:
+            times = self._frame_times.get(job_id)
+            if not times:
+                return None
+            variances = self._frame_vars[job_id]
+            if node in times:
+                return times[node], math.sqrt(variances[node])
+            # Time an average node would take, according to each node that has rendered the job.
+            average = sum(t * self.speed(n) for n, t in times.items()) / len(times)
+            mean = average / self.speed(node)
+            cv = sum(math.sqrt(variances[n]) / t for n, t in times.items()) / len(times)
+            return mean, mean * cv
+
+    def rank(self, nodes: Sequence[str]) -> List[str]:
+        """Returns nodes sorted fastest first. Nodes with equal speed keep their original order."""
+        return sorted(nodes, key=lambda n: -self.speed(n))
+
+    def forget(self, job_id: str) -> None:
+        """Discards frame times for a job. Relative node speeds are kept."""
+        with self._lock:
+            self._frame_times.pop(job_id, None)
+            self._frame_vars.pop(job_id, None)
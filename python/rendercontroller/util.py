@@ -1,5 +1,6 @@
 import os
-from typing import Dict, Any, List
+import re
+from typing import Dict, Any, List, Optional
 
 
 def get_file_type(entry: os.DirEntry) -> str:
@@ -48,6 +49,28 @@ def format_time(time: float) -> str:
     return timestr
 
 
+def output_pattern(path: str, frame: int) -> Optional[str]:
+    """Returns the path of a saved frame with the frame number replaced by #s, like Blender output paths.
+
+    The frame number is taken to be the last number in the file name, e.g. `/out/shot2_0042.png` for frame 42
+    becomes `/out/shot2_####.png`.  Returns None if that number is not `frame`.
+    """
+    head, tail = os.path.split(path)
+    base, ext = os.path.splitext(tail)
+    m = re.search(r"([0-9]+)[^0-9]*$", base)
+    if not m or int(m.group(1)) != frame:
+        return None
+    return os.path.join(head, base[: m.start(1)] + "#" * len(m.group(1)) + base[m.end(1) :] + ext)
+
+
+def frame_path(pattern: str, frame: int) -> str:
+    """Returns the path of a frame in an `output_pattern()`, padded with zeros to the number of #s."""
+    head, tail = os.path.split(pattern)
+    return os.path.join(
+        head, re.sub(r"#+(?=[^#]*$)", lambda m: str(frame).zfill(len(m.group())), tail)
+    )
+
+
 class Config(object):
     """Singleton configuration object."""
 
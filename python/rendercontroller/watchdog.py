@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+from typing import Set, TYPE_CHECKING
+
+from rendercontroller.constants import FINISHED, FAILED
+
+if TYPE_CHECKING:
+    from rendercontroller.renderthread import RenderThread
+
+logger = logging.getLogger("watchdog")
+
+
+class Watchdog(object):
+    """Fails renders that have not received output from their node for `node_timeout` seconds.
+
+    Render threads spend most of their time blocked reading output from the node, so they cannot notice
+    on their own that the node has stopped sending it.  Instead, every render thread that is given a
+    Watchdog registers with it when its worker starts, and the watchdog's thread sleeps until the earliest
+    time any of them could time out.  Threads that have received output since then are left alone.  Threads
+    that have not are failed with `RenderThread.timed_out()`, which also makes the worker stop waiting for
+    output and post its completion record, so the frames are requeued right away.
+
+    Render threads update their `timeout_timer` whenever output is received, so the watchdog does no work
+    at all while nodes are healthy, except wake up about once per `node_timeout` per active render.
+    """
+
+    def __init__(self):
+        self._threads: Set["RenderThread"] = set()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._mainloop, daemon=True)
+        self._thread.start()
+
+    def watch(self, thread: "RenderThread") -> None:
+        """Starts watching a render thread.  Threads are forgotten when they finish or time out."""
+        with self._cond:
+            self._threads.add(thread)
+            self._cond.notify()
+
+    def unwatch(self, thread: "RenderThread") -> None:
+        """Stops watching a render thread."""
+        with self._cond:
+            self._threads.discard(thread)
+
+    def active(self) -> int:
+        """Returns the number of render threads being watched."""
+        with self._cond:
+            return len(self._threads)
+
+    def _next_deadline(self) -> float:
+        """Returns the earliest time any watched thread could time out."""
+        return min(t.timeout_timer + t.config.node_timeout for t in self._threads)
+
+    def _mainloop(self) -> None:
+        logger.debug("Started watchdog thread.")
+        while True:
+            with self._cond:
+                while not self._stop:
+                    # Forget threads that finished without calling unwatch(), e.g. if the worker raised.
+                    self._threads = {t for t in self._threads if t.status not in (FINISHED, FAILED)}
+                    if not self._threads:
+                        self._cond.wait()
+                        continue
+                    timeout = self._next_deadline() - time.time()
+                    if timeout > 0:
+                        self._cond.wait(timeout)
+                        continue
+                    expired = {t for t in self._threads if t.is_timed_out()}
+                    if expired:
+                        self._threads -= expired
+                        break
+                    # Deadline is exactly now. Check again when the clock has moved on.
+                    self._cond.wait(0.01)
+                else:
+                    logger.debug("Watchdog thread exited.")
+                    return
+            for thread in expired:
+                try:
+                    thread.timed_out()
+                except Exception:
+                    logger.exception("Failed to stop timed out render.")
+
+    def shutdown(self) -> None:
+        """Stops the watchdog thread."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join()
@@ -26,6 +26,7 @@ setup(
     entry_points={"console_scripts": [
         "rcontroller-server = rendercontroller:main",
         "framechecker = rendercontroller:framechecker.main",
+        "rcontroller-agent = rendercontroller.agent:main",
     ]},
     setup_requires=[],
     tests_require=[],
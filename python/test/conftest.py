@@ -0,0 +1,49 @@
+import os
+import sys
+import pytest
+from unittest import mock
+
+# Runs the remote command locally.
+FAKE_SSH = """#!/bin/sh
+shift
+exec sh -c "$1"
+"""
+
+# Prints output like Blender's for each frame given by -f or -s/-e.  If the project is "hang.blend", starts
+# rendering the first frame, then hangs without printing anything.  Fails if the project is "fail.blend".
+FAKE_BLENDER = """
+import sys, time
+args = sys.argv[1:]
+if args[2].endswith("hang.blend"):
+    print("Fra:1 Mem:1M | Rendered 1/100 Tiles", flush=True)
+    time.sleep(60)
+if "-f" in args:
+    frames = [int(args[args.index("-f") + 1])]
+else:
+    frames = range(int(args[args.index("-s") + 1]), int(args[args.index("-e") + 1]) + 1)
+for frame in frames:
+    print(f"Fra:{frame} Mem:1M | Rendered 1/2 Tiles", flush=True)
+    print(f"Fra:{frame} Mem:1M | Rendered 2/2 Tiles", flush=True)
+    print(f"Saved: '/tmp/out_{frame}.png'", flush=True)
+sys.exit(1 if args[2].endswith("fail.blend") else 0)
+"""
+
+
+def make_executable(path, content):
+    path.write_text(content)
+    os.chmod(path, 0o755)
+    return str(path)
+
+
+@pytest.fixture(scope="function")
+def fake_blender(tmp_path):
+    """Path to a script that behaves like Blender (see FAKE_BLENDER)."""
+    return make_executable(tmp_path / "blender", f"#!{sys.executable}\n{FAKE_BLENDER}")
+
+
+@pytest.fixture(scope="function")
+def fake_ssh(tmp_path):
+    """Makes render threads use an ssh that runs commands on this machine instead of the node."""
+    ssh = make_executable(tmp_path / "ssh", FAKE_SSH)
+    with mock.patch("shutil.which", return_value=ssh):
+        yield ssh
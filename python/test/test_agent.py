@@ -0,0 +1,186 @@
+import queue
+import threading
+import pytest
+from unittest import mock
+
+from rendercontroller.agent import (
+    AgentServer,
+    AgentClient,
+    AgentConnections,
+    AgentRenderThread,
+    BlenderOutputParser,
+    TerragenOutputParser,
+)
+from rendercontroller.constants import BLENDER, TERRAGEN, RENDERING, FINISHED, FAILED
+
+@pytest.fixture(scope="function")
+def mconf():
+    c = mock.MagicMock(name="rendercontroller.util.Config")
+    c.node_timeout = 1000
+    return c
+
+
+@pytest.fixture(scope="function")
+def agent(fake_blender):
+    server = AgentServer(("127.0.0.1", 0), {BLENDER: fake_blender})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_thread(mconf, client, path, frame, end_frame=None):
+    return AgentRenderThread(
+        config=mconf,
+        job_id="job01",
+        node="127.0.0.1",
+        path=path,
+        frame=frame,
+        end_frame=end_frame,
+        completions=queue.Queue(),
+        agent=client,
+        engine=BLENDER,
+    )
+
+
+def test_blender_output_parser():
+    parser = BlenderOutputParser([3, 4])
+    assert parser.parse(b"Blender 2.93.7\n") == []
+    assert parser.parse(b"Fra:4 Mem:10M | Rendered 5/10 Tiles\n") == [
+        {"event": "progress", "frame": 4, "progress": 50.0}
+    ]
+    # Throttled until whole-number percentage changes
+    assert parser.parse(b"Fra:4 Mem:10M | Rendered 501/1000 Tiles\n") == []
+    assert parser.parse(b"Fra:4 Mem:10M | Rendering 25 / 100 samples\n") == [
+        {"event": "progress", "frame": 4, "progress": 25.0}
+    ]
+    assert parser.parse(b"Fra:4 Mem:10M | Synchronizing object | Cube\n") == []
+    assert parser.parse(b"Saved: '/tmp/out_4.png'\n") == [{"event": "saved", "frame": 4}]
+    # Next frame starts from zero
+    assert parser.parse(b"Fra:5 Mem:10M | Rendering 25 / 100 samples\n") == [
+        {"event": "progress", "frame": 5, "progress": 25.0}
+    ]
+
+
+def test_terragen_output_parser():
+    parser = TerragenOutputParser([7])
+    assert parser.parse(b"Rendering pre pass... 40%\n") == [
+        {"event": "progress", "frame": 7, "progress": 40.0}
+    ]
+    assert parser.parse(b"Rendering pre pass... 40.5%\n") == []
+    assert parser.parse(b"Rendering main pass... 2%\n") == [
+        {"event": "progress", "frame": 7, "progress": 2.0}
+    ]
+    assert parser.parse(b"Finished\n") == [{"event": "saved", "frame": 7}]
+    assert parser.parse(b"7\n") == []
+
+
+def test_agent_command(agent):
+    agent.executables[TERRAGEN] = "/bin/terragen"
+    exe = agent.executables[BLENDER]
+    assert agent.command(BLENDER, "/p.blend", 3, 3) == [exe, "-b", "-noaudio", "/p.blend", "-f", "3"]
+    assert agent.command(BLENDER, "/p.blend", 3, 5) == [
+        exe, "-b", "-noaudio", "/p.blend", "-s", "3", "-e", "5", "-a"
+    ]
+    assert agent.command(TERRAGEN, "/p.tgd", 3, 3) == [
+        "/bin/terragen", "-p", "/p.tgd", "-hide", "-exit", "-r", "-f", "3"
+    ]
+    with pytest.raises(ValueError):
+        agent.command(TERRAGEN, "/p.tgd", 3, 5)
+    del agent.executables[TERRAGEN]
+    with pytest.raises(ValueError):
+        agent.command(TERRAGEN, "/p.tgd", 3, 3)
+
+
+def test_agent_render(mconf, agent):
+    client = AgentClient("127.0.0.1", agent.server_address[1])
+    thread = make_thread(mconf, client, "/tmp/job.blend", 1, 3)
+    thread.start()
+    record = thread.completions.get(timeout=10)
+    assert record.status == FINISHED
+    assert record.frames_finished == (1, 2, 3)
+    assert record.pid
+    assert thread.progress == 100.0
+    # Renders share one connection
+    sock = client._sock
+    thread = make_thread(mconf, client, "/tmp/job.blend", 4)
+    thread.start()
+    assert thread.completions.get(timeout=10).status == FINISHED
+    assert client._sock is sock
+    client.close()
+
+
+def test_agent_render_failed(mconf, agent):
+    client = AgentClient("127.0.0.1", agent.server_address[1])
+    # Nonzero exit code after all frames were saved still counts
+    thread = make_thread(mconf, client, "/tmp/fail.blend", 1)
+    thread.start()
+    assert thread.completions.get(timeout=10).status == FINISHED
+    # Engine not configured on agent
+    thread = make_thread(mconf, client, "/tmp/job.tgd", 1)
+    thread.engine = TERRAGEN
+    thread.start()
+    record = thread.completions.get(timeout=10)
+    assert record.status == FAILED
+    assert record.pid is None
+    client.close()
+
+
+def test_agent_stop(mconf, agent):
+    client = AgentClient("127.0.0.1", agent.server_address[1])
+    thread = make_thread(mconf, client, "/tmp/hang.blend", 1)
+    thread.start()
+    for _ in range(500):
+        if thread.progress:
+            break
+        threading.Event().wait(0.01)
+    assert thread.status == RENDERING
+    thread.stop()
+    record = thread.completions.get(timeout=10)
+    assert record.status == FAILED
+    assert record.frames_finished == ()
+    client.close()
+
+
+def test_agent_kill(mconf, agent):
+    client = AgentClient("127.0.0.1", agent.server_address[1])
+    thread = make_thread(mconf, client, "/tmp/hang.blend", 1)
+    thread.start()
+    for _ in range(500):
+        if thread.progress:
+            break
+        threading.Event().wait(0.01)
+    # Agent reports when the process has exited.
+    assert thread.kill(5.0) is True
+    record = thread.completions.get(timeout=10)
+    assert record.status == FAILED
+    client.close()
+
+
+def test_agent_connection_lost(mconf, agent):
+    client = AgentClient("127.0.0.1", agent.server_address[1])
+    thread = make_thread(mconf, client, "/tmp/hang.blend", 1)
+    thread.start()
+    for _ in range(500):
+        if thread.progress:
+            break
+        threading.Event().wait(0.01)
+    client.close()
+    assert thread.completions.get(timeout=10).status == FAILED
+    assert client._sock is None
+
+
+def test_agent_unreachable(mconf):
+    client = AgentClient("127.0.0.1", 1, connect_timeout=1.0)
+    thread = make_thread(mconf, client, "/tmp/job.blend", 1)
+    thread.start()
+    assert thread.completions.get(timeout=10).status == FAILED
+
+
+def test_agent_connections():
+    agents = AgentConnections(port=1234)
+    client = agents.get("node1")
+    assert client.node == "node1"
+    assert client.port == 1234
+    assert agents.get("node1") is client
+    assert agents.get("node2") is not client
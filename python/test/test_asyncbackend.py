@@ -0,0 +1,122 @@
+import asyncio
+import queue
+import sys
+import threading
+import warnings
+import pytest
+from unittest import mock
+
+from rendercontroller.asyncbackend import AsyncioBackend
+from rendercontroller.renderthread import BlenderRenderThread
+from rendercontroller.constants import RENDERING, FINISHED, FAILED
+
+@pytest.fixture(scope="function")
+def backend():
+    b = AsyncioBackend()
+    yield b
+    b.shutdown()
+
+
+@pytest.fixture(scope="function")
+def mconf(fake_ssh, fake_blender):
+    c = mock.MagicMock(name="rendercontroller.util.Config")
+    c.node_timeout = 1000
+    c.macs = []
+    c.blenderpath_linux = fake_blender
+    return c
+
+
+def make_thread(mconf, backend, path, frame):
+    return BlenderRenderThread(
+        config=mconf,
+        job_id="job01",
+        node="node1",
+        path=path,
+        frame=frame,
+        completions=queue.Queue(),
+        backend=backend,
+    )
+
+
+def test_backend_submit(backend):
+    done = threading.Event()
+
+    async def task():
+        await asyncio.sleep(0)
+        done.set()
+
+    backend.submit(task()).result(timeout=5)
+    assert done.is_set()
+    assert backend.metrics() == {"async_tasks": 0, "async_tasks_started": 1}
+
+
+def test_backend_task_exception(backend):
+    async def bad():
+        raise RuntimeError("Oops")
+
+    backend.submit(bad()).result(timeout=5)
+    assert backend.metrics()["async_tasks"] == 0
+
+
+
+def test_backend_child_watcher():
+    # Each backend reaps its own processes, unaffected by other backends starting and shutting down.
+    returncodes = []
+
+    async def run(*args):
+        proc = await asyncio.create_subprocess_exec(*args)
+        returncodes.append(await proc.wait())
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        first = AsyncioBackend()
+        pending = first.submit(run(sys.executable, "-c", "import time; time.sleep(0.5)"))
+        second = AsyncioBackend()
+        second.submit(run("true")).result(timeout=5)
+        second.shutdown()
+        pending.result(timeout=5)
+        first.submit(run("false")).result(timeout=5)
+        assert returncodes == [0, 0, 1]
+        # Shutting down with a process still running
+        first.submit(run("sleep", "10"))
+        first.shutdown(timeout=0.1)
+
+def test_backend_render(mconf, backend):
+    threads = [make_thread(mconf, backend, "/tmp/job.blend", frame) for frame in range(1, 31)]
+    threads_before = threading.active_count()
+    for thread in threads:
+        assert thread.thread is None
+        thread.start()
+    for thread in threads:
+        record = thread.completions.get(timeout=20)
+        assert record.status == FINISHED
+        assert record.frames_finished == (thread.frame,)
+        assert record.time_stop
+    # Processes are started, read and reaped without a thread each.
+    assert threading.active_count() <= threads_before + 1
+    assert backend.metrics()["async_tasks_started"] == 30
+
+
+def test_backend_render_failed(mconf, backend):
+    # Process exits without saving frame
+    mconf.blenderpath_linux = "/bin/false"
+    thread = make_thread(mconf, backend, "/tmp/job.blend", 1)
+    thread.start()
+    assert thread.completions.get(timeout=10).status == FAILED
+
+
+@mock.patch("subprocess.call")
+def test_backend_stop(call, mconf, backend):
+    thread = make_thread(mconf, backend, "/tmp/hang.blend", 1)
+    thread.start()
+    for _ in range(500):
+        if thread.progress and thread.pid:
+            break
+        threading.Event().wait(0.01)
+    assert thread.status == RENDERING
+    thread.stop()
+    # Process is killed by the fake SSH command from the event loop, not a kill thread.
+    record = thread.completions.get(timeout=10)
+    assert record.status == FAILED
+    assert record.frames_finished == ()
+    call.assert_not_called()
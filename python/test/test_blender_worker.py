@@ -0,0 +1,39 @@
+import io
+import sys
+import pytest
+from unittest import mock
+
+
+@pytest.fixture(scope="function")
+def worker():
+    """Imports blender_worker with a fake bpy module, since it only runs inside Blender."""
+    bpy = mock.MagicMock(name="bpy")
+    with mock.patch.dict(sys.modules, {"bpy": bpy}):
+        sys.modules.pop("rendercontroller.blender_worker", None)
+        from rendercontroller import blender_worker
+
+        yield blender_worker, bpy
+    sys.modules.pop("rendercontroller.blender_worker", None)
+
+
+def test_blender_worker_main(worker, capsys):
+    blender_worker, bpy = worker
+    scene = bpy.context.scene
+
+    def render(animation):
+        assert animation
+        if scene.frame_start == 7:
+            raise RuntimeError("Out of memory")
+
+    bpy.ops.render.render.side_effect = render
+    with mock.patch("sys.stdin", io.StringIO("5\n\nbogus\n7\n6\n")):
+        blender_worker.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith("RC_READY ")
+    assert lines[1].startswith("RC_DONE 5 ")
+    assert lines[2] == "RC_ERROR bogus Invalid frame number"
+    assert lines[3] == "RC_ERROR 7 Out of memory"
+    assert lines[4].startswith("RC_DONE 6 ")
+    assert scene.frame_start == 6
+    assert scene.frame_end == 6
+    assert bpy.ops.render.render.call_count == 3
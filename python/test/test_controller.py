@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 
+import json
+import os
 import pytest
+import sqlite3
+import threading
+import time
 from unittest import mock
 
 from rendercontroller.controller import RenderController, RenderQueue
@@ -62,6 +67,8 @@ testjob03 = {
 @mock.patch("rendercontroller.controller.Config")
 def rc_empty(conf, db):
     conf.render_nodes = test_nodes
+    conf.autostart = False
+    conf.get.side_effect = lambda key, default=None: default
     return RenderController(conf)
 
 
@@ -101,6 +108,7 @@ def rc_with_three_jobs(rc_empty):
 @mock.patch("rendercontroller.util.Config")
 def test_controller_init(conf, queue, db):
     conf.work_dir = "/tmp"
+    conf.get.side_effect = lambda key, default=None: default
     queue.assert_not_called()
     db.assert_not_called()
     rc = RenderController(conf)
@@ -114,6 +122,7 @@ def test_controller_init(conf, queue, db):
 @mock.patch("rendercontroller.controller.Config")
 def test_controller_render_nodes(conf, db):
     conf.render_nodes = test_nodes
+    conf.get.side_effect = lambda key, default=None: default
     rc = RenderController(conf)
     assert rc.render_nodes == test_nodes
 
@@ -122,6 +131,7 @@ def test_controller_render_nodes(conf, db):
 @mock.patch("rendercontroller.controller.Config")
 def test_controller_autostart(conf, db):
     conf.autostart = True
+    conf.get.side_effect = lambda key, default=None: default
     rc = RenderController(conf)
     assert rc.autostart is True
     rc.disable_autostart()
@@ -149,6 +159,17 @@ def test_controller_new_job(uuid, job, rc_empty):
         start_frame=testjob01["start_frame"],
         end_frame=testjob01["end_frame"],
         render_nodes=testjob01["render_nodes"],
+        weight=1.0,
+        allocator=rc_empty.allocator,
+        priority=0,
+        chunk_size=1,
+        node_stats=rc_empty.node_stats,
+        dispatcher=rc_empty.dispatcher,
+        worker_pool=rc_empty.worker_pool,
+        ssh=rc_empty.ssh,
+        agents=rc_empty.agents,
+        async_backend=rc_empty.async_backend,
+        watchdog=rc_empty.watchdog,
     )
     assert res == job_id
     assert rc_empty.queue.get_by_id(job_id) is job.return_value
@@ -164,9 +185,103 @@ def test_controller_new_job(uuid, job, rc_empty):
         0.0,
         [],
         0,
+        weight=job.return_value.weight,
+        priority=job.return_value.priority,
+        chunk_size=job.return_value.chunk_size,
     )
 
 
+@mock.patch("rendercontroller.controller.RenderJob")
+@mock.patch("rendercontroller.controller.uuid4")
+def test_controller_new_jobs(uuid, job, rc_empty):
+    uuid.side_effect = [mock.MagicMock(hex=f"uuid{i}") for i in range(4)]
+
+    def job_factory(
+        config,
+        id,
+        path,
+        start_frame,
+        end_frame,
+        render_nodes,
+        weight,
+        allocator,
+        priority,
+        chunk_size,
+        node_stats,
+        dispatcher,
+        worker_pool,
+        ssh,
+        agents,
+        async_backend,
+        watchdog,
+    ):
+        assert node_stats is rc_empty.node_stats
+        assert dispatcher is rc_empty.dispatcher
+        assert worker_pool is rc_empty.worker_pool
+        assert ssh is None
+        assert agents is None
+        assert async_backend is None
+        assert watchdog is rc_empty.watchdog
+        if start_frame > end_frame:
+            raise ValueError("End frame cannot be less than start frame.")
+        j = mock.MagicMock(name="RenderJob")
+        j.id = id
+        j.status = WAITING
+        j.path = path
+        j.start_frame = start_frame
+        j.end_frame = end_frame
+        j.get_enabled_nodes.return_value = tuple(render_nodes)
+        j.weight = weight
+        j.priority = priority
+        j.chunk_size = chunk_size
+        return j
+
+    job.side_effect = job_factory
+    assert rc_empty.new_jobs([]) == []
+    specs = [
+        testjob01,
+        {**testjob02, "start_frame": 30},
+        {"path": "/dev/test4.blend"},
+        {**testjob03, "weight": 2.0},
+    ]
+    res = rc_empty.new_jobs(specs)
+    assert res == [
+        {"job_id": "uuid0"},
+        {"error": "End frame cannot be less than start frame."},
+        {"error": "Missing required data: 'start_frame'"},
+        {"job_id": "uuid3"},
+    ]
+    assert rc_empty.queue.keys() == ["uuid0", "uuid3"]
+    rc_empty.db.insert_job.assert_not_called()
+    rc_empty.db.insert_jobs.assert_called_once()
+    inserted = rc_empty.db.insert_jobs.call_args[0][0]
+    assert [(j["id"], j["queue_position"], j["weight"]) for j in inserted] == [
+        ("uuid0", 0, 1.0),
+        ("uuid3", 1, 2.0),
+    ]
+    assert inserted[1]["path"] == testjob03["path"]
+    assert inserted[1]["render_nodes"] == tuple(testjob03["render_nodes"])
+
+
+def test_controller_new_job_inserted_before_queued(rc_empty):
+    # Queueing a job can start it, which updates its row in the database, so the row must exist first.
+    rc_empty.db.insert_job.side_effect = lambda *args, **kwargs: queued.append(len(rc_empty.queue))
+    rc_empty.db.insert_jobs.side_effect = lambda jobs: queued.append(len(rc_empty.queue))
+    queued = []
+    rc_empty.new_job(**testjob01)
+    rc_empty.new_jobs([testjob02, testjob03])
+    assert queued == [0, 1]
+    assert len(rc_empty.queue) == 3
+    # Nothing is queued if the insert fails, so a client can safely retry.
+    rc_empty.db.insert_job.side_effect = sqlite3.OperationalError("database is locked")
+    rc_empty.db.insert_jobs.side_effect = sqlite3.OperationalError("database is locked")
+    with pytest.raises(sqlite3.OperationalError):
+        rc_empty.new_job(**testjob01)
+    with pytest.raises(sqlite3.OperationalError):
+        rc_empty.new_jobs([testjob02])
+    assert len(rc_empty.queue) == 3
+
+
 def test_controller_start(rc_with_mocked_job):
     job_id = "testjob01"
     rc, job = rc_with_mocked_job
@@ -190,7 +305,9 @@ def test_controller_start_next(rc_with_three_jobs):
         assert rc_with_three_jobs.queue[i].id == testjobs[i][1]
     assert rc_with_three_jobs.start_next() == "testjob02"
     # Set status manually because RenderJob is mocked.
-    rc_with_three_jobs.queue.get_by_id("testjob02").status = RENDERING
+    job = rc_with_three_jobs.queue.get_by_id("testjob02")
+    job.status = RENDERING
+    rc_with_three_jobs.queue.status_changed(job, WAITING)
     # No WAITING jobs should be left in queue
     assert rc_with_three_jobs.start_next() is None
 
@@ -199,8 +316,9 @@ def test_controller_stop(rc_with_mocked_job):
     rc, job = rc_with_mocked_job
     job_id = "testjob01"
     job.return_value.stop.assert_not_called()
-    rc.stop(job_id)
-    job.return_value.stop.assert_called_once()
+    job.return_value.stop.return_value = ["node2"]
+    assert rc.stop(job_id) == ["node2"]
+    job.return_value.stop.assert_called_once_with(None)
     with pytest.raises(JobNotFoundError):
         rc.stop("badkey")
 
@@ -209,7 +327,9 @@ def test_controller_delete(rc_with_three_jobs):
     assert len(rc_with_three_jobs.queue) == 3
     assert "testjob03" in rc_with_three_jobs.queue
     rc_with_three_jobs.db.delete_job.assert_not_called()
+    rc_with_three_jobs.node_stats.record("testjob03", "node1", 10.0)
     rc_with_three_jobs.delete("testjob03")
+    assert rc_with_three_jobs.node_stats.frame_time("testjob03", "node1") is None
     assert len(rc_with_three_jobs.queue) == 2
     assert "testjob03" not in rc_with_three_jobs.queue
     rc_with_three_jobs.db.delete_job.assert_called_with("testjob03")
@@ -245,35 +365,222 @@ def test_controller_disable_node(rc_with_mocked_job):
 def test_controller_get_job_data(rc_with_mocked_job):
     job_id = "testjob01"
     rc, job = rc_with_mocked_job
-    # Only test that RenderJob.dump() was called and that something was returned.
-    # We test the output of RenderJob.dump() in the tests for that class.
-    job.return_value.dump.assert_not_called()
+    # Only test that RenderJob.snapshot() was called and that something was returned.
+    # We test the output of RenderJob.snapshot() in the tests for that class.
+    job.return_value.snapshot.assert_not_called()
     ret = rc.get_job_data(job_id)
     assert isinstance(ret, mock.MagicMock)
-    job.return_value.dump.assert_called_once()
+    job.return_value.snapshot.assert_called_once()
     with pytest.raises(JobNotFoundError):
         rc.get_job_data("badkey")
 
+    job.return_value.snapshot_json.return_value = b'{"id": "testjob01"}'
+    assert rc.get_job_data_json(job_id) == b'{"id": "testjob01"}'
+    with pytest.raises(JobNotFoundError):
+        rc.get_job_data_json("badkey")
+
 
 def test_controller_get_all_job_data(rc_with_three_jobs):
     # As above, do not test contents of returned object. That is checked in RenderJob tests.
     assert len(rc_with_three_jobs.queue) == 3
     for job in rc_with_three_jobs.queue:
-        job.dump.assert_not_called()
+        job.snapshot.assert_not_called()
     ret = rc_with_three_jobs.get_all_job_data()
     for job in rc_with_three_jobs.queue:
-        job.dump.assert_called_once()
+        job.snapshot.assert_called_once()
     assert isinstance(ret, list)
     assert len(ret) == 3
     for j in ret:
         assert isinstance(j, mock.MagicMock)
 
 
+def test_controller_get_all_job_data_json(rc_with_three_jobs):
+    for i, job in enumerate(rc_with_three_jobs.queue):
+        job.snapshot_json.return_value = bytes(json.dumps({"id": i}), "UTF-8")
+    ret = rc_with_three_jobs.get_all_job_data_json()
+    assert json.loads(ret) == [{"id": 0}, {"id": 1}, {"id": 2}]
+    rc_with_three_jobs.queue = RenderQueue()
+    assert json.loads(rc_with_three_jobs.get_all_job_data_json()) == []
+
+
+class FakeJob(object):
+    """Minimal stand-in for RenderJob that notifies status listeners like the real thing."""
+
+    def __init__(self, id, status=WAITING):
+        self.id = id
+        self.status = status
+        self.status_listeners = []
+        self.started = threading.Event()
+        self.time_render = 0.0
+        self.tail = False
+        self.priority = 0
+
+    def in_tail(self):
+        return self.status == RENDERING and self.tail
+
+    def add_status_listener(self, callback):
+        self.status_listeners.append(callback)
+
+    def remove_status_listener(self, callback):
+        self.status_listeners.remove(callback)
+
+    def _set_status(self, status):
+        old = self.status
+        self.status = status
+        for callback in self.status_listeners:
+            callback(self, old)
+
+    def render(self):
+        self.time_render = time.monotonic()
+        self._set_status(RENDERING)
+        self.started.set()
+
+
+def test_controller_autostart_latency(rc_empty):
+    """Next job should start within milliseconds of the previous one finishing."""
+    rc_empty.config.autostart = True
+    job1 = FakeJob("job1")
+    job2 = FakeJob("job2")
+    rc_empty.queue.append(job1)
+    assert job1.started.wait(1)
+    rc_empty.queue.append(job2)
+    # Task thread must not start job2 while job1 is rendering.
+    assert not job2.started.wait(0.1)
+
+    time_finished = time.monotonic()
+    job1._set_status(FINISHED)
+    assert job2.started.wait(1)
+    gap = job2.time_render - time_finished
+    assert gap < 0.05
+
+
+def test_controller_autostart_enable_wakes_task_thread(rc_empty):
+    rc_empty.config.autostart = False
+    job = FakeJob("job1")
+    rc_empty.queue.append(job)
+    assert not job.started.wait(0.1)
+    rc_empty.enable_autostart()
+    assert job.started.wait(1)
+
+
+def test_controller_concurrent_autostart(rc_empty):
+    rc_empty.config.autostart = True
+    rc_empty.config.get.side_effect = lambda key, default=None: {
+        "max_concurrent_jobs": 2
+    }.get(key, default)
+    jobs = [FakeJob(f"job{i}") for i in range(3)]
+    for job in jobs:
+        rc_empty.queue.append(job)
+    assert jobs[0].started.wait(1)
+    assert jobs[1].started.wait(1)
+    assert not jobs[2].started.wait(0.1)
+    jobs[0]._set_status(FINISHED)
+    assert jobs[2].started.wait(1)
+
+
+@pytest.mark.parametrize("backfill", [True, False])
+def test_controller_backfill(rc_empty, backfill):
+    rc_empty.config.autostart = True
+    rc_empty.config.get.side_effect = lambda key, default=None: {
+        "backfill": backfill
+    }.get(key, default)
+    job1 = FakeJob("job1")
+    job2 = FakeJob("job2")
+    rc_empty.queue.append(job1)
+    rc_empty.queue.append(job2)
+    assert job1.started.wait(1)
+    assert not rc_empty.can_backfill
+    assert not job2.started.wait(0.1)
+    # Job calls tail listeners when it sends its last frame to a node
+    job1.tail = True
+    rc_empty._job_in_tail(job1)
+    assert rc_empty.can_backfill == backfill
+    assert job2.started.wait(0.5) == backfill
+
+
+def test_controller_set_weight(rc_with_mocked_job):
+    rc, job = rc_with_mocked_job
+    rc.set_weight("testjob01", 2.5)
+    job.return_value.set_weight.assert_called_with(2.5)
+    with pytest.raises(JobNotFoundError):
+        rc.set_weight("badkey", 1.0)
+
+
+def test_controller_set_priority(rc_with_three_jobs):
+    rc = rc_with_three_jobs
+    job = rc.queue[1]
+    with mock.patch.object(rc.queue, "priority_changed") as changed:
+        rc.set_priority(job.id, 5)
+        job.set_priority.assert_called_with(5)
+        changed.assert_called_with(job)
+    with pytest.raises(JobNotFoundError):
+        rc.set_priority("badkey", 1)
+
+
+@mock.patch("rendercontroller.controller.StateDatabase")
+@mock.patch("rendercontroller.controller.Config")
+def test_controller_task_thread_shutdown(conf, db):
+    conf.get.side_effect = lambda key, default=None: default
+    rc = RenderController(conf)
+    assert rc.task_thread.running()
+    # Should return promptly even though the thread is sleeping until notified.
+    rc.task_thread.shutdown()
+    assert not rc.task_thread.running()
+
+
 @mock.patch("rendercontroller.controller.StateDatabase")
 @mock.patch("rendercontroller.controller.TaskThread")
 @mock.patch("rendercontroller.controller.Config")
 def test_controller_shutdown(conf, thread, db):
+    conf.get.side_effect = lambda key, default=None: default
     rc = RenderController(conf)
     thread.return_value.shutdown.assert_not_called()
     rc.shutdown()
     thread.return_value.shutdown.assert_called_once()
+
+
+@mock.patch("rendercontroller.controller.ssh_kill")
+@mock.patch("rendercontroller.controller.RenderJob")
+def test_controller_restore_in_flight(job, ssh_kill, rc_empty, tmp_path):
+    ssh_kill.return_value = True
+    # Frame 4 finished while the server was down, frame 5 was still rendering. Frame 6's file is from an
+    # earlier render.
+    for frame, mtime in ((4, 200.0), (6, 50.0)):
+        path = tmp_path / f"out_{frame:04d}.png"
+        path.write_bytes(b"")
+        os.utime(path, (mtime, mtime))
+    restored = {
+        "id": "job01",
+        "status": RENDERING,
+        "path": "/tmp/job1.blend",
+        "start_frame": 0,
+        "end_frame": 10,
+        "render_nodes": ["node1", "node2"],
+        "time_start": 10.0,
+        "time_stop": 0.0,
+        "frames_completed": {0, 1, 2, 3},
+        "queue_position": 0,
+        "weight": 1.0,
+        "priority": 0,
+        "chunk_size": 1,
+        "in_flight": {
+            "node1": {"frames": [4, 5], "pid": 101, "time_start": 100.0},
+            "node2": {"frames": [6], "pid": None, "time_start": 100.0},
+        },
+        "output_path": str(tmp_path / "out_####.png"),
+    }
+    rc_empty.restore_jobs([restored])
+    assert job.call_args[1]["frames_completed"] == {0, 1, 2, 3, 4}
+    assert job.call_args[1]["output_path"] == str(tmp_path / "out_####.png")
+    rc_empty.db.update_job_frames_completed.assert_called_once_with("job01", {0, 1, 2, 3, 4})
+    rc_empty.db.update_job_in_flight.assert_called_once_with("job01", {})
+    # Only processes with a known PID are killed, and only if they are still rendering this job.
+    ssh_kill.assert_called_once_with("node1", 101, mock.ANY, None, match="/tmp/job1.blend")
+
+
+def test_controller_shutdown_restart(rc_empty):
+    job = mock.MagicMock(name="RenderJob", id="job01", status=RENDERING)
+    rc_empty.queue.append(job)
+    rc_empty.shutdown(restart=True)
+    job.suspend.assert_called_once()
+    job.stop.assert_not_called()
@@ -18,6 +18,11 @@ db_testjob1 = {
     "time_stop": 1643945737.287661,
     "frames_completed": {0, 1, 2, 3, 4, 5},
     "queue_position": 0,
+    "weight": 1.0,
+    "priority": 0,
+    "chunk_size": 1,
+    "in_flight": {"node1": {"frames": [6], "pid": 101, "time_start": 1643945730.0}},
+    "output_path": "/tmp/render/job1_####.png",
 }
 
 db_testjob2 = {
@@ -31,6 +36,11 @@ db_testjob2 = {
     "time_stop": 1643945813.785717,
     "frames_completed": {0, 1, 2, 3, 4, 6, 7, 8},  # 5 is missing intentionally
     "queue_position": 1,
+    "weight": 2.5,
+    "priority": 5,
+    "chunk_size": 10,
+    "in_flight": {},
+    "output_path": "",
 }
 
 
@@ -65,11 +75,39 @@ def test_database_initialize(db_path, cursor):
             "jobs",
             "CREATE TABLE jobs (id TEXT UNIQUE, status TEXT, path TEXT, start_frame INTEGER, "
             + "end_frame INTEGER, render_nodes BLOB, time_start REAL, time_stop REAL, "
-            + "frames_completed BLOB, queue_position INTEGER, timestamp FLOAT)",
+            + "frames_completed BLOB, queue_position INTEGER, timestamp FLOAT, "
+            + "weight REAL DEFAULT 1.0, priority INTEGER DEFAULT 0, "
+            + "chunk_size INTEGER DEFAULT 1, in_flight BLOB DEFAULT '{}', output_path TEXT DEFAULT '')",
         ),
     ]
 
 
+def test_database_initialize_upgrade():
+    """Columns added since the initial release are added to existing databases."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "rcontroller-old.sqlite")
+        con = sqlite3.connect(path)
+        con.execute(
+            "CREATE TABLE jobs (id TEXT UNIQUE, status TEXT, path TEXT, start_frame INTEGER, "
+            + "end_frame INTEGER, render_nodes BLOB, time_start REAL, time_stop REAL, "
+            + "frames_completed BLOB, queue_position INTEGER, timestamp FLOAT)"
+        )
+        con.execute(
+            "INSERT INTO jobs VALUES ('old01', 'Waiting', '/tmp/old', 0, 10, '[]', 0.0, 0.0, '[]', 0, 1.0)"
+        )
+        con.commit()
+        con.close()
+        db = StateDatabase(path)
+        db.initialize()
+        assert db.get_job("old01")["weight"] == 1.0
+        assert db.get_job("old01")["priority"] == 0
+        assert db.get_job("old01")["chunk_size"] == 1
+        assert db.get_job("old01")["in_flight"] == {}
+        assert db.get_job("old01")["output_path"] == ""
+        # Running it again must not fail
+        db.initialize()
+
+
 @mock.patch("time.time")
 def test_database_insert_job_get_job(time, db, cursor):
     time.return_value = 123.456
@@ -81,6 +119,23 @@ def test_database_insert_job_get_job(time, db, cursor):
     assert actual == db_testjob1
 
 
+def test_database_insert_jobs():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = StateDatabase(os.path.join(temp_dir, "rcontroller-batch.sqlite"))
+        db.initialize()
+        db.insert_jobs([db_testjob1, db_testjob2])
+        actual = db.get_all_jobs()
+        for job in actual:
+            job.pop("timestamp")
+        assert actual == [db_testjob1, db_testjob2]
+
+        # Batch is inserted in a single transaction, so if one job fails, none are inserted.
+        job3 = {**db_testjob2, "id": "job03", "queue_position": 2}
+        with pytest.raises(sqlite3.IntegrityError):
+            db.insert_jobs([job3, db_testjob1])
+        assert len(db.get_all_jobs()) == 2
+
+
 def test_database_get_all_jobs(db, cursor):
     db.insert_job(**db_testjob2)
     cursor.execute("SELECT COUNT(*) FROM jobs")
@@ -140,6 +195,39 @@ def test_database_update_job_frames_completed(db):
     assert db.get_job("job01")["timestamp"] > ts_pre
 
 
+def test_database_update_job_weight(db):
+    assert db.get_job("job01")["weight"] == 1.0
+    ts_pre = db.get_job("job01")["timestamp"]
+    db.update_job_weight("job01", 3.0)
+    assert db.get_job("job01")["weight"] == 3.0
+    # Make sure no changes were made to other job
+    assert db.get_job("job02")["weight"] == db_testjob2["weight"]
+    # Make sure timestamp was updated
+    assert db.get_job("job01")["timestamp"] > ts_pre
+
+
+def test_database_update_job_priority(db):
+    assert db.get_job("job01")["priority"] == db_testjob1["priority"]
+    db.update_job_priority("job01", 7)
+    assert db.get_job("job01")["priority"] == 7
+    assert db.get_job("job02")["priority"] == db_testjob2["priority"]
+
+
+def test_database_update_job_in_flight(db):
+    assert db.get_job("job02")["in_flight"] == {}
+    in_flight = {"node2": {"frames": [9, 10], "pid": None, "time_start": 100.0}}
+    db.update_job_in_flight("job02", in_flight)
+    assert db.get_job("job02")["in_flight"] == in_flight
+    db.update_job_in_flight("job02", {})
+    assert db.get_job("job02")["in_flight"] == {}
+
+
+def test_database_update_job_output_path(db):
+    db.update_job_output_path("job02", "/tmp/render/####.exr")
+    assert db.get_job("job02")["output_path"] == "/tmp/render/####.exr"
+    assert db.get_job("job01")["output_path"] == db_testjob1["output_path"]
+
+
 def test_database_update_nodes(db):
     assert db.get_job("job02")["render_nodes"] == ["node1", "node2", "node3"]
     ts_pre = db.get_job("job02")["timestamp"]
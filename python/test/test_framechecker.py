@@ -0,0 +1,139 @@
+import json
+import pytest
+
+from rendercontroller.framechecker import (
+    Framechecker,
+    Sequence,
+    check_directories,
+    find_sequences,
+    format_ranges,
+    main,
+    missing_frames,
+)
+
+
+def touch(directory, *names):
+    for name in names:
+        (directory / name).write_bytes(b"")
+
+
+@pytest.fixture(scope="function")
+def frames_dir(tmp_path):
+    # Beauty and diffuse passes, interleaved in one directory
+    touch(tmp_path, *(f"beauty.{f:04d}.exr" for f in range(1, 11) if f not in (3, 7)))
+    touch(tmp_path, *(f"diffuse.{f:04d}.exr" for f in range(1, 11) if f != 10))
+    # Ignored
+    touch(tmp_path, ".beauty.0003.exr", "notes.txt", "cover.png", "beauty.0003.exr.tmp")
+    (tmp_path / "0003.exr").mkdir()
+    return tmp_path
+
+
+def test_missing_frames():
+    assert missing_frames({1, 2, 4, 7}, 1, 8) == [3, 5, 6, 8]
+    assert missing_frames({1, 2, 4, 7}, 2, 4) == [3]
+    assert missing_frames(set(), 5, 6) == [5, 6]
+    assert missing_frames({1}, 2, 1) == []
+
+
+def test_sequence():
+    seq = Sequence("img_", "_L.png")
+    for frame, digits in ((9999, 4), (10000, 5), (10002, 5)):
+        seq.add(frame, digits)
+    assert seq.padding == 4
+    assert seq.pattern == "img_####_L.png"
+    assert seq.filename(12) == "img_0012_L.png"
+    assert seq.filename(10001) == "img_10001_L.png"
+    assert (seq.first, seq.last) == (9999, 10002)
+    assert seq.missing() == [10001]
+    assert seq.missing(9998, 10003) == [9998, 10001, 10003]
+
+
+def test_find_sequences(frames_dir):
+    touch(frames_dir, "img_1_L.PNG", "img_2_L.PNG", "img_10_L.PNG")
+    sequences = find_sequences(str(frames_dir))
+    assert [s.pattern for s in sequences] == ["beauty.####.exr", "diffuse.####.exr", "img_#_L.PNG"]
+    beauty, diffuse, img = sequences
+    assert beauty.frames == {1, 2, 4, 5, 6, 8, 9, 10}
+    assert diffuse.frames == set(range(1, 10))
+    assert img.frames == {1, 2, 10}
+    # Only given extensions
+    assert [s.pattern for s in find_sequences(str(frames_dir), [".png"])] == ["img_#_L.PNG"]
+
+
+def test_framechecker(frames_dir):
+    fc = Framechecker(str(frames_dir), 1, 11)
+    assert [(seq.pattern, missing) for seq, missing in fc.check()] == [
+        ("beauty.####.exr", [3, 7, 11]),
+        ("diffuse.####.exr", [10, 11]),
+    ]
+    # Frames found in any sequence
+    filename, contents, expected, found, missing = fc.generate_lists()
+    assert expected == list(range(1, 12))
+    assert found == list(range(1, 11))
+    assert missing == [11]
+    assert "notes.txt" in contents
+    assert fc.calculate_indices("beauty.0001.exr") == (7, 11)
+
+
+def test_framechecker_errors(tmp_path):
+    with pytest.raises(ValueError):
+        Framechecker(str(tmp_path / "nonexistent"), 1, 10)
+    touch(tmp_path, "notes.txt")
+    with pytest.raises(RuntimeError):
+        Framechecker(str(tmp_path), 1, 10)
+
+
+def test_format_ranges():
+    assert format_ranges([]) == ""
+    assert format_ranges([5]) == "5"
+    assert format_ranges(list(range(1, 101)) + [105] + list(range(110, 121))) == "1-100,105,110-120"
+    assert format_ranges([1, 3, 4]) == "1,3-4"
+
+
+def test_check_directories(frames_dir, tmp_path_factory):
+    show = tmp_path_factory.mktemp("show")
+    for shot in ("sh010", "sh020"):
+        (show / shot / "render").mkdir(parents=True)
+    touch(show / "sh010" / "render", *(f"img_{f:03d}.png" for f in range(1, 21) if f not in (5, 6, 7)))
+    touch(show / "sh020" / "render", *(f"img_{f:03d}.png" for f in range(1, 21)))
+    (show / ".cache" / "0001").mkdir(parents=True)
+    touch(show / ".cache" / "0001", "img_001.png")
+    results = list(check_directories([str(show), str(frames_dir)], recursive=True, workers=4))
+    by_dir = {(r["directory"], r.get("pattern")): r for r in results}
+    assert len(results) == len(by_dir) == 5
+    # No files in top level of a directory given
+    assert by_dir[(str(show), None)] == {"directory": str(show), "error": "No suitable files found in directory."}
+    assert by_dir[(str(show / "sh010" / "render"), "img_###.png")] == {
+        "directory": str(show / "sh010" / "render"),
+        "pattern": "img_###.png",
+        "padding": 3,
+        "first": 1,
+        "last": 20,
+        "found": 17,
+        "missing_count": 3,
+        "missing": "5-7",
+    }
+    assert by_dir[(str(show / "sh020" / "render"), "img_###.png")]["missing"] == ""
+    assert by_dir[(str(frames_dir), "beauty.####.exr")]["missing"] == "3,7"
+    assert by_dir[(str(frames_dir), "diffuse.####.exr")]["missing"] == ""
+    # Not recursive, with a frame range
+    results = list(check_directories([str(show / "sh020" / "render"), str(show / "nonexistent")], 1, 22))
+    assert len(results) == 2
+    assert {"directory": str(show / "nonexistent"), "error": "No such file or directory"} in results
+    assert {"directory": str(show / "sh020" / "render"), "missing": "21-22"}.items() <= next(
+        r for r in results if "missing" in r
+    ).items()
+
+
+def test_main(frames_dir, tmp_path, capsys):
+    assert main([str(frames_dir), "-x", ".exr,.PNG"]) == 1
+    out = capsys.readouterr().out
+    assert out == "beauty.####.exr: Possible missing frames: 3,7\ndiffuse.####.exr: No missing frames found\n"
+    assert main([str(frames_dir), "-s", "1", "-e", "9"]) == 1
+    assert "diffuse.####.exr: No missing frames found" in capsys.readouterr().out
+    assert main(["--json", "-s", "1", "-e", "2", str(frames_dir)]) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(r["pattern"], r["missing"]) for r in lines] == [("beauty.####.exr", ""), ("diffuse.####.exr", "")]
+    assert main(["--json", str(frames_dir), str(tmp_path / "nonexistent")]) == 2
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(lines) == 3
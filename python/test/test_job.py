@@ -1,8 +1,13 @@
 import pytest
+import json
 import time
+import queue
+import threading
 from unittest import mock
 
 from rendercontroller.job import Executor, RenderJob
+from rendercontroller.renderthread import CompletionRecord
+from rendercontroller.scheduler import NodeAllocator
 from rendercontroller.constants import (
     WAITING,
     RENDERING,
@@ -25,6 +30,7 @@ def render_nodes():
 def mconf(render_nodes):
     c = mock.MagicMock(name="rendercontroller.util.Config")
     c.render_nodes = render_nodes
+    c.get.side_effect = lambda key, default=None: default
     return c
 
 
@@ -114,7 +120,7 @@ def test_executor_frame(exec1):
 
     # Assign thread
     exec1.thread = thread
-    exec1.thread.frame = 5
+    exec1.thread.current_frame = 5
     assert exec1.frame == 5
 
 
@@ -203,6 +209,93 @@ def test_executor_render_terragen(tthread, exec1, exec1_data):
         exec1.render(6)
 
 
+@mock.patch("rendercontroller.job.BlenderRenderThread")
+def test_executor_render_chunk(bthread, exec1, exec1_data):
+    bthread.return_value.status = WAITING
+    exec1.render(5, 8)
+    bthread.assert_called_once_with(
+        config=exec1_data["config"],
+        job_id=exec1_data["job_id"],
+        node=exec1_data["node"],
+        path=exec1_data["path"],
+        frame=5,
+        on_update=None,
+        end_frame=8,
+        completions=None,
+        pool=None,
+        watchdog=None,
+        ssh=None,
+        backend=None,
+    )
+    # Terragen can only render one frame at a time
+    exec1.engine = TERRAGEN
+    with pytest.raises(ValueError):
+        exec1.render(5, 8)
+
+
+@mock.patch("rendercontroller.job.AgentRenderThread")
+def test_executor_render_agent(athread, mconf):
+    agents = mock.MagicMock(name="AgentConnections")
+    ex = Executor(config=mconf, job_id="job01", node="node1", path="/tmp/job1.blend", agents=agents)
+    athread.return_value.status = WAITING
+    ex.render(5, 6)
+    assert ex.thread is athread.return_value
+    agents.get.assert_called_once_with("node1")
+    assert athread.call_args[1]["agent"] is agents.get.return_value
+    assert athread.call_args[1]["engine"] == BLENDER
+    assert athread.call_args[1]["end_frame"] == 6
+    athread.return_value.start.assert_called_once()
+
+
+@mock.patch("rendercontroller.job.PersistentBlenderRenderThread")
+@mock.patch("rendercontroller.job.BlenderWorkerProcess")
+def test_executor_render_persistent(process, pthread, mconf):
+    mconf.get.side_effect = lambda key, default=None: {
+        "blender_persistent_worker": True
+    }.get(key, default)
+    ex = Executor(config=mconf, job_id="job01", node="node1", path="/tmp/job1.blend")
+    assert ex.persistent
+    pthread.return_value.status = WAITING
+    process.return_value.is_alive.return_value = True
+    ex.render(5, 6)
+    process.assert_called_once_with(mconf, "job01", "node1", "/tmp/job1.blend", ssh=None)
+    assert pthread.call_args[1]["process"] is process.return_value
+    assert pthread.call_args[1]["end_frame"] == 6
+    # Worker process is reused for next frame
+    ex.ack_done()
+    ex.render(7)
+    process.assert_called_once()
+    # ...unless it has exited
+    ex.ack_done()
+    process.return_value.is_alive.return_value = False
+    ex.render(8)
+    assert process.call_count == 2
+    ex.ack_done()
+    ex.close()
+    process.return_value.close.assert_called_once()
+    assert ex.worker_process is None
+
+    # Never used for Terragen
+    ex = Executor(config=mconf, job_id="job01", node="node1", path="/tmp/job1.tgd")
+    assert not ex.persistent
+
+
+def test_executor_pop_finished_frames(exec1):
+    assert exec1.pop_finished_frames() == []
+    assert exec1.unfinished_frames() == []
+    assert exec1.frames == ()
+    exec1.thread = mock.MagicMock(name="RenderThread")
+    exec1.thread.frames = (1, 2, 3)
+    exec1.thread.frames_finished = [1]
+    exec1.thread.unfinished_frames.return_value = [2, 3]
+    assert exec1.frames == (1, 2, 3)
+    assert exec1.pop_finished_frames() == [1]
+    assert exec1.pop_finished_frames() == []
+    exec1.thread.frames_finished.append(2)
+    assert exec1.pop_finished_frames() == [2]
+    assert exec1.unfinished_frames() == [2, 3]
+
+
 @mock.patch("rendercontroller.job.Terragen3RenderThread")
 @mock.patch("rendercontroller.job.BlenderRenderThread")
 def test_executor_render_unknown_engine(bthread, tthread, exec1):
@@ -272,18 +365,18 @@ def job1(db, mconf, testjob1):
         end_frame=testjob1["end_frame"],
         render_nodes=testjob1["render_nodes"],
     )
-    job.master_thread = mock.MagicMock(name="RenderJob.master_thread")
+    job.dispatcher = mock.MagicMock(name="Dispatcher")
     return job
 
 
 @pytest.fixture(scope="function")
 @mock.patch("rendercontroller.job.StateDatabase")
 @mock.patch("rendercontroller.job.BlenderRenderThread")
-@mock.patch("rendercontroller.job.RenderJob._mainloop")
-def job2(ml, rt, db, testjob2, mconf):
+@mock.patch("rendercontroller.job.Dispatcher")
+def job2(dispatcher, rt, db, testjob2, mconf):
     """RenderJob fixture representing a job that is currently rendering.
 
-    Mainloop is mocked to prevent render from starting automatically."""
+    Dispatcher is mocked to prevent render from starting automatically."""
     rt.return_value = None
     job = RenderJob(
         config=mconf,
@@ -372,6 +465,18 @@ def test_job_init_new(render, db, render_nodes, testjob1, mconf):
             end_frame=5,
             render_nodes=("node1", "bogusnode"),
         )
+    # Case 3: weight is not a finite positive number
+    for weight in (0.0, float("nan"), float("inf")):
+        with pytest.raises(ValueError):
+            RenderJob(
+                config=mconf,
+                id="failjob",
+                path="/tmp/failjob",
+                start_frame=1,
+                end_frame=5,
+                render_nodes=render_nodes,
+                weight=weight,
+            )
 
 
 @mock.patch("rendercontroller.job.StateDatabase")
@@ -451,18 +556,43 @@ def test_job_set_status(job1, testjob1):
     job1.db.update_job_status.assert_called_with(testjob1["id"], STOPPED)
 
 
+def test_job_status_listeners(job1):
+    listener = mock.MagicMock(name="listener")
+    job1.add_status_listener(listener)
+    job1.add_status_listener(listener)  # Duplicates are ignored
+    assert job1.status_listeners == [listener]
+    job1._set_status(STOPPED)
+    listener.assert_called_once_with(job1, WAITING)
+
+    job1.remove_status_listener(listener)
+    job1.remove_status_listener(listener)  # Does nothing if not registered
+    job1._set_status(WAITING)
+    listener.assert_called_once()
+
+
+def test_job_in_tail(job1):
+    assert not job1.in_tail()  # Not rendering
+    job1.status = RENDERING
+    assert not job1.in_tail()  # Frames still in queue
+    while not job1.queue.empty():
+        job1.queue.get()
+    assert job1.in_tail()
+    job1._stop = True
+    assert not job1.in_tail()
+
+
 @mock.patch("rendercontroller.job.RenderJob._reset_render_state")
 @mock.patch("rendercontroller.job.RenderJob._start_timer")
 def test_job_render_new(timer, reset_state, job1):
     """Tests render() on a job that has never been rendered."""
     timer.assert_not_called()
-    job1.master_thread.start.assert_not_called()
+    job1.dispatcher.add.assert_not_called()
     assert job1.status == WAITING
 
     job1.render()
     assert job1.status == RENDERING
     timer.assert_called_once()
-    job1.master_thread.start.assert_called_once()
+    job1.dispatcher.add.assert_called_once_with(job1)
     reset_state.assert_not_called()
 
     # Should not render a job that's already rendering
@@ -488,44 +618,196 @@ def test_job_render_resume(timer, reset_state, job1):
 
 @mock.patch("rendercontroller.job.RenderJob._stop_timer")
 def test_job_stop(timer, job1):
-    thread = mock.MagicMock(name="threading.Thread")
-    job1.master_thread = thread
-    executors = {
-        node: mock.MagicMock(name=f"Executor.{node}")
-        for node in job1.config.render_nodes
-    }
+    executors = {}
+    for node in job1.config.render_nodes:
+        executors[node] = mock.MagicMock(name=f"Executor.{node}", node=node)
+        executors[node].is_idle.return_value = False
+        executors[node].kill.return_value = True
     job1.executors = executors
     job1.render()
     assert job1._stop is False
     assert job1.status == RENDERING
     for ex in executors.values():
-        ex.stop.assert_not_called()
+        ex.kill.assert_not_called()
     timer.assert_not_called()
-    thread.join.assert_not_called()
 
-    # Case 1: master thread is still running
-    thread.is_alive.return_value = True
-    job1.stop()
+    # Waits for dispatcher to finish with job
+    job1.dispatcher.notify.side_effect = lambda job: job._dispatch_finished()
+    assert job1.stop() == []
     assert job1._stop is True
     assert job1.status == STOPPED
     for ex in executors.values():
-        ex.stop.assert_called_once()
-    thread.join.assert_called_once()
+        ex.kill.assert_called_once()
+        assert 0 < ex.kill.call_args[0][0] <= 15.0
+    job1.dispatcher.notify.assert_called_once_with(job1)
+    job1.dispatcher.remove.assert_called_once_with(job1)
     timer.assert_called_once()
 
-    # Case 2: master thread has already exited
-    thread.reset_mock()
-    thread.is_alive.return_value = False
-    job1.status = RENDERING
-    job1.stop()
-    thread.join.assert_not_called()
-    assert job1.status == STOPPED
-
     # Raise exception if job is already stopped
     with pytest.raises(JobStatusError):
         job1.stop()
 
 
+@mock.patch("rendercontroller.job.RenderJob._stop_timer")
+def test_job_stop_deadline(timer, job1):
+    release = threading.Event()
+    executors = {}
+    for node in job1.config.render_nodes:
+        executors[node] = mock.MagicMock(name=f"Executor.{node}", node=node)
+        executors[node].is_idle.return_value = False
+        executors[node].kill.return_value = True
+    # node1 can't be confirmed killed, node2 never responds at all.
+    executors["node1"].kill.return_value = False
+    executors["node2"].kill.side_effect = lambda timeout: release.wait()
+    job1.executors = executors
+    job1.render()
+    start = time.monotonic()
+    assert job1.stop(timeout=0.5) == ["node1", "node2"]
+    assert time.monotonic() - start < 1.5
+    assert job1.status == STOPPED
+    for ex in executors.values():
+        ex.kill.assert_called_once()
+    # Job can't be restarted until the dispatcher has finished with it.
+    with pytest.raises(JobStatusError):
+        job1.render()
+    release.set()
+    job1._dispatch_finished()
+    with mock.patch("rendercontroller.job.RenderJob._start_timer"):
+        job1.render()
+    assert job1.status == RENDERING
+
+
+def mock_rendering_executor(node, frames, pid=None):
+    ex = mock.MagicMock(name=f"Executor.{node}", node=node, pid=pid)
+    ex.is_idle.return_value = False
+    ex.unfinished_frames.return_value = frames
+    ex.thread.time_start = 100.0
+    ex.kill.return_value = True
+    return ex
+
+
+def test_job_in_flight(job1):
+    job1.executors["node1"] = mock_rendering_executor("node1", [3, 4], pid=101)
+    job1.executors["node2"] = mock_rendering_executor("node2", [5])
+    job1.frames_completed.add(5)  # Copy finished elsewhere
+    assert job1.in_flight() == {"node1": {"frames": [3, 4], "pid": 101, "time_start": 100.0}}
+
+    # Only saved when changed
+    job1._save_in_flight()
+    job1._save_in_flight()
+    job1.db.update_job_in_flight.assert_called_once_with(job1.id, job1.in_flight())
+    job1.executors["node1"].unfinished_frames.return_value = [4]
+    job1._save_in_flight()
+    assert job1.db.update_job_in_flight.call_count == 2
+    job1.db.update_job_in_flight.assert_called_with(
+        job1.id, {"node1": {"frames": [4], "pid": 101, "time_start": 100.0}}
+    )
+
+
+@mock.patch("rendercontroller.job.RenderJob._stop_timer")
+def test_job_suspend(timer, job1):
+    job1.render()
+    job1.executors["node1"] = mock_rendering_executor("node1", [3], pid=101)
+    job1.executors["node2"] = mock_rendering_executor("node2", [4], pid=102)
+    job1.executors["node2"].kill.return_value = False
+    job1.dispatcher.notify.side_effect = lambda job: job._dispatch_finished()
+    assert job1.suspend() == ["node2"]
+    # Job is resumed when the server starts again.
+    assert job1.status == RENDERING
+    job1.db.update_job_status.assert_called_once_with(job1.id, RENDERING)
+    timer.assert_called_once()
+    for ex in job1.executors.values():
+        if ex.node in ("node1", "node2"):
+            ex.kill.assert_called_once()
+    # Only the process that could not be confirmed killed is left to the next server.
+    job1.db.update_job_in_flight.assert_called_with(
+        job1.id,
+        {
+            "node1": {"frames": [3], "pid": None, "time_start": 100.0},
+            "node2": {"frames": [4], "pid": 102, "time_start": 100.0},
+        },
+    )
+    # In-flight state is not overwritten as the killed frames are returned to queue.
+    calls = job1.db.update_job_in_flight.call_count
+    job1.executors["node1"].is_idle.return_value = True
+    job1._save_in_flight()
+    assert job1.db.update_job_in_flight.call_count == calls
+
+
+def test_job_learn_output_path(job1):
+    job1.queue = mock.MagicMock(name="queue.LiFoQueue")
+    ex = mock.MagicMock(name="Executor", node="node1", output_path=None)
+    ex.pop_finished_frames.return_value = [7]
+    ex.thread.frames_finished = [7]
+    job1._collect_finished_frames(ex)
+    assert job1.output_path == ""
+    ex.output_path = "/tmp/render/job1_0007.png"
+    ex.pop_finished_frames.return_value = [8]
+    ex.thread.frames_finished = [7, 8]
+    job1._collect_finished_frames(ex)
+    assert job1.output_path == ""  # Path is not for frame 8
+    ex.output_path = "/tmp/render/job1_0008.png"
+    ex.pop_finished_frames.return_value = [9]
+    ex.thread.frames_finished = [7, 8]
+    job1._collect_finished_frames(ex)
+    assert job1.output_path == "/tmp/render/job1_####.png"
+    job1.db.update_job_output_path.assert_called_once_with(job1.id, "/tmp/render/job1_####.png")
+
+
+def test_job_render_registers_with_allocator(job1):
+    job1.allocator = mock.MagicMock(name="NodeAllocator")
+    job1.render()
+    job1.allocator.register.assert_called_with(job1)
+
+
+def test_job_set_weight(job1, testjob1):
+    assert job1.weight == 1.0
+    job1.set_weight(2.5)
+    assert job1.weight == 2.5
+    job1.db.update_job_weight.assert_called_with(testjob1["id"], 2.5)
+    for weight in (0, -1.0, float("nan"), float("inf")):
+        with pytest.raises(ValueError):
+            job1.set_weight(weight)
+    assert job1.weight == 2.5
+
+
+def test_job_set_priority(job1):
+    assert job1.priority == 0
+    version = job1.version
+    job1.set_priority(-3)
+    assert job1.priority == -3
+    job1.db.update_job_priority.assert_called_with(job1.id, -3)
+    assert job1.version > version
+
+
+def test_job_node_demand(job1):
+    # 101 frames in queue, but only 2 nodes enabled
+    assert job1.node_demand() == 2
+    while job1.queue.qsize() > 1:
+        job1.queue.get()
+    assert job1.node_demand() == 1
+    # Active frames count toward demand
+    job1.executors["node2"].idle = False
+    assert job1.node_demand() == 2
+    # Stopping job only needs the nodes that are still rendering
+    job1._stop = True
+    assert job1.node_demand() == 1
+
+
+def test_job_can_use_node(job1):
+    assert job1.can_use_node("node1")
+    assert not job1.can_use_node("node3")  # Not enabled
+    assert not job1.can_use_node("bogus")
+    job1.skip_list.append("node1")
+    assert not job1.can_use_node("node1")
+    job1.executors["node2"].idle = False
+    assert not job1.can_use_node("node2")
+    job1.executors["node2"].idle = True
+    assert job1.can_use_node("node2")
+    job1._stop = True
+    assert not job1.can_use_node("node2")
+
+
 def test_job_enable_waiting(job1):
     with pytest.raises(JobStatusError):
         job1.reset_waiting()
@@ -655,6 +937,8 @@ def test_job_dump(job1, job2, render_nodes, testjob1, testjob2):
         "time_elapsed": 0.0,
         "time_avg_per_frame": 0.0,
         "time_remaining": 0.0,
+        "time_remaining_low": 0.0,
+        "time_remaining_high": 0.0,
         "frames_completed": set(),
         "progress": 0.0,
         "node_status": {
@@ -666,6 +950,10 @@ def test_job_dump(job1, job2, render_nodes, testjob1, testjob2):
             }
             for node in render_nodes
         },
+        "weight": 1.0,
+        "priority": 0,
+        "chunk_size": 1,
+        "node_share": None,
     }
     # Case 2: Job that has been rendering
     elapsed, avg, rem = job2.get_times()
@@ -681,6 +969,8 @@ def test_job_dump(job1, job2, render_nodes, testjob1, testjob2):
     assert dump["time_elapsed"] == pytest.approx(elapsed)
     assert dump["time_avg_per_frame"] == pytest.approx(avg)
     assert dump["time_remaining"] == pytest.approx(rem)
+    assert dump["time_remaining_low"] == pytest.approx(rem)
+    assert dump["time_remaining_high"] == pytest.approx(rem)
     assert dump["frames_completed"] == testjob2["frames_completed"]
     assert dump["progress"] == job2.get_progress()
     # Master thread is mocked, so node status should be defaults
@@ -695,6 +985,84 @@ def test_job_dump(job1, job2, render_nodes, testjob1, testjob2):
     }
 
 
+def test_job_snapshot(job1):
+    snap = job1.snapshot()
+    expected = job1.dump()
+    expected.pop("frames_completed")
+    assert snap == expected
+    assert json.loads(job1.snapshot_json()) == expected
+    # Cached until job state changes
+    with mock.patch.object(job1, "dump", wraps=job1.dump) as dump:
+        assert job1.snapshot() is snap
+        job1.snapshot_json()
+        dump.assert_not_called()
+        version = job1.version
+        job1.disable_node("node1")
+        assert job1.version > version
+        snap2 = job1.snapshot()
+        dump.assert_called_once()
+        assert snap2 is not snap
+        assert snap2["node_status"]["node1"]["enabled"] is False
+        assert json.loads(job1.snapshot_json()) == snap2
+
+
+@mock.patch("time.time")
+def test_job_snapshot_rendering(time, job1):
+    """Rendering jobs' snapshots are refreshed once per second to keep times current."""
+    time.return_value = 100.0
+    job1.status = RENDERING
+    job1.time_start = 50.0
+    snap = job1.snapshot()
+    assert snap["time_elapsed"] == 50.0
+    time.return_value = 100.9
+    assert job1.snapshot() is snap
+    time.return_value = 101.0
+    assert job1.snapshot()["time_elapsed"] == 51.0
+
+
+def test_job_snapshot_allocator(job1):
+    """Other jobs sharing nodes only affect a job's snapshot while it is sharing them too."""
+    alloc = NodeAllocator()
+    job1.allocator = alloc
+    job1.status = FINISHED
+    other = mock.MagicMock(name="RenderJob")
+    other.id = "job02"
+    other.weight = 1.0
+    other.get_enabled_nodes.return_value = ("node1",)
+    other.node_demand.return_value = 1
+    alloc.register(other)
+    snap = job1.snapshot()
+    assert alloc.try_claim(other, "node1")
+    alloc.release(other, "node1")
+    alloc.invalidate()
+    assert job1.snapshot() is snap
+    alloc.register(job1)
+    assert job1.snapshot() is not snap
+    snap = job1.snapshot()
+    alloc.invalidate()
+    assert job1.snapshot() is not snap
+
+
+def test_job_snapshot_versions(job1):
+    """Every change that affects dump() must increment version."""
+    version = job1.version
+    job1._set_status(STOPPED)
+    assert job1.version > version
+    version = job1.version
+    job1.set_weight(2.0)
+    assert job1.version > version
+    version = job1.version
+    job1.enable_node("node3")
+    assert job1.version > version
+    version = job1.version
+    job1._stop_timer()
+    assert job1.version > version
+    # Executors report render progress
+    version = job1.version
+    job1.executors["node1"].on_update()
+    assert job1.version > version
+
+
 @mock.patch("rendercontroller.job.Executor")
 def test_job_executors_active(ex, job1):
     assert job1.executors_active() is False
@@ -861,7 +1229,8 @@ def test_job_frame_finished(pop, job1):
     job1.queue.task_done.assert_not_called()
     ex = mock.MagicMock(name="Executor")
     ex.ack_done.assert_not_called()
-    ex.frame = frame
+    ex.frames = (frame,)
+    ex.pop_finished_frames.return_value = [frame]
     ex.node = "node1"
     ex.elapsed_time.return_value = 123.456
     pop.assert_not_called()
@@ -874,13 +1243,39 @@ def test_job_frame_finished(pop, job1):
     job1.db.update_job_frames_completed.assert_called_with(job1.id, {5})
     pop.assert_called_once()
 
+    # Node is returned to allocator
+    ex.pop_finished_frames.return_value = []
+    job1.allocator = mock.MagicMock(name="NodeAllocator")
+    job1._frame_finished(ex)
+    job1.allocator.release.assert_called_with(job1, "node1")
+
+
+def test_job_collect_finished_frames(job1):
+    """Frames in a chunk are marked complete as they are saved, before the chunk is done."""
+    job1.queue = mock.MagicMock(name="queue.LiFoQueue")
+    ex = mock.MagicMock(name="Executor")
+    ex.node = "node1"
+    ex.pop_finished_frames.return_value = []
+    job1._collect_finished_frames(ex)
+    job1.db.update_job_frames_completed.assert_not_called()
+
+    ex.pop_finished_frames.return_value = [10, 11]
+    version = job1.version
+    job1._collect_finished_frames(ex)
+    assert job1.frames_completed == {10, 11}
+    assert job1.queue.task_done.call_count == 2
+    job1.db.update_job_frames_completed.assert_called_once_with(job1.id, {10, 11})
+    assert job1.version > version
+    ex.ack_done.assert_not_called()
+
 
 def test_job_frame_failed(job1):
     frame = 5
     node = "node1"
     job1.queue = mock.MagicMock(name="queue.LiFoQueue")
     ex = mock.MagicMock(name="Executor")
-    ex.frame = frame
+    ex.pop_finished_frames.return_value = []
+    ex.unfinished_frames.return_value = [frame]
     ex.node = node
     ex.ack_done.assert_not_called()
     assert node not in job1.skip_list
@@ -904,6 +1299,311 @@ def test_job_frame_failed(job1):
     assert node not in job1.skip_list
     ex.ack_done.assert_called_once()
 
+    # Node is returned to allocator
+    job1.allocator = mock.MagicMock(name="NodeAllocator")
+    job1._frame_failed(ex)
+    job1.allocator.release.assert_called_with(job1, node)
+
+
+def test_job_next_chunk(job1):
+    ex = mock.MagicMock(name="Executor")
+    ex.supports_chunks = True
+    job1.chunk_size = 4
+    assert len(job1.get_enabled_nodes()) == 2
+    job1.queue = queue.LifoQueue()
+    for frame in (30, 29, 28, 27, 26, 25, 24, 23, 22, 5, 21, 20):
+        job1.queue.put(frame)
+    # Chunks stop at a gap in the frame sequence
+    assert job1._next_chunk(ex) == [20, 21]
+    assert job1._next_chunk(ex) == [5]
+    assert job1._next_chunk(ex) == [22, 23, 24, 25]
+    # Chunks get smaller near the end so the remaining frames are spread over all enabled nodes
+    assert job1._next_chunk(ex) == [26, 27, 28]
+    assert job1._next_chunk(ex) == [29]
+    assert job1._next_chunk(ex) == [30]
+    assert job1.queue.empty()
+    # Render engine does not support chunks
+    ex.supports_chunks = False
+    job1.queue.put(2)
+    job1.queue.put(1)
+    assert job1._next_chunk(ex) == [1]
+
+
+def test_job_node_demand_chunks(job1):
+    job1.chunk_size = 10
+    job1.queue = queue.LifoQueue()
+    for frame in range(100):
+        job1.queue.put(frame)
+    # 2 nodes enabled, and there are enough chunks for both
+    assert job1.node_demand() == 2
+    job1.queue = queue.LifoQueue()
+    job1.queue.put(1)
+    assert job1.node_demand() == 1
+
+
+def test_job_record_frame_time(job1):
+    ex = mock.MagicMock(name="Executor")
+    ex.node = "node1"
+    ex.frames = (5, 6)
+    ex.elapsed_time.return_value = 20.0
+    job1._record_frame_time(ex)
+    assert job1.node_stats.frame_time("job01", "node1") == 10.0
+    assert job1.frame_costs == {5: 10.0, 6: 10.0}
+
+
+def test_job_take_heaviest_frame(job1):
+    job1.queue = queue.LifoQueue()
+    for frame in (8, 7, 6, 5):
+        job1.queue.put(frame)
+    # Nothing rendered yet, so queue order
+    assert job1._take_heaviest_frame() == 5
+    job1.queue.put(5)
+    job1.frame_costs = {0: 10.0, 10: 50.0}
+    assert job1._estimated_cost(5) == 10.0
+    assert job1._estimated_cost(6) == 50.0
+    assert job1._take_heaviest_frame() == 6
+    assert [job1.queue.get() for _ in range(3)] == [5, 7, 8]
+
+
+def test_job_next_chunk_tail(job1):
+    """Frames are handed out heaviest first when there is one left for each node."""
+    ex = mock.MagicMock(name="Executor")
+    ex.supports_chunks = True
+    job1.chunk_size = 4
+    job1.frame_costs = {1: 10.0, 2: 20.0, 3: 5.0}
+    job1.queue = queue.LifoQueue()
+    for frame in (3, 2, 1):
+        job1.queue.put(frame)
+    assert job1._next_chunk(ex) == [1, 2]
+    assert job1._next_chunk(ex) == [3]
+
+
+@pytest.fixture(scope="function")
+def job1_mexecutors(job1):
+    """job1 with mock executors that are all idle."""
+    enabled = job1.get_enabled_nodes()
+    for node in job1.config.render_nodes:
+        ex = mock.MagicMock(name=f"Executor {node}")
+        ex.node = node
+        ex.frames = ()
+        ex.is_enabled.return_value = node in enabled
+        ex.is_idle.return_value = True
+        job1.executors[node] = ex
+    return job1
+
+
+def test_job_leave_for_faster_node(job1_mexecutors):
+    job1 = job1_mexecutors
+    job1.queue = queue.LifoQueue()
+    job1.queue.put(50)
+    # No speed history yet
+    assert not job1._leave_for_faster_node("node2")
+    job1.node_stats.record("job01", "node1", 10.0)
+    job1.node_stats.record("job01", "node2", 40.0)
+    # node1 is busy but will finish its frame and the next one long before node2 could
+    fast = job1.executors["node1"]
+    fast.is_idle.return_value = False
+    fast.frames = (49,)
+    fast.elapsed_time.return_value = 5.0
+    assert job1._leave_for_faster_node("node2")
+    assert not job1._leave_for_faster_node("node1")
+    # Not if node1 will take longer
+    fast.elapsed_time.return_value = 0.0
+    fast.frames = (47, 48, 49)
+    assert not job1._leave_for_faster_node("node2")
+    fast.frames = (49,)
+    # Not if there are frames for both
+    job1.queue.put(51)
+    assert not job1._leave_for_faster_node("node2")
+    job1.queue.get()
+    # Not if node1 can't take it
+    job1.skip_list.append("node1")
+    assert not job1._leave_for_faster_node("node2")
+    job1.skip_list.clear()
+    fast.is_enabled.return_value = False
+    assert not job1._leave_for_faster_node("node2")
+    fast.is_enabled.return_value = True
+    fast.is_idle.return_value = True
+    job1.allocator = mock.MagicMock(name="NodeAllocator")
+    job1.allocator.owner.return_value = "job02"
+    assert not job1._leave_for_faster_node("node2")
+    job1.allocator.owner.return_value = ""
+    assert job1._leave_for_faster_node("node2")
+
+
+def test_job_drain_time():
+    assert RenderJob._drain_time(0, []) == 0.0
+    # Nothing in queue, waiting for frames in progress
+    assert RenderJob._drain_time(0, [(5.0, 10.0), (8.0, 10.0)]) == 8.0
+    # Fast node renders 2 frames while the slow one renders 1
+    assert RenderJob._drain_time(3, [(0.0, 10.0), (0.0, 20.0)]) == pytest.approx(20.0)
+    # Frames in queue are shared once nodes are free
+    assert RenderJob._drain_time(4, [(5.0, 10.0), (0.0, 10.0)]) == pytest.approx(22.5)
+    # Can't finish before a whole frame is rendered
+    assert RenderJob._drain_time(1, [(5.0, 10.0), (0.0, 10.0)]) == 10.0
+
+
+def test_job_estimate_remaining(job1_mexecutors):
+    job1 = job1_mexecutors
+    job1.frames_completed = set(range(91))
+    # No history, so falls back to average time per frame
+    job1.time_start = 100.0
+    job1.time_stop = 1010.0
+    assert job1.estimate_remaining() == (100.0, 100.0, 100.0)
+    for _ in range(2):
+        job1.node_stats.record(job1.id, "node1", 10.0)
+        job1.node_stats.record(job1.id, "node2", 10.0)
+    # node1 is halfway through frame 91, node2 is idle, 9 frames in queue
+    ex1 = job1.executors["node1"]
+    ex1.is_idle.return_value = False
+    ex1.unfinished_frames.return_value = [91]
+    ex1.progress = 50.0
+    assert job1.estimate_remaining() == (47.5, 47.5, 47.5)
+    assert job1.get_times()[2] == 47.5
+    # Varying frame times give a confidence interval
+    job1.node_stats.record(job1.id, "node1", 20.0)
+    job1.node_stats.record(job1.id, "node2", 5.0)
+    rem, low, high = job1.estimate_remaining()
+    assert low < rem < high
+    # Only the nodes the job is entitled to count
+    job1.allocator = mock.MagicMock(name="NodeAllocator")
+    job1.allocator.share.return_value = 1
+    assert job1._get_estimate_nodes() == ["node1"]
+    job1.allocator.share.return_value = 0
+    assert job1._get_estimate_nodes() == ["node1", "node2"]
+    # Finished
+    job1.frames_completed = set(range(101))
+    assert job1.estimate_remaining() == (0.0, 0.0, 0.0)
+
+
+def test_job_straggler_threshold(job1):
+    assert job1._straggler_threshold() is None
+    job1.frame_durations = [30.0, 10.0]
+    assert job1._straggler_threshold() is None
+    job1.frame_durations.append(20.0)
+    assert job1._straggler_threshold() == 40.0
+    job1.config.get.side_effect = lambda key, default=None: {
+        "speculation_factor": 3.0
+    }.get(key, default)
+    # Cached until more frames finish
+    assert job1._straggler_threshold() == 40.0
+    job1.frame_durations.append(20.0)
+    assert job1._straggler_threshold() == 60.0
+
+
+def rendering(ex, frames, elapsed=0.0):
+    """Makes a mock executor look like it is rendering."""
+    ex.is_idle.return_value = False
+    ex.status = RENDERING
+    ex.frames = tuple(frames)
+    ex.unfinished_frames.return_value = list(frames)
+    ex.pop_finished_frames.return_value = []
+    ex.elapsed_time.return_value = elapsed
+    ex.thread.time_start = 1.0
+
+
+def completed(ex, status):
+    """Returns the completion record a mock executor's render thread would post."""
+    ex.status = status
+    return CompletionRecord(
+        ex.job_id, ex.node, tuple(ex.frames), (), status, ex.thread.time_start, 2.0, 123
+    )
+
+
+def test_job_next_straggler(job1_mexecutors):
+    job1 = job1_mexecutors
+    ex1, ex2 = job1.executors["node1"], job1.executors["node2"]
+    rendering(ex1, [50], elapsed=30.0)
+    # Not enough history
+    assert job1._next_straggler() is None
+    job1.frame_durations = [10.0, 10.0, 10.0]
+    assert job1._next_straggler() == 50
+    ex1.elapsed_time.return_value = 15.0
+    assert job1._next_straggler() is None
+    ex1.elapsed_time.return_value = 30.0
+    # Chunks are not copied
+    rendering(ex1, [50, 51], elapsed=30.0)
+    assert job1._next_straggler() is None
+    rendering(ex1, [50], elapsed=30.0)
+    # Already copied
+    rendering(ex2, [50])
+    assert job1._next_straggler() is None
+
+
+def test_job_speculate(job1_mexecutors):
+    job1 = job1_mexecutors
+    ex1, ex2 = job1.executors["node1"], job1.executors["node2"]
+    job1._speculate(ex2)
+    ex2.render.assert_not_called()
+    job1.frame_durations = [10.0, 10.0, 10.0]
+    rendering(ex1, [50], elapsed=30.0)
+    job1._speculate(ex2)
+    ex2.render.assert_called_once_with(50)
+
+
+@pytest.mark.parametrize("loser_status", [FAILED, FINISHED])
+def test_job_speculative_copy_wins(job1_mexecutors, loser_status):
+    """First copy of a frame to finish is counted, the other is stopped."""
+    job1 = job1_mexecutors
+    job1.queue = queue.LifoQueue()
+    job1.queue.put(50)
+    job1.queue.get()
+    ex1, ex2 = job1.executors["node1"], job1.executors["node2"]
+    rendering(ex1, [50], elapsed=30.0)
+    rendering(ex2, [50])
+    ex2.pop_finished_frames.return_value = [50]
+    ex2.unfinished_frames.return_value = []
+    job1._frame_done(completed(ex2, FINISHED))
+    assert 50 in job1.frames_completed
+    ex2.ack_done.assert_called_once()
+    ex1.stop.assert_called_once()
+    assert job1._cancelled == {"node1"}
+    job1.db.update_job_frames_completed.assert_called_once()
+
+    # Stopped copy is acknowledged without counting the frame again or penalizing the node
+    if loser_status == FINISHED:
+        ex1.pop_finished_frames.return_value = [50]
+        ex1.unfinished_frames.return_value = []
+    job1._frame_done(completed(ex1, loser_status))
+    ex1.ack_done.assert_called_once()
+    assert job1._cancelled == set()
+    assert job1.skip_list == []
+    assert job1.queue.empty()
+    job1.db.update_job_frames_completed.assert_called_once()
+    assert len(job1.frame_durations) == 1
+
+
+def test_job_speculative_copy_failed(job1_mexecutors):
+    """Frame is not returned to queue if one copy fails while the other is still rendering."""
+    job1 = job1_mexecutors
+    job1.queue = queue.LifoQueue()
+    ex1, ex2 = job1.executors["node1"], job1.executors["node2"]
+    rendering(ex1, [50], elapsed=30.0)
+    rendering(ex2, [50])
+    job1._frame_done(completed(ex2, FAILED))
+    assert job1.queue.empty()
+    assert job1.skip_list == ["node2"]
+    ex2.is_idle.return_value = True  # Set by ack_done()
+    # Last copy failed
+    job1._frame_done(completed(ex1, FAILED))
+    assert job1.queue.get_nowait() == 50
+
+
+def test_job_chunk_failed(job1):
+    """Only frames of a failed chunk that were not saved are returned to queue."""
+    job1.queue = queue.LifoQueue()
+    for frame in range(14, 9, -1):
+        job1.queue.put(frame)
+    assert [job1.queue.get() for _ in range(5)] == [10, 11, 12, 13, 14]
+    ex = mock.MagicMock(name="Executor")
+    ex.node = "node1"
+    ex.pop_finished_frames.return_value = [10, 11]
+    ex.unfinished_frames.return_value = [12, 13, 14]
+    job1._frame_failed(ex)
+    assert job1.frames_completed == {10, 11}
+    assert [job1.queue.get() for _ in range(3)] == [12, 13, 14]
+    assert job1.queue.empty()
+
 
 def test_job_pop_skipped_node(job1):
     # Case 1: skip list empty
@@ -919,18 +1619,21 @@ def test_job_pop_skipped_node(job1):
 
 def test_job_reset_render_state(job1):
     job1._stop = True
-    thread_before = id(job1.master_thread)
-    executors_before = {}
-    for name, ex in job1.executors.items():
-        executors_before[name] = id(ex)
+    job1._dispatch_done.set()
+    executors_before = dict(job1.executors)
+    job1.executors["node1"].thread = mock.MagicMock(name="RenderThread")
+    job1.executors["node1"].idle = False
     new_enabled = ("node2", "node4")
 
     job1._reset_render_state(new_enabled)
     assert not job1._stop
+    # Executors are reused
     for name, ex in job1.executors.items():
-        assert id(ex) != executors_before[name]
+        assert ex is executors_before[name]
+        assert ex.is_idle()
+        assert ex.thread is None
 
-    assert id(job1.master_thread) != thread_before
+    assert not job1._dispatch_done.is_set()
     assert sorted(job1.get_enabled_nodes()) == sorted(new_enabled)
 
 
@@ -941,28 +1644,12 @@ def test_job_executor_is_ready(ffin, ffail, job1):
     ex.is_enabled.return_value = True
     ex.node = "node1"
 
-    # Case 1: Executor is not idle
+    # Case 1: Executor is not idle. Even if the render is done, the node is not ready until its
+    # completion record has been handled.
     ex.is_idle.return_value = False
-
-    # 1a: but finished => call _frame_finished()
-    ex.status = FINISHED
-    assert job1._executor_is_ready(ex)
-    ffin.assert_called_with(ex)
-    ffail.assert_not_called()
-
-    # 1b: but failed => call _frame_failed()
-    ex.status = FAILED
-    ffail.reset_mock()
-    ffin.reset_mock()
-    assert not job1._executor_is_ready(ex)
-    ffail.assert_called_with(ex)
-    ffin.assert_not_called()
-
-    # 1c: still rendering
-    ex.status = RENDERING
-    ffail.reset_mock()
-    ffin.reset_mock()
-    assert not job1._executor_is_ready(ex)
+    for status in (RENDERING, FINISHED, FAILED):
+        ex.status = status
+        assert not job1._executor_is_ready(ex)
     ffail.assert_not_called()
     ffin.assert_not_called()
 
@@ -989,136 +1676,221 @@ def test_job_executor_is_ready(ffin, ffail, job1):
     assert job1._executor_is_ready(ex)
 
 
+@mock.patch("rendercontroller.job.RenderJob._frame_failed")
+@mock.patch("rendercontroller.job.RenderJob._frame_finished")
+def test_job_frame_done(ffin, ffail, job1_mexecutors):
+    job1 = job1_mexecutors
+    ex = job1.executors["node1"]
+    rendering(ex, [5])
+    job1._frame_done(completed(ex, FINISHED))
+    ffin.assert_called_once_with(ex)
+    job1._frame_done(completed(ex, FAILED))
+    ffail.assert_called_once_with(ex)
+
+    # Stale records are ignored
+    ffin.reset_mock()
+    ffail.reset_mock()
+    record = completed(ex, FINISHED)
+    rendering(ex, [6])
+    job1._frame_done(record)
+    ex.is_idle.return_value = True
+    job1._frame_done(completed(ex, FINISHED))
+    ffin.assert_not_called()
+    ffail.assert_not_called()
+
+
+@mock.patch("rendercontroller.job.RenderJob._dispatch_finished")
 @mock.patch("rendercontroller.job.RenderJob.executors_active")
 @mock.patch("rendercontroller.job.RenderJob._render_finished")
-def test_job_mainloop_1(rfin, execs_active, job1):
-    """Tests first block of mainloop: loop exit conditions."""
-    job1._test_obj = MultiCounter()  # To count loop iterations.
+def test_job_dispatch_1(rfin, execs_active, dfin, job1):
+    """Tests end of dispatch: job done conditions."""
+    job1._test_obj = MultiCounter()  # To count nodes checked.
     job1.queue = mock.MagicMock(name="threading.LiFoQueue")
+    job1.queue.qsize.return_value = 10
     job1.queue.empty.return_value = False
 
-    # Case 1: Stop requested, executors done => break loop (NOT render finished!)
+    # Case 1: Stop requested, executors done => finished dispatching (NOT render finished!)
     job1._stop = True
     execs_active.return_value = False
-    job1._mainloop()
+    job1.dispatch()
     rfin.assert_not_called()
-    assert job1._test_obj.get("outer_count") == 1
-    assert job1._test_obj.get("inner_count") == 0
-
-    # Case 2: Stop requested, executors still running => loop until executors done
-    execs_active.return_value = MagicBool(
-        True, 1
-    )  # Loop won't exit unless _stop = True and executors_active() = False
-    job1._mainloop()
-    rfin.assert_not_called()
-    assert job1._test_obj.get("outer_count") == 2
+    dfin.assert_called_once()
     assert job1._test_obj.get("inner_count") == 4
 
+    # Case 2: Stop requested, executors still running => wait for more events
+    dfin.reset_mock()
+    execs_active.return_value = True
+    job1.dispatch()
+    rfin.assert_not_called()
+    dfin.assert_not_called()
+
     # Case 3: Stop not requested, queue empty, executors done => render finished
-    job1._stop = MagicBool(False, 1)
+    job1._stop = False
     job1.queue.empty.return_value = True
     execs_active.return_value = False
-    job1._mainloop()
+    job1.dispatch()
     rfin.assert_called_once()
-    assert job1._test_obj.get("outer_count") == 1
-    assert job1._test_obj.get("inner_count") == 0
+    dfin.assert_called_once()
 
-    # Case 4: Stop not requested, queue empty, executors still running => loop until executors done
-    job1._stop.reset()
+    # Case 4: Stop not requested, queue empty, executors still running => wait for more events
     rfin.reset_mock()
-    execs_active.return_value = MagicBool(True, 1)
-    job1._mainloop()
+    dfin.reset_mock()
+    execs_active.return_value = True
+    job1.dispatch()
     rfin.assert_not_called()
-    assert job1._test_obj.get("outer_count") == 2
-    assert job1._test_obj.get("inner_count") == 4
+    dfin.assert_not_called()
+
+    # Only nodes named by the event are checked
+    job1.dispatch({"node2"})
+    assert job1._test_obj.get("inner_count") == 1
 
 
 @mock.patch("rendercontroller.job.RenderJob._pop_skipped_node")
-def test_job_mainloop_2(pop, job1, render_nodes, testjob1):
-    """Tests second block of mainloop: all nodes in skip list"""
-    stop = MagicBool(False, 1)
-    job1._stop = stop
-    job1._test_obj = MultiCounter()
+def test_job_dispatch_2(pop, job1, render_nodes, testjob1):
+    """Tests start of dispatch: all nodes in skip list"""
+    job1._stop = True
     pop.assert_not_called()
     job1.skip_list = testjob1["render_nodes"]
     assert len(job1.skip_list) == 2
 
-    job1._mainloop()
+    job1.dispatch()
     pop.assert_called_once()
-    assert job1._test_obj.get("outer_count") == 2
 
     # Edge case: skip list longer than enabled nodes
     pop.reset_mock()
     pop.assert_not_called()
     job1.skip_list = render_nodes
     assert len(job1.skip_list) > len(job1.get_enabled_nodes())
-    stop.reset()
-    job1._mainloop()
+    job1.dispatch()
     pop.assert_called_once()
-    assert job1._test_obj.get("outer_count") == 2
+
+
+def test_job_dispatch_events(job1):
+    """Changes that may let a node take a frame are reported to the dispatcher."""
+    disp = job1.dispatcher
+    job1.executors["node1"].on_update()
+    disp.notify.assert_called_with(job1, "node1")
+    job1.enable_node("node3")
+    disp.notify.assert_called_with(job1, "node3")
+    job1.skip_list.append("node2")
+    job1._pop_skipped_node()
+    disp.notify.assert_called_with(job1, "node2")
+    job1.allocator = mock.MagicMock(name="NodeAllocator")
+    job1._release_node("node1")
+    disp.notify_node.assert_called_with("node1")
+    job1.set_weight(2.0)
+    disp.notify_all.assert_called_once()
+    # Failed frames returned to queue may go to any node
+    disp.reset_mock()
+    ex = mock.MagicMock(name="Executor")
+    ex.unfinished_frames.return_value = [5]
+    job1._return_to_queue(ex)
+    disp.notify.assert_called_once_with(job1)
 
 
 @mock.patch("rendercontroller.job.RenderJob._executor_is_ready")
 @mock.patch("rendercontroller.job.RenderJob.executors_active")
-def test_job_mainloop_3(execs_active, exec_ready, render_nodes, job1):
-    """Tests first unit of inner (node) loop: node has thread assigned -> check status."""
-    stop = MagicBool(False, 1)
-    job1._stop = stop
-    job1._test_obj = MultiCounter()  # To count loop iterations
+def test_job_dispatch_3(execs_active, exec_ready, render_nodes, job1):
+    """Tests node loop: check status of each node and assign frames."""
+    job1._stop = False
+    job1._test_obj = MultiCounter()  # To count nodes checked
     execs_active.return_value = False
     job1.queue = mock.MagicMock(name="threading.LiFoQueue")
+    job1.queue.qsize.return_value = 10
     job1.queue.empty.return_value = False
     for name in job1.executors:
         job1.executors[name] = mock.MagicMock(name=f"Executor.{name}")
 
     # Case 1: Executor is not ready => do nothing
     exec_ready.return_value = False
-    job1._mainloop()
+    job1.dispatch()
     # Loop counters to make sure we're really hitting both loops.
-    assert job1._test_obj.get("outer_count") == 2
     assert job1._test_obj.get("inner_count") == 4
     assert (
         job1.queue.empty.call_count == 1
-    )  # Not called in inner loop if not _executor_is_ready()
+    )  # Not called for node if not _executor_is_ready(), only at end
 
     job1.queue.get.assert_not_called()
     for ex in job1.executors.values():
         ex.render.assert_not_called()
 
     # Case 2: Executor is ready and queue is empty => do nothing
-    stop.reset()
     job1.queue.reset_mock()
-    job1.queue.empty.return_value = MagicBool(
-        False, 1
-    )  # Otherwise it will exit with _render_finished()
+    job1.queue.empty.return_value = True
+    execs_active.return_value = True  # Otherwise it will finish with _render_finished()
     exec_ready.return_value = True
 
-    job1._mainloop()
-    assert job1._test_obj.get("outer_count") == 2
+    job1.dispatch()
     assert job1._test_obj.get("inner_count") == 4
     assert (
         job1.queue.empty.call_count == 5
-    )  # Once in outer loop, then once for each node.
+    )  # Once for each node, then once at end.
     job1.queue.get.assert_not_called()
     for ex in job1.executors.values():
         ex.render.assert_not_called()
 
     # Case 3: Executor is ready and queue is not empty => assign frame
-    stop.reset()
     job1.queue.reset_mock()
     job1.queue.empty.return_value = False
     exec_ready.return_value = MagicBool(True, 1)  # Only want to try to start first node
     job1.queue.get.return_value = 5
 
-    job1._mainloop()
-    assert job1._test_obj.get("outer_count") == 2
+    job1.dispatch()
     assert job1._test_obj.get("inner_count") == 4
     assert (
         job1.queue.empty.call_count == 2
-    )  # Once in outer loop, then once for the one ready executor
+    )  # Once for the one ready executor, then once at end
     job1.queue.get.assert_called_once()
     for name, ex in job1.executors.items():
         if name == "node1":
-            ex.render.assert_called_with(5)
+            ex.render.assert_called_with(5, 5)
+        else:
+            ex.render.assert_not_called()
+
+
+@mock.patch("rendercontroller.job.RenderJob._executor_is_ready")
+@mock.patch("rendercontroller.job.RenderJob.executors_active")
+def test_job_dispatch_allocator(execs_active, exec_ready, job1):
+    """Frames are only sent to nodes the allocator lets the job claim."""
+    job1._stop = False
+    execs_active.return_value = False
+    exec_ready.return_value = True
+    job1.queue = mock.MagicMock(name="threading.LiFoQueue")
+    job1.queue.qsize.return_value = 10
+    job1.queue.empty.return_value = False
+    job1.queue.get.return_value = 5
+    for name in job1.executors:
+        job1.executors[name] = mock.MagicMock(name=f"Executor.{name}")
+    job1.allocator = mock.MagicMock(name="NodeAllocator")
+    job1.allocator.try_claim.side_effect = lambda job, node: node == "node3"
+
+    job1.dispatch()
+    for name, ex in job1.executors.items():
+        if name == "node3":
+            ex.render.assert_called_with(5, 5)
         else:
             ex.render.assert_not_called()
+    job1.allocator.unregister.assert_not_called()
+    # Nodes are released when job is done
+    job1._stop = True
+    job1.dispatch()
+    job1.allocator.unregister.assert_called_with(job1)
+    job1.dispatcher.remove.assert_called_with(job1)
+
+
+@mock.patch("rendercontroller.job.RenderJob._executor_is_ready")
+@mock.patch("rendercontroller.job.RenderJob.executors_active")
+def test_job_dispatch_tail_listeners(execs_active, exec_ready, job1):
+    """Tail listeners are called when the last queued frame is sent to a node."""
+    job1._stop = False
+    execs_active.return_value = False
+    exec_ready.return_value = True
+    job1.queue = queue.LifoQueue()
+    job1.queue.put(5)
+    for name in job1.executors:
+        job1.executors[name] = mock.MagicMock(name=f"Executor.{name}")
+    listener = mock.MagicMock(name="listener")
+    job1.add_tail_listener(listener)
+    job1.add_tail_listener(listener)  # Duplicates are ignored
+    job1.dispatch()
+    listener.assert_called_once_with(job1)
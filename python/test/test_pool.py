@@ -0,0 +1,102 @@
+import threading
+import pytest
+
+from rendercontroller.pool import WorkerPool
+
+
+def test_pool_init():
+    with pytest.raises(ValueError):
+        WorkerPool(0)
+    pool = WorkerPool(4)
+    metrics = pool.metrics()
+    assert metrics["threads"] == 0
+    assert metrics["max_threads"] == 4
+    assert metrics["tasks_submitted"] == 0
+
+
+def test_pool_reuses_threads():
+    pool = WorkerPool(4)
+    done = threading.Event()
+    idents = []
+    for _ in range(10):
+        done.clear()
+        pool.submit(lambda: (idents.append(threading.get_ident()), done.set()))
+        assert done.wait(5)
+        # Wait for the thread to go back to idle
+        for _ in range(500):
+            if pool.metrics()["threads_busy"] == 0:
+                break
+            threading.Event().wait(0.01)
+    assert len(set(idents)) == 1
+    metrics = pool.metrics()
+    assert metrics["threads_created"] == 1
+    assert metrics["tasks_submitted"] == 10
+    pool.shutdown()
+
+
+def test_pool_bounded():
+    pool = WorkerPool(2)
+    release = threading.Event()
+    started = threading.Semaphore(0)
+    finished = threading.Semaphore(0)
+
+    def task():
+        started.release()
+        release.wait(5)
+        finished.release()
+
+    for _ in range(3):
+        pool.submit(task)
+    assert started.acquire(timeout=5)
+    assert started.acquire(timeout=5)
+    # Third task waits for a free thread
+    assert not started.acquire(timeout=0.1)
+    metrics = pool.metrics()
+    assert metrics["threads"] == 2
+    assert metrics["threads_peak"] == 2
+    assert metrics["tasks_waiting"] == 1
+    release.set()
+    assert started.acquire(timeout=5)
+    for _ in range(3):
+        assert finished.acquire(timeout=5)
+    assert pool.metrics()["threads_created"] == 2
+    pool.shutdown()
+
+
+def test_pool_task_exception():
+    pool = WorkerPool(1)
+    done = threading.Event()
+
+    def bad():
+        raise RuntimeError("Oops")
+
+    pool.submit(bad)
+    pool.submit(done.set)
+    assert done.wait(5)
+    assert pool.metrics()["threads_created"] == 1
+    pool.shutdown()
+
+
+def test_pool_idle_timeout():
+    pool = WorkerPool(2, idle_timeout=0.01)
+    done = threading.Event()
+    pool.submit(done.set)
+    assert done.wait(5)
+    for _ in range(500):
+        if pool.metrics()["threads"] == 0:
+            break
+        threading.Event().wait(0.01)
+    assert pool.metrics()["threads"] == 0
+    # Pool starts a new thread when needed
+    done.clear()
+    pool.submit(done.set)
+    assert done.wait(5)
+    assert pool.metrics()["threads_created"] == 2
+    pool.shutdown()
+
+
+def test_pool_shutdown():
+    pool = WorkerPool(2)
+    pool.shutdown()
+    with pytest.raises(RuntimeError):
+        pool.submit(lambda: None)
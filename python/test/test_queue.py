@@ -2,14 +2,15 @@ import pytest
 from unittest import mock
 
 from rendercontroller.controller import RenderQueue
-from rendercontroller.job import WAITING, FINISHED, RENDERING, STOPPED, FAILED
+from rendercontroller.constants import WAITING, FINISHED, RENDERING, STOPPED, FAILED
 
 
-def job_factory(id, status):
+def job_factory(id, status, priority=0):
     """Creates mock RenderJobs with configured properties."""
     m = mock.MagicMock(name="RenderJob")
     m.id = id
     m.status = status
+    m.priority = priority
     return m
 
 
@@ -27,22 +28,30 @@ for job_id, status in test_jobs.items():
     queue_jobs.append(job_factory(job_id, status))
 
 
+def set_status(queue, job, status):
+    """Changes status of a mock job the way RenderJob._set_status() would."""
+    old = job.status
+    job.status = status
+    queue.status_changed(job, old)
+
+
 @pytest.fixture(scope="function")
 def queue():
     q = RenderQueue()
     for i in queue_jobs:
+        # Mock jobs are shared between tests, so undo any status changes made by previous tests.
+        i.status = test_jobs[i.id]
+        i.priority = 0
         q.append(i)
     return q
 
 
 # Test the dunder/magic methods first
-@mock.patch("rendercontroller.controller.OrderedDict")
-def test_queue_init(od):
-    od.assert_not_called()
+def test_queue_init():
     q = RenderQueue()
-    od.assert_called_once()
-    assert q.jobs is od.return_value
-    assert q.index == 0
+    assert q.jobs == {}
+    assert len(q) == 0
+    assert q.keys() == []
 
 
 def test_queue_iterates(queue):
@@ -97,6 +106,18 @@ def test_queue_append(queue):
     assert queue.keys() == [*orig_keys, "job7"]
 
 
+def test_queue_extend(queue):
+    listener = mock.MagicMock(name="listener")
+    queue.change_listeners.append(listener)
+    new = [job_factory("job7", WAITING), job_factory("job8", RENDERING)]
+    # Existing jobs keep their position
+    queue.extend([*new, queue_jobs[0]])
+    assert queue.keys() == [*orig_keys, "job7", "job8"]
+    assert queue.get_position("job8") == len(orig_keys) + 1
+    assert queue.count_status(RENDERING) == 2
+    listener.assert_called_once()
+
+
 def test_queue_pop(queue):
     for i in queue_jobs:
         queue.append(i)
@@ -154,19 +175,102 @@ def test_queue_get_next_waiting(queue):
     next = queue.get_next_waiting()
     assert next == queue_jobs[0]
     # Simulate starting render
-    queue[0].status = RENDERING
+    set_status(queue, queue[0], RENDERING)
     again = queue.get_next_waiting()
     assert again == queue_jobs[5]
     # Simulate starting again
-    queue[5].status = RENDERING
+    set_status(queue, queue[5], RENDERING)
     # Should be none left
     assert queue.get_next_waiting() is None
+    # Stopped job reset to waiting
+    set_status(queue, queue[3], WAITING)
+    assert queue.get_next_waiting() is queue_jobs[3]
+
+
+def test_queue_get_next_waiting_follows_queue_order(queue):
+    assert queue.get_next_waiting() is queue_jobs[0]
+    queue.move("job6", 0)
+    assert queue.get_next_waiting() is queue_jobs[5]
+    queue.insert(job_factory("job7", WAITING), 0)
+    assert queue.get_next_waiting().id == "job7"
+    queue.pop("job7")
+    assert queue.get_next_waiting() is queue_jobs[5]
+    # Appending a waiting job does not change the head
+    queue.append(job_factory("job8", WAITING))
+    assert queue.get_next_waiting() is queue_jobs[5]
+
+
+def test_queue_get_next_waiting_priority(queue):
+    """Highest priority waiting job is next, with ties broken by queue position."""
+    job7 = job_factory("job7", WAITING, priority=5)
+    job8 = job_factory("job8", WAITING, priority=5)
+    queue.append(job7)
+    queue.append(job8)
+    assert queue.get_next_waiting() is job7
+    queue.move("job8", 0)
+    assert queue.get_next_waiting() is job8
+    set_status(queue, job8, RENDERING)
+    assert queue.get_next_waiting() is job7
+    # Priority changes take effect without reordering the queue
+    queue_jobs[5].priority = 10
+    queue.priority_changed(queue_jobs[5])
+    assert queue.get_next_waiting() is queue_jobs[5]
+    queue_jobs[5].priority = -1
+    queue.priority_changed(queue_jobs[5])
+    assert queue.get_next_waiting() is job7
+    set_status(queue, job7, RENDERING)
+    assert queue.get_next_waiting() is queue_jobs[0]
+    set_status(queue, queue_jobs[0], RENDERING)
+    assert queue.get_next_waiting() is queue_jobs[5]
+    # Removed jobs are never returned, even if their id is reused
+    queue.pop("job6")
+    assert queue.get_next_waiting() is None
+    set_status(queue, job8, WAITING)
+    assert queue.get_next_waiting() is job8
+    queue.pop("job8")
+    queue.append(job_factory("job8", FINISHED))
+    assert queue.get_next_waiting() is None
+
+
+def test_queue_waiting_heap_compaction(queue):
+    """Stale heap entries do not accumulate indefinitely."""
+    job = queue_jobs[0]
+    for i in range(1000):
+        job.priority = -i
+        queue.priority_changed(job)
+    assert len(queue._waiting_heap) < 100
+    assert queue.get_next_waiting() is queue_jobs[5]
 
 
 def test_queue_count_status(queue):
     assert queue.count_status(FINISHED) == 2
     assert queue.count_status(STOPPED) == 1
     assert queue.count_status(FAILED) == 0
+    set_status(queue, queue[2], FINISHED)
+    assert queue.count_status(FINISHED) == 3
+    assert queue.count_status(RENDERING) == 0
+    queue.pop("job2")
+    assert queue.count_status(FINISHED) == 2
+
+
+def test_queue_get_by_status(queue):
+    assert queue.get_by_status(WAITING) == [queue_jobs[0], queue_jobs[5]]
+    queue.move("job6", 0)
+    assert queue.get_by_status(WAITING) == [queue_jobs[5], queue_jobs[0]]
+    assert queue.get_by_status(FAILED) == []
+
+
+def test_queue_status_listener(queue):
+    # Queue registers itself as a listener when a job is added and unregisters it when removed.
+    job = job_factory("job7", WAITING)
+    queue.append(job)
+    job.add_status_listener.assert_called_with(queue.status_changed)
+    job.remove_status_listener.assert_not_called()
+    queue.pop("job7")
+    job.remove_status_listener.assert_called_with(queue.status_changed)
+    # Status changes of removed jobs are ignored
+    set_status(queue, job, RENDERING)
+    assert queue.count_status(RENDERING) == 1
 
 
 def test_queue_get_position(queue):
@@ -174,3 +278,56 @@ def test_queue_get_position(queue):
         queue.append(i)
     assert queue.get_position("job1") == 0
     assert queue.get_position("job4") == 3
+    with pytest.raises(KeyError):
+        queue.get_position("badkey")
+
+
+def test_queue_get_position_after_reorder(queue):
+    """Position index must stay correct after operations that shift other jobs."""
+    queue.move("job6", 0)
+    assert queue.keys() == ["job6", "job1", "job2", "job3", "job4", "job5"]
+    for n, job_id in enumerate(queue.keys()):
+        assert queue.get_position(job_id) == n
+    queue.pop("job2")
+    queue.insert(job_factory("job7", WAITING), 1)
+    queue.append(job_factory("job8", WAITING))
+    assert queue.keys() == ["job6", "job7", "job1", "job3", "job4", "job5", "job8"]
+    for n, job_id in enumerate(queue.keys()):
+        assert queue.get_position(job_id) == n
+        assert queue[n].id == job_id
+    # Popping the last job keeps the index current
+    queue.pop("job8")
+    assert queue.get_position("job5") == 5
+
+
+def test_queue_insert_existing(queue):
+    """Inserting a job that is already in queue moves it rather than duplicating it."""
+    queue.insert(queue_jobs[0], 2)
+    assert queue.keys() == ["job2", "job3", "job1", "job4", "job5", "job6"]
+    assert len(queue) == len(queue_jobs)
+
+
+def test_queue_iterate_while_modifying(queue):
+    """Iteration works on a snapshot, so modifying the queue does not affect it."""
+    seen = []
+    for job in queue:
+        seen.append(job.id)
+        if job.id == "job1":
+            queue.pop("job2")
+    assert seen == orig_keys
+    assert "job2" not in queue
+
+
+def test_queue_change_listeners(queue):
+    listener = mock.MagicMock(name="listener")
+    queue.change_listeners.append(listener)
+    queue.append(job_factory("job7", WAITING))
+    assert listener.call_count == 1
+    queue.insert(job_factory("job8", WAITING), 0)
+    assert listener.call_count == 2
+    queue.move("job8", 3)
+    assert listener.call_count == 3
+    set_status(queue, queue_jobs[0], RENDERING)
+    assert listener.call_count == 4
+    queue.pop("job8")
+    assert listener.call_count == 5
@@ -1,10 +1,20 @@
 import pytest
 from unittest import mock
+import queue
 import shlex
+import os
+import subprocess
+import time
 from rendercontroller.renderthread import (
+    CompletionRecord,
     RenderThread,
     BlenderRenderThread,
+    BlenderWorkerProcess,
+    PersistentBlenderRenderThread,
     Terragen3RenderThread,
+    background_command,
+    kill_command,
+    ssh_kill,
 )
 from rendercontroller.constants import WAITING, RENDERING, FINISHED, FAILED
 
@@ -82,7 +92,7 @@ def test_base_init(thread, thread_data):
     )
     # Check passed values
     assert rt.config == thread_data["config"]
-    # Note: job_id is only used to configure logging. There is no instance variable.
+    assert rt.job_id == thread_data["job_id"]
     assert rt.node == thread_data["node"]
     assert rt.path == thread_data["path"]
     assert rt.frame == thread_data["frame"]
@@ -95,6 +105,20 @@ def test_base_init(thread, thread_data):
     assert rt.thread == thread.return_value
 
 
+def test_base_progress_on_update(thread_data):
+    on_update = mock.MagicMock(name="on_update")
+    thread = RenderThread(**thread_data, on_update=on_update)
+    assert thread.progress == 0.0
+    on_update.assert_not_called()
+    thread.progress = 42.0
+    assert thread.progress == 42.0
+    on_update.assert_called_once_with()
+    # Works without a callback too
+    thread = RenderThread(**thread_data)
+    thread.progress = 50.0
+    assert thread.progress == 50.0
+
+
 @mock.patch("time.time")
 def test_base_elapsed_time(time, mbase):
     time.return_value = 200.0
@@ -126,6 +150,17 @@ def test_base_start(time, mbase):
     t.start.assert_called_once()
 
 
+@mock.patch("time.time")
+def test_base_start_pool(time, thread_data):
+    time.return_value = 100.0
+    pool = mock.MagicMock(name="WorkerPool")
+    rt = RenderThread(**thread_data, pool=pool)
+    assert rt.thread is None
+    rt.start()
+    assert rt.time_start == 100.0
+    pool.submit.assert_called_once_with(rt._run)
+
+
 @mock.patch("time.time")
 def test_base_is_timed_out(time, mbase):
     # Case 1: Timeout timer is not started
@@ -165,7 +200,7 @@ def test_blender_init(thread_data, mconf):
     # Linux
     bt = BlenderRenderThread(**thread_data)
     assert bt.pid is None
-    assert bt.patterns  # Just want to make sure they exist
+    assert bt.progress_pattern  # Just want to make sure it exists
     assert bt.execpath == mconf.blenderpath_linux
 
     # Mac
@@ -200,7 +235,123 @@ def test_blender_ssh_kill_thread(call, which, mblender):
     mblender.pid = 101
     which.return_value = "/test/ssh"
     mblender._ssh_kill_thread()
-    call.assert_called_with(["/test/ssh", "node1", f"kill {101}"])
+    call.assert_called_with(["/test/ssh", "node1", kill_command(101)])
+
+
+@mock.patch("subprocess.call")
+def test_blender_ssh_kill_thread_multiplexed(call, thread_data):
+    ssh = mock.MagicMock(name="SSHConnections")
+    thread = BlenderRenderThread(**thread_data, ssh=ssh)
+    thread.pid = 101
+    thread._ssh_kill_thread()
+    ssh.command.assert_called_once_with("node1", kill_command(101))
+    call.assert_called_with(ssh.command.return_value)
+
+
+def start_background(cmd):
+    """Runs `background_command(cmd)` in a local shell and returns the PID it printed."""
+    out = subprocess.run(
+        ["sh", "-c", background_command(f"{cmd} >/dev/null")], stdout=subprocess.PIPE, timeout=5
+    )
+    return int(out.stdout.split()[-1])
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # Zombies are left by the shell we started them from, but are no longer running.
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().split(") ")[1][0] != "Z"
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="Requires /proc")
+def test_kill_command():
+    # Child of the render process is killed along with it
+    pid = start_background("sh -c 'sleep 30 & sleep 30; wait'")
+    time.sleep(0.2)
+    result = subprocess.run(["sh", "-c", kill_command(pid)], timeout=10)
+    assert result.returncode == 0
+    assert not is_running(pid)
+    # Already exited
+    assert subprocess.run(["sh", "-c", kill_command(pid)], timeout=10).returncode == 0
+    # PID reused by another process
+    pid = start_background("sleep 30")
+    result = subprocess.run(["sh", "-c", kill_command(pid, match="/tmp/job1.blend")], timeout=10)
+    assert result.returncode == 0
+    assert is_running(pid)
+    result = subprocess.run(["sh", "-c", kill_command(pid, match="sleep 30")], timeout=10)
+    assert result.returncode == 0
+    assert not is_running(pid)
+    # Ignores SIGTERM
+    pid = start_background("sh -c 'trap \"\" TERM; while true; do sleep 0.1; done'")
+    time.sleep(0.2)
+    start = time.monotonic()
+    result = subprocess.run(["sh", "-c", kill_command(pid, grace=1)], timeout=10)
+    assert result.returncode == 0
+    assert 0.5 < time.monotonic() - start < 5
+    assert not is_running(pid)
+
+
+@mock.patch("subprocess.run")
+def test_ssh_kill(run):
+    ssh = mock.MagicMock(name="SSHConnections")
+    run.return_value.returncode = 0
+    assert ssh_kill("node1", 101, 5.0, ssh) is True
+    ssh.command.assert_called_once_with("node1", kill_command(101))
+    assert run.call_args[0][0] == ssh.command.return_value
+    assert run.call_args[1]["timeout"] == 5.0
+    run.return_value.returncode = 1
+    assert ssh_kill("node1", 101, 5.0, ssh) is False
+    run.side_effect = subprocess.TimeoutExpired("ssh", 5.0)
+    assert ssh_kill("node1", 101, 5.0, ssh) is False
+
+
+@mock.patch("rendercontroller.renderthread.ssh_kill")
+def test_blender_kill(ssh_kill, mblender):
+    mblender._abort = mock.MagicMock(name="_abort")
+    # Not rendering
+    assert mblender.kill(5.0) is True
+    ssh_kill.assert_not_called()
+    # Confirmed
+    mblender.status = RENDERING
+    mblender.pid = 101
+    ssh_kill.return_value = True
+    assert mblender.kill(5.0) is True
+    ssh_kill.assert_called_once_with("node1", 101, 5.0, None)
+    mblender._abort.assert_not_called()
+    # Not confirmed, so worker stops waiting for the process
+    ssh_kill.return_value = False
+    assert mblender.kill(5.0) is False
+    mblender._abort.assert_called_once()
+    # No pid yet
+    mblender.pid = None
+    ssh_kill.reset_mock()
+    assert mblender.kill(5.0) is False
+    ssh_kill.assert_not_called()
+
+
+@mock.patch("threading.Thread")
+def test_blender_timed_out(thread, mblender):
+    # Case 1: Not rendering
+    mblender.proc = mock.MagicMock(name="Popen")
+    mblender.timed_out()
+    mblender.proc.kill.assert_not_called()
+
+    # Case 2: Rendering, kills remote and local process
+    mblender.status = RENDERING
+    mblender.pid = 101
+    mblender.timed_out()
+    assert mblender.status == FAILED
+    thread.return_value.start.assert_called_once()
+    mblender.proc.kill.assert_called_once()
+
+    # Case 3: Local process already exited
+    mblender.status = RENDERING
+    mblender.proc.kill.side_effect = ProcessLookupError
+    mblender.timed_out()
+    assert mblender.status == FAILED
 
 
 @mock.patch("subprocess.Popen")
@@ -211,3 +362,268 @@ def test_blender_worker(popen, mblender):
     popen.assert_called_once()
 
 
+
+
+def test_base_status_on_update(thread_data):
+    on_update = mock.MagicMock(name="on_update")
+    thread = RenderThread(**thread_data, on_update=on_update)
+    assert thread.status == WAITING
+    thread.status = WAITING
+    on_update.assert_not_called()
+    thread.status = FAILED
+    assert thread.status == FAILED
+    on_update.assert_called_once_with()
+
+
+@pytest.mark.parametrize(
+    "outcome,expected",
+    [(FINISHED, FINISHED), (FAILED, FAILED), (RENDERING, FAILED), (RuntimeError("Oops"), FAILED)],
+)
+def test_base_run_posts_completion(thread_data, outcome, expected):
+    completions = queue.Queue()
+    thread_data["frame"] = 5
+    thread = RenderThread(**thread_data, end_frame=6, completions=completions)
+
+    def worker():
+        thread.pid = 123
+        thread.frame_saved(5)
+        if isinstance(outcome, Exception):
+            raise outcome
+        thread.status = outcome
+
+    thread.worker = worker
+    thread.time_start = 100.0
+    thread._run()
+    record = completions.get_nowait()
+    assert record == CompletionRecord(
+        job_id=thread_data["job_id"],
+        node=thread_data["node"],
+        frames=(5, 6),
+        frames_finished=(5,),
+        status=expected,
+        time_start=100.0,
+        time_stop=thread.time_stop,
+        pid=123,
+    )
+    assert thread.status == expected
+    assert thread.time_stop > 0
+    assert completions.empty()
+
+
+def test_base_frame_saved(thread_data):
+    on_update = mock.MagicMock(name="on_update")
+    thread_data["frame"] = 5
+    thread = RenderThread(**thread_data, on_update=on_update, end_frame=8)
+    thread.status = RENDERING
+    on_update.assert_called_once()
+    on_update.reset_mock()
+    assert thread.frames == (5, 6, 7, 8)
+    assert thread.current_frame == 5
+    thread.frame_saved(5)
+    assert thread.frames_finished == [5]
+    assert thread.current_frame == 6
+    assert thread.unfinished_frames() == [6, 7, 8]
+    assert thread.status == RENDERING
+    on_update.assert_called_once()
+    # Unknown frame number is assumed to be current frame
+    thread.frame_saved(None)
+    thread.frame_saved(99)
+    assert thread.frames_finished == [5, 6, 7]
+    thread.frame_saved(8)
+    assert thread.status == FINISHED
+    assert thread.unfinished_frames() == []
+    # Extra save lines are ignored
+    thread.frame_saved(8)
+    assert thread.frames_finished == [5, 6, 7, 8]
+
+    with pytest.raises(ValueError):
+        RenderThread(**thread_data, end_frame=4)
+
+
+@mock.patch("shutil.which")
+@mock.patch("subprocess.Popen")
+def test_blender_worker_cmd(popen, which, thread_data):
+    which.return_value = "ssh"
+    popen.return_value.stdout.readline.return_value = ""
+    BlenderRenderThread(**thread_data).worker()
+    cmd = popen.call_args[0][0][2]
+    assert "/tmp/job1.file -f 5 &" in cmd
+    BlenderRenderThread(**thread_data, end_frame=9).worker()
+    cmd = popen.call_args[0][0][2]
+    assert "/tmp/job1.file -s 5 -e 9 -a &" in cmd
+
+
+def test_blender_parse_line_chunk(thread_data):
+    thread = BlenderRenderThread(**thread_data, end_frame=7)
+    thread.status = RENDERING
+    thread.parse_line(b"Fra:5 Mem:12.00M | Time:00:00.10 | Rendering 1 / 64 samples\n")
+    assert thread.rendering_frame == 5
+    thread.parse_line(b"Saved: '/tmp/render/0005.png'\n")
+    assert thread.frames_finished == [5]
+    assert thread.output_path == "/tmp/render/0005.png"
+    assert thread.status == RENDERING
+    # Frames skipped by Blender (e.g. because they already exist) do not shift later frames.
+    thread.parse_line(b"Fra:7 Mem:12.00M | Time:00:00.10 | Rendering 1 / 64 samples\n")
+    thread.parse_line(b"Saved: '/tmp/render/0007.png'\n")
+    assert thread.frames_finished == [5, 7]
+    assert thread.unfinished_frames() == [6]
+    assert thread.status == RENDERING
+
+
+def test_blender_parse_saved_path():
+    assert BlenderRenderThread.parse_saved_path(b"Saved: '/tmp/my render/0005.png'\n") == "/tmp/my render/0005.png"
+    # Blender 2.7x
+    assert (
+        BlenderRenderThread.parse_saved_path(b"Saved: /tmp/render/0005.png Time: 00:01.23 (Saving: 00:00.01)\n")
+        == "/tmp/render/0005.png"
+    )
+
+
+def test_blender_parse_line(thread_data):
+    on_update = mock.MagicMock()
+    thread = BlenderRenderThread(**thread_data, end_frame=6, on_update=on_update)
+    thread.status = RENDERING
+    on_update.reset_mock()
+    thread.parse_line(b"1234\n")
+    assert thread.pid == 1234
+    thread.parse_line(b"Blender 2.93.7 (hash 5a2a7e6c1c2b built 2021-12-14 08:23:19)\n")
+    thread.parse_line(b"Fra:5 Mem:34.56M (Peak 35.12M) | Time:00:00.12 | Synchronizing object | Cube\n")
+    assert thread.rendering_frame == 5
+    assert thread.progress == 0.0
+    # Cycles
+    thread.parse_line(b"Fra:5 Mem:120.3M (Peak 130.1M) | Time:00:01.50 | Rendered 12/240 Tiles\n")
+    assert thread.progress == 5.0
+    assert on_update.call_count == 1
+    # Only whole-number changes are reported to observers
+    thread.parse_line(b"Fra:5 Mem:120.3M (Peak 130.1M) | Time:00:01.50 | Rendered 13/240 Tiles\n")
+    assert thread.progress == 13 / 240 * 100
+    assert on_update.call_count == 1
+    # Eevee
+    thread.parse_line(b"Fra:5 Mem:230.12M (Peak 231.88M) | Time:00:00.45 | Rendering 32 / 64 samples\n")
+    assert thread.progress == 50.0
+    assert on_update.call_count == 2
+    # Blank lines and invalid UTF-8 are ignored
+    thread.parse_line(b"\n")
+    thread.parse_line(b"\xff\xfe\n")
+    assert thread.status == RENDERING
+    thread.parse_line(b"Saved: '/tmp/render/0005.png'\n")
+    assert thread.frames_finished == [5]
+    # End of output
+    thread.parse_line(b"")
+    assert thread.status == FAILED
+
+
+def test_terragen_parse_line(thread_data):
+    thread = Terragen3RenderThread(**thread_data)
+    thread.status = RENDERING
+    # Frame number is echoed before PID
+    thread.parse_line(b"5\n")
+    assert thread.pid is None
+    thread.parse_line(b"4321\n")
+    assert thread.pid == 4321
+    thread.parse_line(b"Rendering pre pass... 40%\n")
+    assert thread.progress == 40.0
+    thread.parse_line(b"Rendering main pass... 12.5%\n")
+    assert thread.progress == 12.5
+    thread.parse_line(b"Rendering\n")
+    assert thread.progress == 12.5
+    thread.parse_line(b"")
+    assert thread.status == FAILED
+
+
+def test_terragen_chunk(thread_data):
+    with pytest.raises(ValueError):
+        Terragen3RenderThread(**thread_data, end_frame=6)
+    thread = Terragen3RenderThread(**thread_data)
+    thread.status = RENDERING
+    thread.parse_line(b"Finished\n")
+    assert thread.status == FINISHED
+    assert thread.frames_finished == [5]
+
+
+@mock.patch("shutil.which")
+@mock.patch("subprocess.Popen")
+def test_worker_process(popen, which, mconf):
+    which.return_value = "ssh"
+    proc = BlenderWorkerProcess(mconf, "job01", "node1", "/tmp/job1.blend")
+    assert not proc.is_alive()
+    proc.start()
+    args = popen.call_args[0][0]
+    assert args[:2] == ["ssh", "node1"]
+    cmd = shlex.split(args[2])
+    assert cmd[:4] == ["/linux/blender", "-b", "-noaudio", "/tmp/job1.blend"]
+    assert cmd[4] == "--python-expr"
+    assert "RC_READY" in cmd[5]
+    popen.return_value.poll.return_value = None
+    assert proc.is_alive()
+
+    proc.send_frames([5, 6])
+    popen.return_value.stdin.write.assert_called_with(b"5\n6\n")
+    proc.close()
+    popen.return_value.stdin.close.assert_called_once()
+
+
+@pytest.fixture(scope="function")
+def mprocess():
+    process = mock.MagicMock(name="BlenderWorkerProcess")
+    process.pid = None
+    process.is_alive.return_value = False
+    return process
+
+
+def test_persistent_blender_worker(mprocess, thread_data):
+    mprocess.readline.side_effect = [
+        b"RC_READY 1234\n",
+        b"Fra:5 Mem:12.00M | Time:00:00.10 | Rendering 32 / 64 samples\n",
+        b"Saved: '/tmp/render/0005.png'\n",  # Ignored in favor of RC_DONE
+        b"RC_DONE 5 1.500\n",
+        b"RC_DONE 6 1.400\n",
+    ]
+    thread = PersistentBlenderRenderThread(**thread_data, end_frame=6, process=mprocess)
+    thread.worker()
+    mprocess.start.assert_called_once()
+    mprocess.send_frames.assert_called_with((5, 6))
+    assert thread.status == FINISHED
+    assert thread.frames_finished == [5, 6]
+    assert thread.pid == 1234
+    assert mprocess.pid == 1234
+    assert thread.progress == 50.0
+    mprocess.kill.assert_not_called()
+
+    # Next thread reuses the running process
+    mprocess.reset_mock()
+    mprocess.is_alive.return_value = True
+    mprocess.readline.side_effect = [b"RC_DONE 7 1.0\n"]
+    thread_data["frame"] = 7
+    thread = PersistentBlenderRenderThread(**thread_data, process=mprocess)
+    assert thread.pid == 1234
+    thread.worker()
+    mprocess.start.assert_not_called()
+    assert thread.status == FINISHED
+
+
+def test_persistent_blender_worker_failed(mprocess, thread_data):
+    # Render error
+    mprocess.readline.side_effect = [b"RC_READY 1234\n", b"RC_ERROR 5 Out of memory\n"]
+    thread = PersistentBlenderRenderThread(**thread_data, process=mprocess)
+    thread.worker()
+    assert thread.status == FAILED
+    mprocess.kill.assert_called_once()
+
+    # Worker process exited
+    mprocess.reset_mock()
+    mprocess.readline.side_effect = [b"RC_READY 1234\n", b""]
+    thread = PersistentBlenderRenderThread(**thread_data, process=mprocess)
+    thread.worker()
+    assert thread.status == FAILED
+    mprocess.kill.assert_called_once()
+
+
+@mock.patch("threading.Thread")
+def test_persistent_blender_stop(thread, mprocess, thread_data):
+    mthread = PersistentBlenderRenderThread(**thread_data, process=mprocess)
+    mthread.stop()
+    assert mock.call(target=mprocess.kill) not in thread.call_args_list
+    mthread.status = RENDERING
+    mthread.stop()
+    thread.assert_called_with(target=mprocess.kill)
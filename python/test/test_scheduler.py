@@ -0,0 +1,283 @@
+import threading
+import time
+import pytest
+from unittest import mock
+
+from rendercontroller.scheduler import fair_shares, NodeAllocator, Dispatcher
+from rendercontroller.renderthread import CompletionRecord
+from rendercontroller.constants import FINISHED
+
+
+def test_fair_shares_equal_weights():
+    assert fair_shares(8, [("a", 1.0, 100), ("b", 1.0, 100)]) == {"a": 4, "b": 4}
+
+
+def test_fair_shares_weighted():
+    assert fair_shares(8, [("a", 3.0, 100), ("b", 1.0, 100)]) == {"a": 6, "b": 2}
+
+
+def test_fair_shares_demand_capped():
+    # b can only use 1 node, so a gets the surplus
+    assert fair_shares(8, [("a", 1.0, 100), ("b", 1.0, 1)]) == {"a": 7, "b": 1}
+    # Nobody can use all the nodes
+    assert fair_shares(8, [("a", 1.0, 2), ("b", 1.0, 3)]) == {"a": 2, "b": 3}
+    # Jobs with no demand get nothing
+    assert fair_shares(8, [("a", 1.0, 0), ("b", 1.0, 100)]) == {"a": 0, "b": 8}
+
+
+def test_fair_shares_rounding():
+    shares = fair_shares(8, [("a", 1.0, 100), ("b", 1.0, 100), ("c", 1.0, 100)])
+    assert sum(shares.values()) == 8
+    # Ties go to earlier jobs
+    assert shares == {"a": 3, "b": 3, "c": 2}
+    shares = fair_shares(10, [("a", 1.0, 100), ("b", 2.0, 100), ("c", 4.0, 100)])
+    assert sum(shares.values()) == 10
+    assert shares == {"a": 1, "b": 3, "c": 6}
+
+
+def test_fair_shares_edge_cases():
+    assert fair_shares(0, [("a", 1.0, 100)]) == {"a": 0}
+    assert fair_shares(8, []) == {}
+
+
+def job_factory(id, nodes, weight=1.0, demand=100):
+    """Mock RenderJob that can use any of `nodes`."""
+    job = mock.MagicMock(name=f"RenderJob.{id}")
+    job.id = id
+    job.weight = weight
+    job.get_enabled_nodes.return_value = tuple(nodes)
+    job.node_demand.return_value = min(demand, len(nodes))
+    job.can_use_node.side_effect = lambda node: node in nodes
+    return job
+
+
+@pytest.fixture(scope="function")
+def nodes():
+    return ["node1", "node2", "node3", "node4"]
+
+
+def test_allocator_single_job(nodes):
+    alloc = NodeAllocator()
+    job = job_factory("a", nodes)
+    # Must be registered first
+    assert not alloc.try_claim(job, "node1")
+    alloc.register(job)
+    for node in nodes:
+        assert alloc.try_claim(job, node)
+        assert alloc.owner(node) == "a"
+    # Can't claim a node twice
+    assert not alloc.try_claim(job, "node1")
+    alloc.release(job, "node1")
+    assert alloc.owner("node1") == ""
+    assert alloc.try_claim(job, "node1")
+    assert alloc.share("a") == 4
+
+
+def test_allocator_nodes_are_exclusive(nodes):
+    alloc = NodeAllocator()
+    a = job_factory("a", nodes)
+    b = job_factory("b", nodes)
+    alloc.register(a)
+    alloc.register(b)
+    assert alloc.try_claim(a, "node1")
+    assert not alloc.try_claim(b, "node1")
+    # Releasing a node owned by another job does nothing
+    alloc.release(b, "node1")
+    assert alloc.owner("node1") == "a"
+
+
+def test_allocator_fair_share(nodes):
+    alloc = NodeAllocator()
+    a = job_factory("a", nodes)
+    b = job_factory("b", nodes)
+    alloc.register(a)
+    # a is alone, so it gets all nodes
+    for node in nodes:
+        assert alloc.try_claim(a, node)
+    alloc.register(b)
+    assert alloc.share("a") == 2
+    assert alloc.share("b") == 2
+    # As a's frames finish, its nodes go to b until b has its share.
+    alloc.release(a, "node1")
+    assert not alloc.try_claim(a, "node1")
+    assert alloc.try_claim(b, "node1")
+    alloc.release(a, "node2")
+    assert not alloc.try_claim(a, "node2")
+    assert alloc.try_claim(b, "node2")
+    # Both at their share now, so a can reclaim its own nodes
+    alloc.release(a, "node3")
+    assert alloc.try_claim(a, "node3")
+
+
+def test_allocator_work_conserving(nodes):
+    """A job over its share may use a node if no other job below its share can use it."""
+    alloc = NodeAllocator()
+    a = job_factory("a", nodes)
+    b = job_factory("b", ["node1"])
+    alloc.register(a)
+    alloc.register(b)
+    assert alloc.try_claim(b, "node1")
+    assert alloc.share("b") == 1
+    for node in nodes[1:]:
+        assert alloc.try_claim(a, node)
+
+    # c is below its share, but it cannot use node4 (e.g. node is not enabled for c)
+    c = job_factory("c", ["node1", "node2"])
+    alloc.register(c)
+    alloc.release(a, "node4")
+    assert alloc.try_claim(a, "node4")
+
+
+def test_allocator_unregister_releases_nodes(nodes):
+    alloc = NodeAllocator()
+    a = job_factory("a", nodes)
+    alloc.register(a)
+    assert alloc.try_claim(a, "node1")
+    alloc.unregister(a)
+    assert alloc.owner("node1") == ""
+    assert alloc.share("a") == 0
+
+
+def test_allocator_version(nodes):
+    alloc = NodeAllocator()
+    a = job_factory("a", nodes)
+    versions = [alloc.version]
+    alloc.register(a)
+    versions.append(alloc.version)
+    alloc.invalidate()
+    versions.append(alloc.version)
+    alloc.unregister(a)
+    versions.append(alloc.version)
+    assert versions == sorted(set(versions))
+    # Claims and releases do not change the shares
+    alloc.register(a)
+    version = alloc.version
+    assert alloc.try_claim(a, "node1")
+    alloc.release(a, "node1")
+    assert alloc.version == version
+
+
+def test_allocator_caches_shares(nodes):
+    alloc = NodeAllocator()
+    a = job_factory("a", nodes, demand=2)
+    b = job_factory("b", nodes)
+    alloc.register(a)
+    alloc.register(b)
+    for _ in range(10):
+        assert alloc.try_claim(b, "node1")
+        alloc.release(b, "node1")
+    assert alloc.share("a") == 2
+    assert a.node_demand.call_count == 1
+    # Shares are recomputed only when invalidated
+    a.node_demand.return_value = 0
+    assert alloc.share("a") == 2
+    alloc.invalidate()
+    assert alloc.share("a") == 0
+    assert alloc.share("b") == len(nodes)
+    assert a.node_demand.call_count == 2
+
+
+class FakeJob(object):
+    """Records calls to dispatch()."""
+
+    def __init__(self, id):
+        self.id = id
+        self.calls = []
+        self.called = threading.Event()
+
+    def dispatch(self, nodes=None, completions=()):
+        self.calls.append((nodes, list(completions)))
+        self.called.set()
+
+
+def test_dispatcher_merges_events():
+    disp = Dispatcher(interval=60)
+    job1, job2, job3 = FakeJob("job1"), FakeJob("job2"), FakeJob("job3")
+    for job in (job1, job2, job3):
+        disp._jobs[job.id] = job  # Add without starting thread
+    disp.notify(job1, "node1")
+    disp.notify(job1, "node2")
+    disp.notify(job2, "node1")
+    disp.notify(job2)
+    disp.notify(job2, "node3")
+    disp.notify(FakeJob("other"), "node1")  # Not dispatching, ignored
+    events, _, _ = disp._next_events(deadline=time.monotonic() + 60)
+    assert events == {"job1": {"node1", "node2"}, "job2": None}
+    disp.notify_node("node4")
+    events, _, _ = disp._next_events(deadline=time.monotonic() + 60)
+    assert events == {"job1": {"node4"}, "job2": {"node4"}, "job3": {"node4"}}
+    disp.notify_all()
+    events, _, _ = disp._next_events(deadline=time.monotonic() + 60)
+    assert events == {"job1": None, "job2": None, "job3": None}
+    # Full check when deadline has passed
+    events, _, deadline = disp._next_events(deadline=0.0)
+    assert events == {"job1": None, "job2": None, "job3": None}
+    assert deadline > 0.0
+    disp.remove(job1)
+    disp.notify(job1)
+    disp.notify(job2, "node1")
+    events, _, _ = disp._next_events(deadline=time.monotonic() + 60)
+    assert events == {"job2": {"node1"}}
+
+
+def test_dispatcher_completion_records():
+    disp = Dispatcher(interval=60)
+    job1, job2 = FakeJob("job1"), FakeJob("job2")
+    for job in (job1, job2):
+        disp._jobs[job.id] = job
+    rec1 = CompletionRecord("job1", "node1", (1,), (1,), FINISHED, 1.0, 2.0, 123)
+    rec2 = CompletionRecord("job1", "node2", (2,), (2,), FINISHED, 1.0, 2.0, 124)
+    disp.completions.put(rec1)
+    disp.notify(job1, "node3")
+    disp.completions.put(rec2)
+    disp.completions.put(CompletionRecord("other", "node1", (1,), (), FINISHED, 1.0, 2.0, 125))
+    events, records, _ = disp._next_events(deadline=time.monotonic() + 60)
+    assert events == {"job1": {"node1", "node2", "node3"}}
+    assert records == {"job1": [rec1, rec2]}
+
+
+def test_dispatcher_thread():
+    disp = Dispatcher(interval=60)
+    job = FakeJob("job1")
+    disp.add(job)
+    assert job.called.wait(5)
+    assert job.calls == [(None, [])]
+    job.called.clear()
+    disp.notify(job, "node1")
+    assert job.called.wait(5)
+    assert job.calls[-1] == ({"node1"}, [])
+    job.called.clear()
+    record = CompletionRecord("job1", "node2", (1,), (1,), FINISHED, 1.0, 2.0, 123)
+    disp.completions.put(record)
+    assert job.called.wait(5)
+    assert job.calls[-1] == ({"node2"}, [record])
+    disp.shutdown()
+    assert not disp._thread.is_alive()
+
+
+def test_dispatcher_errors():
+    """An exception in one job does not stop dispatching."""
+    disp = Dispatcher(interval=60)
+    bad = FakeJob("bad")
+    bad.dispatch = mock.MagicMock(side_effect=RuntimeError("Oops"))
+    job = FakeJob("job1")
+    disp.add(bad)
+    disp.add(job)
+    assert job.called.wait(5)
+    job.called.clear()
+    disp.notify(bad)
+    disp.notify(job)
+    assert job.called.wait(5)
+    disp.shutdown()
+
+
+def test_dispatcher_interval():
+    """All jobs are checked periodically without events."""
+    disp = Dispatcher(interval=0.01)
+    job = FakeJob("job1")
+    disp.add(job)
+    assert job.called.wait(5)
+    job.called.clear()
+    assert job.called.wait(5)
+    assert job.calls[-1] == (None, [])
+    disp.shutdown()
@@ -0,0 +1,68 @@
+import pytest
+from http import HTTPStatus
+from unittest import mock
+
+from rendercontroller.server import HttpHandler, ParsedPath, parse_weight
+
+
+@pytest.fixture(scope="function")
+def handler():
+    # Bypass BaseRequestHandler.__init__, which handles a request from a socket right away.
+    h = HttpHandler.__new__(HttpHandler)
+    h.controller = mock.MagicMock(name="RenderController")
+    for name in ("send_error", "send_json", "send_all_headers", "receive_json"):
+        setattr(h, name, mock.MagicMock(name=name))
+    return h
+
+
+def request(handler, path):
+    handler._parsed_path = ParsedPath(path.strip("/").split("/"), "")
+
+
+def test_parse_weight():
+    assert parse_weight("2.5") == 2.5
+    assert parse_weight(1) == 1.0
+    for value in ("0", "-1", "nan", "inf", "-inf", float("nan"), "heavy"):
+        with pytest.raises(ValueError):
+            parse_weight(value)
+
+
+@pytest.mark.parametrize("weight", ["nan", "inf", "0"])
+def test_server_set_job_weight_invalid(handler, weight):
+    request(handler, f"/job/weight/job01/{weight}")
+    handler.set_job_weight()
+    handler.send_error.assert_called_once_with(HTTPStatus.BAD_REQUEST, "Invalid weight")
+    handler.controller.set_weight.assert_not_called()
+    request(handler, "/job/weight/job01/2.5")
+    handler.set_job_weight()
+    handler.controller.set_weight.assert_called_once_with("job01", 2.5)
+
+
+@pytest.mark.parametrize("weight", ["nan", "inf", -1.0])
+def test_server_new_job_invalid_weight(handler, weight):
+    spec = {"path": "/tmp/job.blend", "start_frame": 1, "end_frame": 10, "nodes": ["node1"]}
+    request(handler, "/job/new")
+    handler.receive_json.return_value = {**spec, "weight": weight}
+    handler.new_job()
+    assert handler.send_error.call_args[0][:2] == (HTTPStatus.BAD_REQUEST, "Invalid data")
+    handler.controller.new_job.assert_not_called()
+    handler.controller.new_job.return_value = "job01"
+    handler.receive_json.return_value = {**spec, "weight": 2}
+    handler.new_job()
+    handler.controller.new_job.assert_called_once_with("/tmp/job.blend", 1, 10, ["node1"], 2.0, 0, 1)
+    handler.send_json.assert_called_once_with({"job_id": "job01"})
+
+
+@pytest.mark.parametrize("weight", ["nan", "inf", 0])
+def test_server_new_job_batch_invalid_weight(handler, weight):
+    spec = {"path": "/tmp/job.blend", "start_frame": 1, "end_frame": 10, "nodes": ["node1"]}
+    request(handler, "/job/new_batch")
+    handler.receive_json.return_value = [{**spec, "weight": weight}, spec]
+    handler.controller.new_jobs.return_value = [{"job_id": "job02"}]
+    handler.new_job_batch()
+    # Only the valid job is created.
+    specs = handler.controller.new_jobs.call_args[0][0]
+    assert [s["weight"] for s in specs] == [1.0]
+    results = handler.send_json.call_args[0][0]
+    assert results[0]["error"].startswith("Invalid data")
+    assert results[1] == {"job_id": "job02"}
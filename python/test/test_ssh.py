@@ -0,0 +1,104 @@
+import os
+import subprocess
+import pytest
+from unittest import mock
+
+from rendercontroller.ssh import SSHConnections, ssh_command
+
+
+@pytest.fixture(scope="function")
+def conns(tmp_path):
+    return SSHConnections(persist=300, control_dir=str(tmp_path), check_interval=30.0)
+
+
+def options(conns):
+    return [
+        "-o",
+        f"ControlPath={os.path.join(conns.control_dir, '%C')}",
+        "-o",
+        "ControlMaster=auto",
+        "-o",
+        "ControlPersist=300",
+    ]
+
+
+@mock.patch("shutil.which")
+def test_ssh_command_plain(which):
+    which.return_value = "/usr/bin/ssh"
+    assert ssh_command("node1", "echo hi") == ["/usr/bin/ssh", "node1", "echo hi"]
+
+
+@mock.patch("shutil.which")
+@mock.patch("subprocess.run")
+def test_ssh_command_multiplexed(run, which, conns):
+    which.return_value = "/usr/bin/ssh"
+    run.return_value.returncode = 0
+    assert ssh_command("node1", "echo hi", conns) == [
+        "/usr/bin/ssh",
+        *options(conns),
+        "node1",
+        "echo hi",
+    ]
+    run.assert_called_once()
+    assert run.call_args[0][0] == ["/usr/bin/ssh", *options(conns), "-O", "check", "node1"]
+
+
+@mock.patch("time.monotonic")
+@mock.patch("shutil.which")
+@mock.patch("subprocess.run")
+def test_ssh_ensure_master(run, which, monotonic, conns):
+    which.return_value = "/usr/bin/ssh"
+    monotonic.return_value = 100.0
+    check = mock.MagicMock(returncode=1)
+    start = mock.MagicMock(returncode=0)
+
+    # Case 1: Master not running, is started
+    run.side_effect = [check, start]
+    assert conns.ensure_master("node1")
+    assert run.call_args[0][0] == ["/usr/bin/ssh", *options(conns), "-M", "-N", "-f", "node1"]
+
+    # Case 2: Recently checked, nothing to do
+    run.reset_mock()
+    monotonic.return_value = 120.0
+    assert conns.ensure_master("node1")
+    run.assert_not_called()
+
+    # Case 3: Check is due and master is still running
+    monotonic.return_value = 140.0
+    run.side_effect = [mock.MagicMock(returncode=0)]
+    assert conns.ensure_master("node1")
+    assert run.call_count == 1
+
+    # Case 4: Master died and cannot be restarted
+    run.reset_mock()
+    monotonic.return_value = 200.0
+    run.side_effect = [check, mock.MagicMock(returncode=255)]
+    assert not conns.ensure_master("node1")
+    # Tries again next time
+    run.side_effect = [check, start]
+    assert conns.ensure_master("node1")
+    assert run.call_count == 4
+
+    # Case 5: Master is stuck and does not answer the check, so a new one is started
+    run.reset_mock()
+    monotonic.return_value = 300.0
+    run.side_effect = [subprocess.TimeoutExpired("ssh", 5.0), start]
+    assert conns.ensure_master("node1")
+    assert run.call_args_list[0][1]["timeout"] == conns.check_timeout
+    assert run.call_args[0][0] == ["/usr/bin/ssh", *options(conns), "-M", "-N", "-f", "node1"]
+
+
+@mock.patch("shutil.which")
+@mock.patch("subprocess.run")
+def test_ssh_close_all(run, which):
+    which.return_value = "/usr/bin/ssh"
+    run.return_value.returncode = 0
+    conns = SSHConnections()
+    assert os.path.isdir(conns.control_dir)
+    conns.command("node1", "true")
+    conns.command("node2", "true")
+    run.reset_mock()
+    conns.close_all()
+    assert run.call_count == 2
+    assert run.call_args[0][0][-3:] == ["-O", "exit", "node2"]
+    assert not os.path.exists(conns.control_dir)
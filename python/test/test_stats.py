@@ -0,0 +1,80 @@
+import pytest
+
+from rendercontroller.stats import NodeStats
+
+
+def test_node_stats_alpha():
+    with pytest.raises(ValueError):
+        NodeStats(alpha=0.0)
+    with pytest.raises(ValueError):
+        NodeStats(alpha=1.5)
+    assert NodeStats(alpha=1.0).alpha == 1.0
+
+
+def test_node_stats_record():
+    stats = NodeStats(alpha=0.5)
+    assert stats.frame_time("job1", "fast") is None
+    assert stats.speed("fast") == 1.0
+    stats.record("job1", "fast", 10.0)
+    assert stats.frame_time("job1", "fast") == 10.0
+    # Nothing to compare with yet
+    assert stats.speed("fast") == 1.0
+    stats.record("job1", "slow", 30.0)
+    assert stats.speed("slow") == pytest.approx(1 / 3)
+    stats.record("job1", "fast", 10.0)
+    assert stats.speed("fast") == pytest.approx(3.0)
+    # Moving average
+    stats.record("job1", "fast", 20.0)
+    assert stats.frame_time("job1", "fast") == pytest.approx(15.0)
+    # Invalid times are ignored
+    stats.record("job1", "fast", 0.0)
+    assert stats.frame_time("job1", "fast") == pytest.approx(15.0)
+
+
+def test_node_stats_estimate():
+    stats = NodeStats(alpha=1.0)
+    stats.record("job1", "fast", 10.0)
+    stats.record("job1", "slow", 40.0)
+    stats.record("job1", "fast", 10.0)
+    assert stats.speed("fast") == 4.0
+    assert stats.speed("slow") == 0.25
+    # Node without history for this job is assumed to be average
+    assert stats.frame_time("job1", "new") == pytest.approx(25.0)
+    # Speeds carry over to other jobs
+    stats.record("job2", "slow", 80.0)
+    assert stats.frame_time("job2", "fast") == pytest.approx(5.0)
+
+
+def test_node_stats_rank():
+    stats = NodeStats(alpha=1.0)
+    nodes = ["node1", "node2", "node3", "node4"]
+    assert stats.rank(nodes) == nodes
+    stats.record("job1", "node4", 10.0)
+    stats.record("job1", "node2", 20.0)
+    stats.record("job1", "node4", 10.0)
+    assert stats.rank(nodes) == ["node4", "node1", "node3", "node2"]
+
+
+def test_node_stats_forget():
+    stats = NodeStats(alpha=1.0)
+    stats.record("job1", "node1", 10.0)
+    stats.record("job1", "node2", 20.0)
+    stats.forget("job1")
+    assert stats.frame_time("job1", "node1") is None
+    assert stats.speed("node2") == 0.5
+    stats.forget("job1")
+
+
+def test_node_stats_variance():
+    stats = NodeStats(alpha=0.5)
+    stats.record("job1", "node1", 10.0)
+    assert stats.frame_time_stats("job1", "node1") == (10.0, 0.0)
+    stats.record("job1", "node1", 20.0)
+    mean, std = stats.frame_time_stats("job1", "node1")
+    assert mean == 15.0
+    assert std == pytest.approx(25.0**0.5)
+    # Estimated for nodes without history
+    mean, std = stats.frame_time_stats("job1", "node2")
+    assert mean == 15.0
+    assert std == pytest.approx(25.0**0.5)
+    assert stats.frame_time_stats("job2", "node1") is None
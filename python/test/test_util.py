@@ -1,6 +1,6 @@
 import pytest
 
-from rendercontroller.util import Config
+from rendercontroller.util import Config, output_pattern, frame_path
 
 config_test_dict = {
     "string_val": "val1",
@@ -43,3 +43,19 @@ def test_config_get_default():
     conf = Config
     assert conf.get("bogus_val") is None
     assert conf.get("bogus_val", default="something") == "something"
+
+
+def test_output_pattern():
+    assert output_pattern("/out/shot2_0042.png", 42) == "/out/shot2_####.png"
+    assert output_pattern("/out/img_0042_L.exr", 42) == "/out/img_####_L.exr"
+    assert output_pattern("/out/1/42.png", 42) == "/out/1/##.png"
+    # Last number in file name is not the frame
+    assert output_pattern("/out/img_0042.png", 43) is None
+    assert output_pattern("/out/video.mp4", 4) is None
+    assert output_pattern("/out/img.png", 1) is None
+
+
+def test_frame_path():
+    assert frame_path("/out/shot2_####.png", 7) == "/out/shot2_0007.png"
+    assert frame_path("/out/shot2_####.png", 12345) == "/out/shot2_12345.png"
+    assert frame_path("/out/#1/##_L.exr", 3) == "/out/#1/03_L.exr"
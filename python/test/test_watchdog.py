@@ -0,0 +1,144 @@
+import queue
+import threading
+import time
+import pytest
+from unittest import mock
+
+from rendercontroller.watchdog import Watchdog
+from rendercontroller.asyncbackend import AsyncioBackend
+from rendercontroller.pool import WorkerPool
+from rendercontroller.renderthread import BlenderRenderThread
+from rendercontroller.constants import RENDERING, FINISHED, FAILED
+
+class FakeThread(object):
+    def __init__(self, timeout=0.2):
+        self.config = mock.MagicMock(node_timeout=timeout)
+        self.status = RENDERING
+        self.timeout_timer = time.time()
+        self.timed_out = mock.MagicMock(side_effect=self._timed_out)
+
+    def is_timed_out(self):
+        return time.time() - self.timeout_timer > self.config.node_timeout
+
+    def _timed_out(self):
+        self.status = FAILED
+
+
+@pytest.fixture(scope="function")
+def watchdog():
+    w = Watchdog()
+    yield w
+    w.shutdown()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_watchdog_timed_out(watchdog):
+    thread = FakeThread()
+    watchdog.watch(thread)
+    assert watchdog.active() == 1
+    assert wait_for(lambda: thread.timed_out.called)
+    thread.timed_out.assert_called_once()
+    assert watchdog.active() == 0
+
+
+def test_watchdog_output_received(watchdog):
+    thread = FakeThread(timeout=0.3)
+    watchdog.watch(thread)
+    # Output received before every deadline
+    for _ in range(5):
+        time.sleep(0.1)
+        thread.timeout_timer = time.time()
+    thread.timed_out.assert_not_called()
+    assert wait_for(lambda: thread.timed_out.called)
+
+
+def test_watchdog_unwatch(watchdog):
+    done = FakeThread()
+    watchdog.watch(done)
+    watchdog.unwatch(done)
+    finished = FakeThread()
+    watchdog.watch(finished)
+    finished.status = FINISHED
+    rendering = FakeThread(timeout=0.4)
+    watchdog.watch(rendering)
+    assert wait_for(lambda: rendering.timed_out.called)
+    done.timed_out.assert_not_called()
+    finished.timed_out.assert_not_called()
+    assert watchdog.active() == 0
+
+
+def test_watchdog_earliest_first(watchdog):
+    slow = FakeThread(timeout=60)
+    fast = FakeThread(timeout=0.2)
+    watchdog.watch(slow)
+    watchdog.watch(fast)
+    assert wait_for(lambda: fast.timed_out.called, timeout=2.0)
+    slow.timed_out.assert_not_called()
+    assert watchdog.active() == 1
+
+
+@pytest.fixture(scope="function")
+def mconf(fake_ssh, fake_blender):
+    c = mock.MagicMock(name="rendercontroller.util.Config")
+    c.node_timeout = 1
+    c.macs = []
+    c.blenderpath_linux = fake_blender
+    return c
+
+
+@pytest.mark.parametrize("use_backend", [False, True])
+def test_watchdog_hung_render(use_backend, mconf, watchdog):
+    backend = AsyncioBackend() if use_backend else None
+    thread = BlenderRenderThread(
+        config=mconf,
+        job_id="job01",
+        node="node1",
+        path="/tmp/hang.blend",
+        frame=1,
+        completions=queue.Queue(),
+        backend=backend,
+        watchdog=watchdog,
+    )
+    thread.start()
+    # Worker is blocked reading output that never comes, but is failed on time anyway.
+    record = thread.completions.get(timeout=5)
+    assert record.status == FAILED
+    assert 1.0 < record.time_stop - record.time_start < 3.0
+    assert watchdog.active() == 0
+    if backend:
+        backend.shutdown()
+
+
+def test_watchdog_busy_pool(mconf, watchdog):
+    pool = WorkerPool(1)
+    release = threading.Event()
+    pool.submit(release.wait)
+    thread = BlenderRenderThread(
+        config=mconf,
+        job_id="job01",
+        node="node1",
+        path="/tmp/hang.blend",
+        frame=1,
+        completions=queue.Queue(),
+        pool=pool,
+        watchdog=watchdog,
+    )
+    thread.start()
+    # Render is still waiting for a worker after its node_timeout has passed.
+    time.sleep(1.5)
+    assert watchdog.active() == 0
+    released = time.time()
+    release.set()
+    # Hangs once it actually starts, and is failed node_timeout after that.
+    record = thread.completions.get(timeout=5)
+    assert record.status == FAILED
+    assert 1.0 < record.time_stop - released < 3.0
+    pool.shutdown()